@@ -9,16 +9,28 @@ import strelitzia_control as sia
 #包括:
 # 数据容器功能包(各种数据容器)
 from .navigation_map import geog_to_proj, geographic_to_projected, ProjectedCoordinate, GeographicCoordinate, read_coordinate, \
-                            Route, build_route
+                            Route, build_route, \
+                            LaneChangePlanner, LaneChangePath, RouteRecorder, SpeedProfile, \
+                            build_tiles, TiledRoute, SegmentGrid
 # 控制计算功能包(计算控制反馈的模块)                
-from .data_object import msg_to_gnssdata, GnssData, \
-                         msg_to_lanedata, LaneData, \
+from .data_object import msg_to_gnssdata, GnssData, GnssHistory, \
+                         msg_to_lanedata, msg_to_lanedata_array, msg_to_lanedata_buffer, LaneData, \
                          Point2D, Point3D, \
-                         msg_to_objectdata, ObjectData, ObjectPoint3D, \
-                         Radius, calcu_radius, is_curve
+                         msg_to_objectdata, msg_to_objectdata_array, msg_to_objectdata_buffer, \
+                         ObjectData, ObjectPoint3D, \
+                         Radius, calcu_radius, is_curve, \
+                         OffloadDecoder, ObjectFilter
 # 导航地图功能包(导航地图的容器)
 from .module_object import GnssTracking,\
                            LaneTracking,\
-                           ObjectFeedback
+                           ObjectFeedback,\
+                           MapMatcher, MatchResult,\
+                           PosePredictor, FusionEstimator,\
+                           OccupancyGrid, SweptPathChecker
 # 工具功能包(小组件的模块)
-from .tools import change_system, trans_wheel_degree_format, EZdata, ShowMessage
\ No newline at end of file
+from .tools import change_system, trans_wheel_degree_format, EZdata, ShowMessage, \
+                   ControlScheduler, Stage, \
+                   SensorIngestion, SensorStream, LatestMailbox, LocalMessageSource, \
+                   CanCommandEncoder, CanFrame, ChangeDrivenOutput, \
+                   kernels, AllocationProfiler, \
+                   SharedRoute, SharedControlState
\ No newline at end of file
@@ -7,11 +7,18 @@
 # 包括:
 # GNSS数据容器
 from .gnss_data import msg_to_gnssdata, GnssData
+# GNSS数据的环形历史缓冲
+from .gnss_history import GnssHistory
 # 车道点云数据容器
-from .lane_data import msg_to_lanedata, LaneData
+from .lane_data import msg_to_lanedata, msg_to_lanedata_array, msg_to_lanedata_buffer, LaneData
 # 目标点云数据容器
-from .object_data import msg_to_objectdata, ObjectData, ObjectPoint3D
+from .object_data import msg_to_objectdata, msg_to_objectdata_array, msg_to_objectdata_buffer, \
+                         ObjectData, ObjectPoint3D
 # 2D3D坐标容器 
 from .point_data import Point2D, Point3D
 # GNSS地图的曲率半径数据容器和计算函数
-from .radius_data import Radius, calcu_radius, is_curve
\ No newline at end of file
+from .radius_data import Radius, calcu_radius, is_curve
+# 点云消息的后台解码器
+from .decoder import OffloadDecoder
+# 目标点云的预处理
+from .object_filter import ObjectFilter
\ No newline at end of file
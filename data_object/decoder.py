@@ -0,0 +1,159 @@
+# -*- coding:utf-8 -*-
+"""
+点云消息的后台解码器
+把点云消息的解码放到线程池中执行，并用双缓冲发布解码结果
+方向盘控制线程只读取已经解码完成的前台缓冲，不会等待感知数据解码
+解码期间持有GIL的时间决定了方向盘控制线程会被拖慢多少:
+msg_to_objectdata_array / msg_to_lanedata_array 逐个读取ROS消息对象的属性，整个解码过程都持有GIL，
+而且rospy在此之前已经用 Python 反序列化了整个消息；
+用 rospy.AnyMsg 订阅并交给 msg_to_objectdata_buffer / msg_to_lanedata_buffer 直接解码序列化的字节，
+跳过消息对象，解码只有几次C层的数组运算，控制线程几乎不受影响
+@author: QinYu TianHao
+
+使用方法:
+    object_decoder = OffloadDecoder(sia.msg_to_objectdata_buffer, sia.ObjectData())
+    # ROS回调中(rospy.Subscriber(topic, rospy.AnyMsg, callback))
+    object_decoder.submit(any_msg._buff)
+    # 控制循环中
+    object_data = object_decoder.latest()
+"""
+import threading
+from concurrent import futures
+
+
+class OffloadDecoder(object):
+    """
+    双缓冲后台解码器
+    后台缓冲同一时刻最多只有一个消息在解码，解码期间到达的新消息只保留最新的一条
+    解码完成后把结果换入前台缓冲，被新消息替换掉的旧消息计为丢弃
+
+    submitted: 提交的消息数\n
+    decoded: 解码完成的消息数\n
+    dropped: 未解码就被替换的消息数\n
+    errors: 解码出错的次数
+    """
+
+    def __init__(self, decoder, initial=None, executor=None, max_workers=1):
+        """
+        初始化后台解码器
+
+        参数:
+            decoder: 解码函数，如 msg_to_objectdata_buffer, msg_to_lanedata_buffer
+            initial: 前台缓冲的初始值，如 ObjectData()
+            executor: 解码使用的执行器，None 时新建一个线程池
+            max_workers: 新建线程池的线程数
+        """
+        self._decoder = decoder
+        self._front = initial
+        self._front_seq = 0
+        self._owns_executor = executor is None
+        self._executor = futures.ThreadPoolExecutor(max_workers) if executor is None else executor
+
+        self._lock = threading.Lock()
+        self._future = None
+        self._pending = None
+        self._has_pending = False
+
+        self.submitted = 0
+        self.decoded = 0
+        self.dropped = 0
+        self.errors = 0
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> submitted:{} decoded:{} dropped:{} errors:{}'.format(
+            self_class.__name__, self.submitted, self.decoded, self.dropped, self.errors)
+
+
+    def submit(self, msg):
+        """
+        提交一条消息解码，不会阻塞
+
+        参数:
+            msg: 点云ROS消息
+        返回:
+            解码的 future 对象，如果有消息正在解码则返回 None(消息暂存，等待当前解码完成后再解码)
+        """
+        with self._lock:
+            self.submitted += 1
+            if self._future is not None:
+                if self._has_pending:
+                    self.dropped += 1
+                self._pending = msg
+                self._has_pending = True
+                return None
+
+            self._future = self._executor.submit(self._decoder, msg)
+            future = self._future
+        future.add_done_callback(self._swap)
+
+        return future
+
+
+    def _swap(self, future):
+        """
+        解码完成的回调，把解码结果换入前台缓冲并开始解码暂存的消息
+        """
+        try:
+            value = future.result()
+        except Exception:
+            self.errors += 1
+        else:
+            self._front = value
+            self._front_seq += 1
+            self.decoded += 1
+
+        with self._lock:
+            if self._has_pending:
+                msg = self._pending
+                self._pending = None
+                self._has_pending = False
+                self._future = self._executor.submit(self._decoder, msg)
+                next_future = self._future
+            else:
+                self._future = None
+                next_future = None
+        if next_future is not None:
+            next_future.add_done_callback(self._swap)
+
+
+    def latest(self):
+        """
+        读取前台缓冲中最新解码完成的数据，不会阻塞
+        """
+        return self._front
+
+
+    @property
+    def seq(self):
+        """
+        前台缓冲的更新次数，可以用来判断是否有新数据
+        """
+        return self._front_seq
+
+
+    @property
+    def busy(self):
+        """
+        是否有消息正在解码
+        """
+        return self._future is not None
+
+
+    def stats(self):
+        """
+        返回解码统计
+        """
+        return {'submitted': self.submitted,
+                'decoded': self.decoded,
+                'dropped': self.dropped,
+                'errors': self.errors}
+
+
+    def shutdown(self, wait=True):
+        """
+        关闭解码器自己建立的线程池
+        """
+        if self._owns_executor:
+            self._executor.shutdown(wait)
@@ -5,9 +5,10 @@ GNSS数据的容器
 """
 from .. import navigation_map as nmap
 import math
+import time
 
 
-def msg_to_gnssdata(gnss_msg):
+def msg_to_gnssdata(gnss_msg, stamp=None):
     """
     读取gnss传回的数据
     把经纬度和罗盘角以及gnss状态码转换
@@ -15,6 +16,7 @@ def msg_to_gnssdata(gnss_msg):
     
     参数:
         gnss_msg: gnss的ROS消息
+        stamp: 定位点的时间戳(秒)，默认取接收时的单调时钟
     返回:
         gnss_data: GnssData数据对象
     """
@@ -56,8 +58,11 @@ def msg_to_gnssdata(gnss_msg):
     xy_yaw = compass_yaw_to_xy_yaw(compass_yaw)
     gnss_usable = gnss_status_validity(gnss_status_code)
 
+    if stamp is None:
+        stamp = time.monotonic()
+
     # 使用转换后的投影坐标和夹角初始化对象
-    gnss_data = GnssData(x, y, xy_yaw, gnss_usable)
+    gnss_data = GnssData(x, y, xy_yaw, gnss_usable, stamp)
 
     return gnss_data
 
@@ -70,9 +75,10 @@ class GnssData(object):
     y: 投影坐标y
     yaw: 投影坐标航向角 
     gnss_usable: 数据是否可用
+    stamp: 时间戳(秒)，没有时为 None
     """
 
-    def __init__(self, x=0, y=0, yaw=0, gnss_usable=False):
+    def __init__(self, x=0, y=0, yaw=0, gnss_usable=False, stamp=None):
         """
         初始化gnss数据类属性
 
@@ -81,11 +87,13 @@ class GnssData(object):
             y: 投usab影坐标y
             yaw: 投影坐标航向角 
             gnss_le: 数据是否可用
+            stamp: 时间戳(秒)
         """
         self._x = x
         self._y = y
         self._yaw = yaw
         self._gnss_usable = gnss_usable
+        self._stamp = stamp
 
 
     def __str__(self):
@@ -93,11 +101,12 @@ class GnssData(object):
         return '<object:{}> x:{} y:{} yaw:{} usalbe:{}'.format(self_class.__name__, self.x, self.y, self.yaw, self.usable)
 
 
-    def __call__(self, x, y, yaw, gnss_usable):
+    def __call__(self, x, y, yaw, gnss_usable, stamp=None):
         self._x = x
         self._y = y
         self._yaw = yaw
         self._gnss_usable = gnss_usable
+        self._stamp = stamp
 
 
     def copy(self):
@@ -108,7 +117,7 @@ class GnssData(object):
             new_self_object: 值相同的新对象
         """
         self_class = type(self)
-        new_self_object = self_class(self.x, self.y, self.yaw, self.usable)
+        new_self_object = self_class(self.x, self.y, self.yaw, self.usable, self.stamp)
 
         return new_self_object
 
@@ -118,6 +127,11 @@ class GnssData(object):
         return self._gnss_usable
 
 
+    @property
+    def stamp(self):
+        return self._stamp
+
+
     def get(self):
         return self.x, self.y, self.yaw
 
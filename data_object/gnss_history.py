@@ -0,0 +1,256 @@
+# -*- coding:utf-8 -*-
+"""
+GNSS数据的环形历史缓冲
+固定容量的数组存储带时间戳的定位点，O(1) 追加，长时间运行内存占用不变
+每个点同时写入数组的前后两半，最近 n 个点总是一段连续的内存，窗口查询直接返回视图不复制
+@author: QinYu TianHao
+
+使用方法:
+    gnss_history = GnssHistory(capacity=256)
+    gnss_history.append(gnss_data)
+    v = gnss_history.speed(10)
+    usable_fraction = gnss_history.usable_fraction(2.0)
+    gnss_data = gnss_history.pose_at(stamp)
+"""
+import math
+import time
+import numpy as np
+
+from .gnss_data import GnssData
+
+
+# 历史数组每一列的含义
+STAMP = 0
+X = 1
+Y = 2
+YAW = 3
+USABLE = 4
+
+
+class GnssHistory(object):
+    """
+    定位点环形历史缓冲
+    时间戳相同的定位点只记录一次，没有时间戳的同一个定位点对象重复输入时也只记录一次，
+    跟踪器、预测器和录制器可以共用一个缓冲
+
+    capacity: 最多保存的定位点数
+    """
+
+    def __init__(self, capacity=256, clock=time.monotonic):
+        """
+        初始化并预先分配历史数组
+
+        参数:
+            capacity: 最多保存的定位点数
+            clock: 定位点没有时间戳时使用的单调时钟函数
+        """
+        self.capacity = capacity
+        self._clock = clock
+        # 2 * capacity 行，第 i 个点写入第 i 行和第 i + capacity 行
+        self._data = np.zeros((2 * capacity, 5), dtype=np.float64)
+        # 下一个写入位置和已保存的点数
+        self._head = 0
+        self._count = 0
+        # 最近一次追加的定位点对象，用于识别没有时间戳的重复输入
+        self._last = None
+
+
+    def __len__(self):
+        return self._count
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> capacity:{} length:{}'.format(self_class.__name__, self.capacity, self._count)
+
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+        self._last = None
+
+
+    def append(self, gnss_data, stamp=None):
+        """
+        追加一个定位点
+
+        没有时间戳的定位点是上一次追加的同一个对象时认为是重复输入(如每个控制周期重复输入的旧定位)，不再追加；
+        否则取当前时钟作为时间戳，停车时位姿不变的新定位点照常追加
+        (同一个对象被原地改写成新的位姿时也照常追加)
+
+        参数:
+            gnss_data: gnss数据对象
+            stamp: 时间戳，默认取 gnss_data.stamp，都没有时见上
+        返回:
+            是否追加(和上一个点时间戳相同时不追加)
+        """
+        if stamp is None:
+            stamp = gnss_data.stamp
+        if self._count:
+            last = self._data[self._head + self.capacity - 1]
+            if stamp is None:
+                if (gnss_data is self._last and last[X] == gnss_data.x and last[Y] == gnss_data.y and
+                        last[YAW] == gnss_data.yaw and last[USABLE] == (1.0 if gnss_data.usable else 0.0)):
+                    return False
+            elif stamp == last[STAMP]:
+                return False
+        if stamp is None:
+            stamp = self._clock()
+
+        self._last = gnss_data
+        row = self._data[self._head]
+        row[STAMP] = stamp
+        row[X] = gnss_data.x
+        row[Y] = gnss_data.y
+        row[YAW] = gnss_data.yaw
+        row[USABLE] = 1.0 if gnss_data.usable else 0.0
+        self._data[self._head + self.capacity] = row
+
+        self._head += 1
+        if self._head == self.capacity:
+            self._head = 0
+        if self._count < self.capacity:
+            self._count += 1
+
+        return True
+
+
+    def window(self, n=None):
+        """
+        最近 n 个定位点(由旧到新)的数组视图，列为 (时间戳, x, y, 航向角, 是否可用)
+        视图在之后的追加中会被改写，需要保存时自行复制
+
+        参数:
+            n: 点数，默认为全部
+        返回:
+            n x 5 数组视图
+        """
+        if n is None or n > self._count:
+            n = self._count
+        stop = self._head + self.capacity
+        return self._data[stop - n:stop]
+
+
+    def stamps(self, n=None):
+        """
+        最近 n 个定位点的时间戳数组视图
+        """
+        return self.window(n)[:, STAMP]
+
+
+    def latest(self):
+        """
+        以gnss数据对象返回最新的定位点，没有时返回 None
+        """
+        if not self._count:
+            return None
+        stamp, x, y, yaw, usable = self._data[self._head + self.capacity - 1].tolist()
+        return GnssData(x, y, yaw, bool(usable), stamp)
+
+
+    def speed(self, n=10):
+        """
+        最近 n 个定位点的平均车速
+        每段位移投影到段起点的航向上，倒车为负
+
+        参数:
+            n: 点数
+        返回:
+            车速(米/秒)，少于两个点时返回 0
+        """
+        window = self.window(n)
+        if len(window) < 2:
+            return 0.0
+        span = window[-1, STAMP] - window[0, STAMP]
+        if span <= 0:
+            return 0.0
+        dx = np.diff(window[:, X])
+        dy = np.diff(window[:, Y])
+        yaw = window[:-1, YAW]
+        return float((dx * np.cos(yaw) + dy * np.sin(yaw)).sum() / span)
+
+
+    def yaw_rate(self, n=10):
+        """
+        最近 n 个定位点的平均横摆角速度
+
+        参数:
+            n: 点数
+        返回:
+            横摆角速度(弧度/秒)，少于两个点时返回 0
+        """
+        window = self.window(n)
+        if len(window) < 2:
+            return 0.0
+        span = window[-1, STAMP] - window[0, STAMP]
+        if span <= 0:
+            return 0.0
+        dyaw = np.diff(window[:, YAW])
+        dyaw = np.arctan2(np.sin(dyaw), np.cos(dyaw))
+        return float(dyaw.sum() / span)
+
+
+    def usable_fraction(self, seconds, now=None):
+        """
+        最近 seconds 秒内定位可用的点所占比例
+
+        参数:
+            seconds: 时间窗口(秒)
+            now: 窗口的结束时刻，默认为最新定位点的时间戳
+        返回:
+            比例(0到1)，窗口内没有点时返回 0
+        """
+        window = self.window()
+        if not len(window):
+            return 0.0
+        if now is None:
+            now = window[-1, STAMP]
+        start = int(np.searchsorted(window[:, STAMP], now - seconds, side='left'))
+        usable = window[start:, USABLE]
+        if not len(usable):
+            return 0.0
+        return float(usable.mean())
+
+
+    def pose_at(self, stamp):
+        """
+        在历史定位点之间按时间线性插值出某一时刻的位姿
+
+        参数:
+            stamp: 时刻
+        返回:
+            gnss数据对象(前后两个点都可用时才可用)，时刻超出历史范围时返回 None
+        """
+        window = self.window()
+        if not len(window):
+            return None
+        stamps = window[:, STAMP]
+        if stamp < stamps[0] or stamp > stamps[-1]:
+            return None
+
+        i = min(int(np.searchsorted(stamps, stamp, side='right')) - 1, len(window) - 2)
+        if i < 0:
+            _, x, y, yaw, usable = window[0].tolist()
+            return GnssData(x, y, yaw, bool(usable), stamp)
+
+        before, after = window[i].tolist(), window[i + 1].tolist()
+        span = after[STAMP] - before[STAMP]
+        ratio = (stamp - before[STAMP]) / span if span > 0 else 0.0
+        dyaw = math.atan2(math.sin(after[YAW] - before[YAW]), math.cos(after[YAW] - before[YAW]))
+        return GnssData(before[X] + ratio * (after[X] - before[X]),
+                        before[Y] + ratio * (after[Y] - before[Y]),
+                        before[YAW] + ratio * dyaw,
+                        bool(before[USABLE]) and bool(after[USABLE]),
+                        stamp)
+
+
+if __name__ == '__main__':
+    """
+    以 2 米/秒 沿 x 轴行驶，最后一秒定位不可用
+    """
+    gnss_history = GnssHistory(capacity=16)
+    for i in range(40):
+        gnss_history.append(GnssData(0.2 * i, 0.0, 0.0, i < 30, 0.1 * i))
+    print(gnss_history, gnss_history.window(3))
+    print(gnss_history.speed(10), gnss_history.yaw_rate(10))
+    print(gnss_history.usable_fraction(1.45), gnss_history.pose_at(3.65))
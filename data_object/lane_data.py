@@ -3,6 +3,8 @@
 车道线点云数据的容器
 @author: QinYu TianHao
 """
+import numpy as np
+
 from . import point_data as cpd
 
 
@@ -43,6 +45,76 @@ def msg_to_lanedata(lane_msg):
     return lane_data
 
 
+def msg_to_lanedata_array(lane_msg):
+    """
+    读取车道线信息(数组版本)
+    只把点云读入 numpy 数组，点对象在第一次访问时才建立，适合放到线程池中解码
+
+    参数:
+        lane_msg: 车道线点云ROS消息
+    返回:
+        lane_data: 以数组存储的车道信息对象
+    """
+    length = len(lane_msg.distance_points)
+    if length % 2 != 0:
+        raise ValueError('<func:msg_to_lanedata_array> the lane message array is not even')
+
+    # ------------------------------------------------------------------------------
+    # 此区间的代码需要根据ROS消息结构体来改变
+    lane_is_valid = lane_msg.is_valid
+    flat = np.fromiter((ivalue for idata in lane_msg.distance_points for ivalue in (idata.x, idata.y, idata.z)),
+                       dtype=np.float64, count=length * 3)
+    # ------------------------------------------------------------------------------
+    lane_array = flat.reshape(length, 3)
+
+    lane_data = LaneData.from_array(lane_array[:length // 2], lane_array[length // 2:], bool(lane_is_valid))
+
+    return lane_data
+
+
+# ------------------------------------------------------------------------------
+# 此区间的代码需要根据ROS消息结构体来改变
+# 序列化的车道线消息中 is_valid 的字节偏移和 distance_points 数组长度前缀的字节偏移
+LANE_VALID_OFFSET = 0
+LANE_POINTS_OFFSET = 1
+# distance_points 中每个点序列化后的格式(ROS1 按字段顺序紧密排列，小端)
+LANE_POINT_DTYPE = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8')])
+# ------------------------------------------------------------------------------
+
+
+def msg_to_lanedata_buffer(buff, valid_offset=None, offset=None, point_dtype=None):
+    """
+    读取车道线信息(序列化消息版本)
+    直接从序列化的消息字节(如用 rospy.AnyMsg 订阅时的 msg._buff)读取，用 np.frombuffer 映射点数组，
+    不建立ROS消息对象也不逐个访问属性，持有GIL的时间很短
+
+    参数:
+        buff: 序列化的消息字节(bytes, bytearray 或 memoryview)
+        valid_offset: is_valid 的字节偏移，默认为 LANE_VALID_OFFSET
+        offset: distance_points 数组长度前缀的字节偏移，默认为 LANE_POINTS_OFFSET
+        point_dtype: 点的结构化格式，默认为 LANE_POINT_DTYPE
+    返回:
+        lane_data: 以数组存储的车道信息对象
+    """
+    if valid_offset is None:
+        valid_offset = LANE_VALID_OFFSET
+    if offset is None:
+        offset = LANE_POINTS_OFFSET
+    if point_dtype is None:
+        point_dtype = LANE_POINT_DTYPE
+
+    length = int(np.frombuffer(buff, dtype='<u4', count=1, offset=offset)[0])
+    if length % 2 != 0:
+        raise ValueError('<func:msg_to_lanedata_buffer> the lane message array is not even')
+    lane_is_valid = bool(np.frombuffer(buff, dtype=np.uint8, count=1, offset=valid_offset)[0])
+    points = np.frombuffer(buff, dtype=point_dtype, count=length, offset=offset + 4)
+    lane_array = np.empty((length, 3))
+    for column, field in enumerate(('x', 'y', 'z')):
+        lane_array[:, column] = points[field]
+
+    return LaneData.from_array(lane_array[:length // 2], lane_array[length // 2:], lane_is_valid)
+
+
 class LaneData(object):
     """
     车道信息类
@@ -64,6 +136,26 @@ class LaneData(object):
         self._left_cloud_points = left_cloud_points
         self._right_cloud_points = right_cloud_points
         self._lane_usable = lane_usable
+        self._left_array = None
+        self._right_array = None
+
+
+    @classmethod
+    def from_array(cls, left_array, right_array, lane_usable=False):
+        """
+        由数组建立车道信息对象
+
+        参数:
+            left_array: 左车道 N x 3 的 (x, y, z) 数组
+            right_array: 右车道 N x 3 的 (x, y, z) 数组
+            lane_usable: 车道是否可用
+        返回:
+            车道信息对象
+        """
+        lane_data = cls(None, None, lane_usable)
+        lane_data._left_array = np.asarray(left_array, dtype=np.float64).reshape(-1, 3)
+        lane_data._right_array = np.asarray(right_array, dtype=np.float64).reshape(-1, 3)
+        return lane_data
 
 
     @property
@@ -73,20 +165,43 @@ class LaneData(object):
 
     @property
     def left(self):
+        if self._left_cloud_points is None:
+            self._left_cloud_points = [cpd.Point3D(x, y, z) for x, y, z in self._left_array.tolist()]
         return self._left_cloud_points
 
 
     @property
     def right(self):
+        if self._right_cloud_points is None:
+            self._right_cloud_points = [cpd.Point3D(x, y, z) for x, y, z in self._right_array.tolist()]
         return self._right_cloud_points
 
 
+    def as_array(self):
+        """
+        以数组形式返回左右车道点云
+
+        返回:
+            left_array: 左车道 N x 3 的 (x, y, z) 数组
+            right_array: 右车道 N x 3 的 (x, y, z) 数组
+        """
+        if self._left_array is None:
+            self._left_array = np.array([point.get() for point in self._left_cloud_points],
+                                        dtype=np.float64).reshape(-1, 3)
+        if self._right_array is None:
+            self._right_array = np.array([point.get() for point in self._right_cloud_points],
+                                         dtype=np.float64).reshape(-1, 3)
+        return self._left_array, self._right_array
+
+
     def copy(self):
         """
         复制自身对象
         """
         self_class = type(self)
-        new_self_object = self_class(self.left, self.right, self.usable)
+        new_self_object = self_class(self._left_cloud_points, self._right_cloud_points, self.usable)
+        new_self_object._left_array = self._left_array
+        new_self_object._right_array = self._right_array
         return new_self_object
 
 
@@ -3,6 +3,8 @@
 目标点云数据的容器
 @author: QinYu TianHao
 """
+import numpy as np
+
 from . import point_data as cpd
 
 
@@ -33,7 +35,71 @@ def msg_to_objectdata(object_msg):
     # ----------------------------------------------------------------------------------------------
 
     return ObjectData(tuple(object_cloud_points_list), object_usalbe)
-# -*- coding:utf-8 -*-
+
+
+def msg_to_objectdata_array(object_msg):
+    """
+    读取目标对象(数组版本)
+    只把点云读入 numpy 数组并用数组运算过滤，不逐点建立 ObjectPoint3D 对象
+    点对象在第一次迭代时才建立，适合放到线程池中解码
+
+    参数:
+        object_msg: 目标信息点云ROS消息
+    返回:
+        以数组存储的目标信息对象
+    """
+    # ----------------------------------------------------------------------------------------------
+    # 此区间的代码需要根据ROS消息结构体来改变
+    distance_points = object_msg.distance_points
+    count = len(distance_points)
+    flat = np.fromiter((ivalue for idata in distance_points for ivalue in (idata.flag, idata.x, idata.y, idata.z)),
+                       dtype=np.float64, count=count * 4)
+    # ----------------------------------------------------------------------------------------------
+    object_array = flat.reshape(count, 4)
+
+    # 过滤远距离目标偶发返回的0距离值
+    object_array = object_array[object_array[:, 1] > 0]
+
+    return ObjectData.from_array(object_array)
+
+
+# ----------------------------------------------------------------------------------------------
+# 此区间的代码需要根据ROS消息结构体来改变
+# 序列化的目标点云消息中 distance_points 数组长度前缀的字节偏移(数组前面字段的总字节数)
+OBJECT_POINTS_OFFSET = 0
+# distance_points 中每个点序列化后的格式(ROS1 按字段顺序紧密排列，小端)
+OBJECT_POINT_DTYPE = np.dtype([('flag', '<i4'), ('x', '<f8'), ('y', '<f8'), ('z', '<f8')])
+# ----------------------------------------------------------------------------------------------
+
+
+def msg_to_objectdata_buffer(buff, offset=None, point_dtype=None):
+    """
+    读取目标对象(序列化消息版本)
+    直接从序列化的消息字节(如用 rospy.AnyMsg 订阅时的 msg._buff)读取，用 np.frombuffer 把点数组映射为结构化数组，
+    不建立ROS消息对象也不逐个访问属性，解码只有几次C层的数组运算，持有GIL的时间很短
+
+    参数:
+        buff: 序列化的消息字节(bytes, bytearray 或 memoryview)
+        offset: distance_points 数组长度前缀的字节偏移，默认为 OBJECT_POINTS_OFFSET
+        point_dtype: 点的结构化格式，默认为 OBJECT_POINT_DTYPE
+    返回:
+        以数组存储的目标信息对象
+    """
+    if offset is None:
+        offset = OBJECT_POINTS_OFFSET
+    if point_dtype is None:
+        point_dtype = OBJECT_POINT_DTYPE
+
+    count = int(np.frombuffer(buff, dtype='<u4', count=1, offset=offset)[0])
+    points = np.frombuffer(buff, dtype=point_dtype, count=count, offset=offset + 4)
+    object_array = np.empty((count, 4))
+    for column, field in enumerate(('flag', 'x', 'y', 'z')):
+        object_array[:, column] = points[field]
+
+    # 过滤远距离目标偶发返回的0距离值
+    object_array = object_array[object_array[:, 1] > 0]
+
+    return ObjectData.from_array(object_array)
 
 
 class ObjectPoint3D(cpd.Point3D):
@@ -63,6 +129,8 @@ class ObjectPoint3D(cpd.Point3D):
 class ObjectData(object):
     """
     目标信息类
+    可以由点对象元组建立，也可以由 (kind, x, y, z) 数组建立
+    两种形式在第一次使用时互相转换并缓存
     """
 
     def __init__(self, object_cloud_points_tuple=(), object_usalbe=False):
@@ -74,25 +142,59 @@ class ObjectData(object):
         """
         self._object_cloud_points_tuple = object_cloud_points_tuple
         self._object_usalbe = object_usalbe
+        self._object_array = None
+
+
+    @classmethod
+    def from_array(cls, object_array, object_usalbe=None):
+        """
+        由数组建立目标信息对象
+
+        参数:
+            object_array: N x 4 的 (kind, x, y, z) 数组
+            object_usalbe: 目标信息是否可用，默认有点就可用
+        返回:
+            目标信息对象
+        """
+        object_array = np.asarray(object_array, dtype=np.float64).reshape(-1, 4)
+        if object_usalbe is None:
+            object_usalbe = len(object_array) > 0
+
+        object_data = cls(None, object_usalbe)
+        object_data._object_array = object_array
+        return object_data
+
+
+    @property
+    def _points(self):
+        '''
+        点对象元组，由数组建立时第一次访问才生成
+        '''
+        if self._object_cloud_points_tuple is None:
+            self._object_cloud_points_tuple = tuple(ObjectPoint3D(int(kind), x, y, z)
+                                                    for kind, x, y, z in self._object_array.tolist())
+        return self._object_cloud_points_tuple
 
 
     def __iter__(self):
         '''
         响应for等迭代操作
         '''
-        return (point for point in self._object_cloud_points_tuple)
+        return (point for point in self._points)
         
 
     def __len__(self):
         '''
         响应len返回对象元素长度
         '''
+        if self._object_cloud_points_tuple is None:
+            return len(self._object_array)
         return len(self._object_cloud_points_tuple)
 
 
     def __str__(self):
         str_out = ''
-        for object_cloud_point in self._object_cloud_points_tuple:
+        for object_cloud_point in self._points:
             str_out += "{}".format(object_cloud_point) + "\n"
         return str_out
 
@@ -105,10 +207,24 @@ class ObjectData(object):
         return self._object_usalbe
 
 
+    def as_array(self):
+        """
+        以数组形式返回点云
+
+        返回:
+            N x 4 的 (kind, x, y, z) 数组
+        """
+        if self._object_array is None:
+            self._object_array = np.array([point.get() for point in self._object_cloud_points_tuple],
+                                          dtype=np.float64).reshape(-1, 4)
+        return self._object_array
+
+
     def copy(self):
         """
         复制自身对象
         """
         self_class = type(self)
         new_self_object = self_class(self._object_cloud_points_tuple, self.usable)
+        new_self_object._object_array = self._object_array
         return new_self_object
\ No newline at end of file
@@ -109,16 +109,17 @@ def calcu_radius(gnss_data, route):
         radius: 曲率半径对象
     """
     navi_x, navi_y = route.get()
+    closed = route.closed
     near_point_index = mo.calcu_near_point_index(gnss_data.x, gnss_data.y, navi_x, navi_y)
 
-    # 曲率半径检测点提前量
-    if near_point_index + 3 < len(navi_x):
-        front_target = near_point_index + 3
+    # 曲率半径检测点提前量(闭环路径取模，开环路径到终点为止)
+    if closed:
+        front_target = (near_point_index + 3) % len(navi_x)
     else:
-        front_target = near_point_index + 3 - len(navi_x)
+        front_target = min(near_point_index + 3, len(navi_x) - 1)
     radius = Radius()
     # 计算 target_index 的曲率半径,把计算结果存入 Radius 对象中
-    radius(compute_R(front_target, gnss_data, 2, navi_x, navi_y))
+    radius(compute_R(front_target, gnss_data, 2, navi_x, navi_y, closed))
     return radius
 
 
@@ -138,7 +139,7 @@ def is_curve(radius_data, curve_radius=100):
         return False
 
 
-def compute_R(index, gnss_data, scope, navi_x, navi_y):
+def compute_R(index, gnss_data, scope, navi_x, navi_y, closed=False):
     """ 
     计算曲率半径
 
@@ -148,6 +149,7 @@ def compute_R(index, gnss_data, scope, navi_x, navi_y):
         scope    : 设定拟合多项式使用的导航点索引范围
         navi_x   : 全局导航点x坐标
         navi_y   ：全局导航点y坐标
+        closed   : 是否为闭环路径(闭环时拟合窗口在首尾处接续)
     返回:
         R: 拟合出的曲率半径
         tx: 计算曲率的导航点 x 坐标
@@ -159,20 +161,26 @@ def compute_R(index, gnss_data, scope, navi_x, navi_y):
     """
     last_index = len(navi_x)
     
-    # 找出需拟合多项式的导航点的起始索引和结束索引
-    if index - scope <= 0:
-        start_index = 0
+    if closed and 2 * scope + 1 <= last_index:
+        # 闭环路径按取模找出需要拟合多项式的导航点
+        scope_index = [(index + offset) % last_index for offset in range(-scope, scope + 1)]
+        scope_x = [navi_x[i] for i in scope_index]
+        scope_y = [navi_y[i] for i in scope_index]
     else:
-        start_index = index - scope
-
-    if (index + scope + 1) < last_index:
-        end_index = index + scope + 1
-    else:
-        end_index = -1
-
-    # 找出需要拟合多项式的导航点
-    scope_x = navi_x[start_index : end_index]
-    scope_y = navi_y[start_index : end_index]
+        # 找出需拟合多项式的导航点的起始索引和结束索引
+        if index - scope <= 0:
+            start_index = 0
+        else:
+            start_index = index - scope
+
+        if (index + scope + 1) < last_index:
+            end_index = index + scope + 1
+        else:
+            end_index = -1
+
+        # 找出需要拟合多项式的导航点
+        scope_x = navi_x[start_index : end_index]
+        scope_y = navi_y[start_index : end_index]
 
     # 选出计算曲率的导航点
     tx, ty = navi_x[index], navi_y[index]
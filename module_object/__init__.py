@@ -9,4 +9,14 @@ from .gnss_tracking import GnssTracking, calcu_near_point_index
 # 车道追踪器
 from .lane_tracking import LaneTracking
 # 目标反馈器
-from .object_feedback import ObjectFeedback
\ No newline at end of file
+from .object_feedback import ObjectFeedback
+# 基于GNSS历史的地图匹配
+from .map_matching import MapMatcher, MatchResult
+# 延迟补偿的位姿预测
+from .pose_prediction import PosePredictor, ctrv_predict
+# GNSS和车道线的融合状态估计
+from .fusion import FusionEstimator
+# 车辆坐标系的占据栅格
+from .occupancy_grid import OccupancyGrid
+# 纯追踪圆弧的扫掠区碰撞检查
+from .swept_path import SweptPathChecker
\ No newline at end of file
@@ -0,0 +1,441 @@
+# -*- coding:utf-8 -*-
+"""
+GNSS和车道线的融合状态估计
+用扩展卡尔曼滤波(EKF)融合GNSS定位和车道线给出的横向偏差、航向角差
+车道线测量相对路径当前车道的中心线，GNSS状态码不为4时仍能靠车道线和运动模型给出可用的位姿
+所有矩阵在初始化时预先分配，测量按标量逐个更新，不需要求逆矩阵，每次预测和更新都不分配新数组
+@author: QinYu TianHao
+
+使用方法:
+    fusion = FusionEstimator(route, lane_tracking)
+    fusion.update_gnss(gnss_data)
+    fusion.update_lane(lane_data)
+    gnss_data = fusion.get()
+    if gnss_data is not None and gnss_data.usable:
+        wheel_degree = gnss_tracking.pure_tracking(gnss_data, route)
+"""
+import math
+import time
+import numpy as np
+
+from ..data_object import GnssData
+from .gnss_tracking import calcu_near_point_index
+
+
+# 状态向量每一维的含义: x坐标, y坐标, 航向角, 车速, 横摆角速度
+STATE_X = 0
+STATE_Y = 1
+STATE_YAW = 2
+STATE_V = 3
+STATE_YAW_RATE = 4
+STATE_SIZE = 5
+
+
+def wrap_angle(angle):
+    """
+    把角度转换到 (-pi, pi]
+    """
+    return math.atan2(math.sin(angle), math.cos(angle))
+
+
+class FusionEstimator(object):
+    """
+    GNSS和车道线融合的扩展卡尔曼滤波器
+    运动模型为恒定车速和横摆角速度，GNSS更新 x, y, 航向角，车道线更新相对路径的横向偏差和航向角差
+
+    sigma_gnss: GNSS定位标准差(米)\n
+    sigma_degraded: GNSS状态码不为4时使用的定位标准差(米)，None 表示不用这种定位点\n
+    max_sigma: 横向位置标准差超过此值时输出的位姿标记为不可用\n
+    max_longitudinal_sigma: 纵向位置标准差超过此值时输出的位姿标记为不可用\n
+    gnss_updates: 使用的GNSS定位点数\n
+    degraded_updates: 按降级精度使用的GNSS定位点数\n
+    lane_updates: 使用的车道线测量数\n
+    rejected: 因新息过大被拒绝的测量数
+    """
+
+    def __init__(self, route=None, lane_tracking=None, sigma_gnss=0.3, sigma_gnss_yaw=0.05, sigma_degraded=3.0,
+                 sigma_lane=0.2, sigma_lane_yaw=0.05, sigma_accel=1.0, sigma_yaw_accel=0.3, max_sigma=1.0,
+                 max_longitudinal_sigma=10.0, gate=None, search_window=50, clock=time.monotonic):
+        """
+        初始化滤波器并预先分配所有矩阵
+
+        参数:
+            route: 路径对象，车道线测量相对它的当前车道(车道中心线)
+            lane_tracking: 车道追踪器(LaneTracking)，用来从车道线数据求出横向偏差和航向角差
+            sigma_gnss: GNSS定位标准差(米)
+            sigma_gnss_yaw: GNSS航向角标准差(弧度)
+            sigma_degraded: GNSS状态码不为4时的定位标准差(米)，None 表示丢弃这种定位点
+            sigma_lane: 车道线横向偏差标准差(米)
+            sigma_lane_yaw: 车道线航向角差标准差(弧度)
+            sigma_accel: 纵向加速度过程噪声(米/秒^2)
+            sigma_yaw_accel: 横摆角加速度过程噪声(弧度/秒^2)
+            max_sigma: 输出位姿可用的最大横向位置标准差(米)
+            max_longitudinal_sigma: 输出位姿可用的最大纵向位置标准差(米)，GNSS中断时只有车道线约束横向位置，纵向误差会逐渐增大
+            gate: 新息门限(标准差的倍数)，None 表示不做检验
+            search_window: 在路径上查找车道线测量对应线段时的局部搜索窗口
+            clock: 单调时钟函数，测量没有时间戳时使用
+        """
+        self._route = route
+        self._lane_tracking = lane_tracking
+        self._variance_gnss = sigma_gnss**2
+        self._variance_gnss_yaw = sigma_gnss_yaw**2
+        self._variance_degraded = None if sigma_degraded is None else sigma_degraded**2
+        self._variance_lane = sigma_lane**2
+        self._variance_lane_yaw = sigma_lane_yaw**2
+        self._variance_accel = sigma_accel**2
+        self._variance_yaw_accel = sigma_yaw_accel**2
+        self.max_sigma = max_sigma
+        self.max_longitudinal_sigma = max_longitudinal_sigma
+        self._gate_square = None if gate is None else gate**2
+        self._search_window = search_window
+        self._clock = clock
+
+        # 状态和协方差
+        self._state = np.zeros(STATE_SIZE)
+        self._P = np.zeros((STATE_SIZE, STATE_SIZE))
+        # 预测用的雅可比矩阵和临时矩阵
+        self._F = np.eye(STATE_SIZE)
+        self._F_T = self._F.T
+        self._T = np.zeros((STATE_SIZE, STATE_SIZE))
+        # 标量更新用的测量行向量、P*H^T、卡尔曼增益和状态增量
+        self._H = np.zeros(STATE_SIZE)
+        self._PH = np.zeros(STATE_SIZE)
+        self._K = np.zeros(STATE_SIZE)
+        self._K_column = self._K[:, None]
+        self._PH_row = self._PH[None, :]
+        self._dx = np.zeros(STATE_SIZE)
+
+        self._stamp = None
+        self._initialized = False
+        self._near_index = None
+        # 输出的gnss数据对象(每次 get 时原地更新)
+        self._output = GnssData()
+
+        self.gnss_updates = 0
+        self.degraded_updates = 0
+        self.lane_updates = 0
+        self.rejected = 0
+
+
+    @property
+    def initialized(self):
+        return self._initialized
+
+
+    @property
+    def state(self):
+        """
+        状态向量 (x, y, 航向角, 车速, 横摆角速度)，返回的是内部数组
+        """
+        return self._state
+
+
+    def _directional_sigma(self, angle):
+        """
+        沿 angle 方向的位置标准差
+        """
+        P = self._P
+        c = math.cos(angle)
+        s = math.sin(angle)
+        variance = c * c * P[STATE_X, STATE_X] + 2 * c * s * P[STATE_X, STATE_Y] + s * s * P[STATE_Y, STATE_Y]
+        return math.sqrt(max(variance, 0.0))
+
+
+    @property
+    def position_sigma(self):
+        """
+        位置标准差(米)，取 x 和 y 方向中较大的
+        """
+        return math.sqrt(max(self._P[STATE_X, STATE_X], self._P[STATE_Y, STATE_Y]))
+
+
+    @property
+    def lateral_sigma(self):
+        """
+        垂直于航向的位置标准差(米)
+        """
+        return self._directional_sigma(self._state[STATE_YAW] + math.pi / 2)
+
+
+    @property
+    def longitudinal_sigma(self):
+        """
+        沿航向的位置标准差(米)
+        """
+        return self._directional_sigma(self._state[STATE_YAW])
+
+
+    def reset(self, x, y, yaw, v=0.0, stamp=None, sigma=None):
+        """
+        用一个位姿重新初始化滤波器
+
+        参数:
+            x: x坐标
+            y: y坐标
+            yaw: 航向角
+            v: 车速
+            stamp: 时间戳，默认取当前时钟
+            sigma: 初始位置标准差，默认为 sigma_gnss
+        """
+        state = self._state
+        state[STATE_X] = x
+        state[STATE_Y] = y
+        state[STATE_YAW] = yaw
+        state[STATE_V] = v
+        state[STATE_YAW_RATE] = 0.0
+
+        variance = self._variance_gnss if sigma is None else sigma**2
+        P = self._P
+        P.fill(0.0)
+        P[STATE_X, STATE_X] = variance
+        P[STATE_Y, STATE_Y] = variance
+        P[STATE_YAW, STATE_YAW] = self._variance_gnss_yaw
+        P[STATE_V, STATE_V] = 4.0
+        P[STATE_YAW_RATE, STATE_YAW_RATE] = 0.1
+
+        self._stamp = self._clock() if stamp is None else stamp
+        self._near_index = None
+        self._initialized = True
+
+
+    def predict(self, stamp=None):
+        """
+        用运动模型把状态预测到 stamp 时刻
+
+        参数:
+            stamp: 时刻，默认取当前时钟
+        """
+        if stamp is None:
+            stamp = self._clock()
+        if not self._initialized:
+            return
+        dt = stamp - self._stamp
+        if dt <= 0:
+            return
+        self._stamp = stamp
+
+        state = self._state
+        yaw = state[STATE_YAW]
+        v = state[STATE_V]
+        cos_yaw = math.cos(yaw)
+        sin_yaw = math.sin(yaw)
+
+        state[STATE_X] += v * cos_yaw * dt
+        state[STATE_Y] += v * sin_yaw * dt
+        state[STATE_YAW] = wrap_angle(yaw + state[STATE_YAW_RATE] * dt)
+
+        F = self._F
+        F[STATE_X, STATE_YAW] = -v * sin_yaw * dt
+        F[STATE_X, STATE_V] = cos_yaw * dt
+        F[STATE_Y, STATE_YAW] = v * cos_yaw * dt
+        F[STATE_Y, STATE_V] = sin_yaw * dt
+        F[STATE_YAW, STATE_YAW_RATE] = dt
+
+        # P = F * P * F^T + Q
+        np.dot(F, self._P, out=self._T)
+        np.dot(self._T, self._F_T, out=self._P)
+        P = self._P
+        dt_2 = dt * dt
+        accel = self._variance_accel * dt
+        yaw_accel = self._variance_yaw_accel * dt
+        P[STATE_X, STATE_X] += accel * dt_2 / 4
+        P[STATE_Y, STATE_Y] += accel * dt_2 / 4
+        P[STATE_YAW, STATE_YAW] += yaw_accel * dt_2 / 4
+        P[STATE_V, STATE_V] += accel
+        P[STATE_YAW_RATE, STATE_YAW_RATE] += yaw_accel
+
+
+    def _update_scalar(self, residual, variance):
+        """
+        用测量行向量 self._H 做一次标量卡尔曼更新
+
+        参数:
+            residual: 新息(测量值 - 预测值)
+            variance: 测量方差
+        返回:
+            是否更新(未通过新息检验时不更新)
+        """
+        np.dot(self._P, self._H, out=self._PH)
+        s = float(np.dot(self._H, self._PH)) + variance
+        if self._gate_square is not None and residual * residual > self._gate_square * s:
+            self.rejected += 1
+            return False
+
+        np.multiply(self._PH, 1.0 / s, out=self._K)
+        np.multiply(self._K, residual, out=self._dx)
+        np.add(self._state, self._dx, out=self._state)
+        self._state[STATE_YAW] = wrap_angle(self._state[STATE_YAW])
+        # P = P - K * (H * P)，P 对称所以 H * P = (P * H^T)^T
+        np.multiply(self._K_column, self._PH_row, out=self._T)
+        np.subtract(self._P, self._T, out=self._P)
+        return True
+
+
+    def _update_axis(self, axis, residual, variance):
+        H = self._H
+        H.fill(0.0)
+        H[axis] = 1.0
+        return self._update_scalar(residual, variance)
+
+
+    def update_gnss(self, gnss_data, stamp=None):
+        """
+        输入一个GNSS定位点
+        第一个可用的定位点用来初始化滤波器，状态码不为4的定位点按降级精度使用或丢弃
+
+        参数:
+            gnss_data: gnss数据对象
+            stamp: 时间戳，默认取 gnss_data.stamp，都没有时取当前时钟
+        """
+        if stamp is None:
+            stamp = gnss_data.stamp
+        if stamp is None:
+            stamp = self._clock()
+
+        x, y, yaw = gnss_data.get()
+        if not self._initialized:
+            if gnss_data.usable:
+                self.reset(x, y, yaw, stamp=stamp)
+                self.gnss_updates += 1
+            return
+
+        self.predict(stamp)
+        if gnss_data.usable:
+            variance = self._variance_gnss
+            self.gnss_updates += 1
+        elif self._variance_degraded is not None:
+            variance = self._variance_degraded
+            self.degraded_updates += 1
+        else:
+            return
+
+        state = self._state
+        self._update_axis(STATE_X, x - state[STATE_X], variance)
+        self._update_axis(STATE_Y, y - state[STATE_Y], variance)
+        if gnss_data.usable:
+            self._update_axis(STATE_YAW, wrap_angle(yaw - state[STATE_YAW]), self._variance_gnss_yaw)
+
+
+    def _lane_segment(self):
+        """
+        求出当前估计位置在路径当前车道上所在的线段
+
+        返回:
+            线段起点坐标和线段方向角 (x, y, heading)，路径点不足时返回 None
+        """
+        route = self._route
+        navi_X, navi_Y = route.get()
+        count = len(navi_X)
+        if count < 2:
+            return None
+        x = self._state[STATE_X]
+        y = self._state[STATE_Y]
+        closed = route.closed
+
+        if self._near_index is not None and self._near_index < count:
+            index = calcu_near_point_index(x, y, navi_X, navi_Y, self._near_index, self._search_window, closed)
+        else:
+            index = calcu_near_point_index(x, y, navi_X, navi_Y)
+        self._near_index = index
+
+        # 最近点的前后两条线段中选投影在线段内的一条
+        if closed:
+            start = index
+            stop = (index + 1) % count
+        else:
+            start = min(index, count - 2)
+            stop = start + 1
+        dx = navi_X[stop] - navi_X[start]
+        dy = navi_Y[stop] - navi_Y[start]
+        if (x - navi_X[start]) * dx + (y - navi_Y[start]) * dy < 0 and (closed or start > 0):
+            stop = start
+            start = (start - 1) % count
+            dx = navi_X[stop] - navi_X[start]
+            dy = navi_Y[stop] - navi_Y[start]
+
+        return navi_X[start], navi_Y[start], math.atan2(dy, dx)
+
+
+    def update_lane_offset(self, offset, heading_error, stamp=None):
+        """
+        输入相对路径当前车道中心线的横向偏差和航向角差
+
+        参数:
+            offset: 车辆相对车道中心线的横向偏差(负右左正)
+            heading_error: 车辆航向减去车道方向的角度差
+            stamp: 时间戳，默认取当前时钟
+        返回:
+            是否更新(滤波器未初始化或没有路径时不更新)
+        """
+        if not self._initialized or self._route is None:
+            return False
+        self.predict(stamp)
+        segment = self._lane_segment()
+        if segment is None:
+            return False
+
+        start_x, start_y, heading = segment
+        state = self._state
+        normal_x = -math.sin(heading)
+        normal_y = math.cos(heading)
+        predicted_offset = normal_x * (state[STATE_X] - start_x) + normal_y * (state[STATE_Y] - start_y)
+
+        H = self._H
+        H.fill(0.0)
+        H[STATE_X] = normal_x
+        H[STATE_Y] = normal_y
+        self._update_scalar(offset - predicted_offset, self._variance_lane)
+        self._update_axis(STATE_YAW, wrap_angle(heading_error - (state[STATE_YAW] - heading)), self._variance_lane_yaw)
+
+        self.lane_updates += 1
+        return True
+
+
+    def update_lane(self, lane_data, stamp=None):
+        """
+        输入车道线数据，用车道追踪器求出横向偏差和航向角差后更新
+
+        参数:
+            lane_data: 车道线点云数据
+            stamp: 时间戳，默认取当前时钟
+        返回:
+            是否更新
+        """
+        if not lane_data.usable or self._lane_tracking is None:
+            return False
+        angle, distance_for_road_center, _ = self._lane_tracking.lane_offset(lane_data)
+        # 车道中心在车辆左侧时车辆在中心线右侧
+        return self.update_lane_offset(-distance_for_road_center, angle, stamp)
+
+
+    def get(self, stamp=None):
+        """
+        以gnss数据对象输出估计的位姿
+        给出 stamp 时先预测到该时刻，返回的对象每次调用时原地更新
+
+        参数:
+            stamp: 时刻
+        返回:
+            gnss数据对象(横向和纵向位置标准差都不超过上限时可用)，未初始化时返回 None
+        """
+        if not self._initialized:
+            return None
+        if stamp is not None:
+            self.predict(stamp)
+        state = self._state
+        self._output(float(state[STATE_X]), float(state[STATE_Y]), float(state[STATE_YAW]),
+                     self.lateral_sigma <= self.max_sigma
+                     and self.longitudinal_sigma <= self.max_longitudinal_sigma, self._stamp)
+        return self._output
+
+
+    def stats(self):
+        """
+        返回更新统计
+        """
+        return {'gnss_updates': self.gnss_updates,
+                'degraded_updates': self.degraded_updates,
+                'lane_updates': self.lane_updates,
+                'rejected': self.rejected,
+                'lateral_sigma': self.lateral_sigma,
+                'longitudinal_sigma': self.longitudinal_sigma}
@@ -4,7 +4,8 @@ GNSS点追踪器
 @author: QinYu TianHao
 """
 import math
-import numpy as np
+
+from ..tools import kernels
 
 
 def calcu_front_distance(v, k, b):
@@ -21,33 +22,47 @@ def calcu_front_distance(v, k, b):
     return  v * k + b
 
 
-def calcu_near_point_index(x, y, navi_X, navi_Y):
+def calcu_near_point_index(x, y, navi_X, navi_Y, hint=None, window=None, closed=False):
     """
     计算出导航点的下标
     根据距离车辆最近导航点的下标
+    给出上次的最近点下标 hint 和搜索窗口 window 时，只在 hint 前后 window 个点内搜索
+    闭环路径的搜索窗口在首尾处接续，跨过起点时不需要重新全局搜索
 
     参数:
         x: 当前车辆所在点的x坐标
         y: 当前车辆所在点的y坐标
         navi_X: 全局导航坐标点x点集
         navi_Y: 全局导航坐标点y点集
+        hint: 上次的最近点下标(可选)
+        window: 搜索窗口的半宽(点数)(可选)
+        closed: 是否为闭环路径
     返回:
         near_index: 最近点的下标
     """
+    length = len(navi_X)
+    if hint is not None and window is not None and closed and 2 * window + 1 < length:
+        return kernels.nearest_index_wrapped(x, y, navi_X, navi_Y, hint, window)
+    elif hint is not None and window is not None:
+        start = max(hint - window, 0)
+        end = min(hint + window + 1, length)
+        # 先切出窗口，分块存储的路径只读取窗口所在的块
+        return start + kernels.nearest_index(x, y, navi_X[start:end], navi_Y[start:end])
+    else:
+        # 分块存储的路径只在车辆附近的块中做全局搜索
+        nearest = getattr(navi_X, 'nearest', None)
+        if nearest is not None:
+            return nearest(x, y)
 
     # 搜索最临近的路点
-    diff_X = (x - ix for ix in navi_X)
-    diff_Y = (y - iy for iy in navi_Y)
-
-    distances = np.array([abs(math.sqrt(idx**2 + idy**2)) for (idx, idy) in zip(diff_X, diff_Y)])
-    near_index = distances.argmin()
-    return near_index
+    return kernels.nearest_index(x, y, navi_X, navi_Y)
 
 
-def calcu_navigation_point_index(x, y, navi_X, navi_Y, front_distance):
+def calcu_navigation_point_index(x, y, navi_X, navi_Y, front_distance, near_index=None, closed=False):
     """
     计算出导航点的下标
     根据距离车辆最近导航点和前视距离来计算导航点的下标
+    闭环路径走到最后一个点后接着从第一个点继续向前
 
     参数:
         x: 当前车辆所在点的x坐标
@@ -55,27 +70,25 @@ def calcu_navigation_point_index(x, y, navi_X, navi_Y, front_distance):
         navi_X: 全局导航坐标点x点集
         navi_Y: 全局导航坐标点y点集
         front_distance: 前视距离
+        near_index: 已经求出的最近点下标(可选)，不给出时全局搜索
+        closed: 是否为闭环路径
     返回:
         navi_index: 导航点的下标
     """
 
     # 搜索最临近的路点
-    navi_index = calcu_near_point_index(x, y, navi_X, navi_Y)
-
-    # 最近点向前,点之间距离之和
-    L = 0.0
+    if near_index is None:
+        navi_index = calcu_near_point_index(x, y, navi_X, navi_Y)
+    else:
+        navi_index = near_index
 
     # 最近点前面点之间距离和 前视距离比较 来求得导航点的下标
-    while front_distance > L and (navi_index + 1) < len(navi_X):
-        dx = navi_X[navi_index + 1] - navi_X[navi_index]
-        dy = navi_Y[navi_index + 1] - navi_Y[navi_index]
-        L += math.sqrt(dx**2 + dy**2)
-        navi_index += 1
-
-    return navi_index
+    # 闭环路径最多走一圈，防止前视距离大于闭环长度时死循环
+    return kernels.walk_forward(navi_X, navi_Y, navi_index, front_distance, closed)
 
 
-def pure_pursuit_point(x, y, yaw, v, navi_X, navi_Y, prev_index, front_distance, wheelbase):
+def pure_pursuit_point(x, y, yaw, v, navi_X, navi_Y, prev_index, front_distance, wheelbase, near_index=None,
+                       closed=False):
     """
     纯追踪算法
     通过当前车辆航向角和坐标求得把车辆行驶到导航点的前轮角度
@@ -90,19 +103,23 @@ def pure_pursuit_point(x, y, yaw, v, navi_X, navi_Y, prev_index, front_distance,
         last_navigation_point_index: 上一次计算的导航点下标
         front_distance: 前视距离
         wheelbase: 车辆轴距
+        near_index: 已经求出的最近点下标(可选)
+        closed: 是否为闭环路径
     返回:
         delta: 前轮角度
         navigation_point_index: 导航点下标
     """
 
     # 根据当前车辆坐标计算导航点的下标
-    navi_index = calcu_navigation_point_index(x, y, navi_X, navi_Y, front_distance)
-
-    if navi_index is None:
-        prev_index = navi_index
+    navi_index = calcu_navigation_point_index(x, y, navi_X, navi_Y, front_distance, near_index, closed)
 
     # 保证导航点只会按顺序向前
-    if prev_index >= navi_index:
+    # 闭环路径按取模后的前进量比较，前进量超过半圈认为是后退，跨过起点时不会被当作后退
+    if prev_index is not None and closed:
+        length = len(navi_X)
+        if 0 < (prev_index - navi_index) % length < length // 2:
+            navi_index = prev_index
+    elif prev_index is not None and prev_index >= navi_index:
         navi_index = prev_index
 
     # 保证导航点下标不会越界,如果越界就取最后一个导航点
@@ -154,10 +171,16 @@ class GnssTracking(object):
     front_distance_b: 前视距离基数\n
     wheelbase: 轴距\n
     wheel_degree_scale: 方向盘和车轮转角比例\n
-    wheel_degree_offset: 方向盘偏移校准量，确保车轮回中
+    wheel_degree_offset: 方向盘偏移校准量，确保车轮回中\n
+    search_window: 最近点局部搜索窗口的半宽(点数)\n
+    relocate_distance: 局部搜索的最近点超过此距离时改为全局搜索\n
+    pose_predictor: 位姿预测器，给出时先把定位点外推到执行时刻再追踪\n
+    history: 定位点历史缓冲，给出时用历史定位点估计车速
     """
 
-    def __init__(self, front_distance_k, front_distance_b, wheelbase,  wheel_degree_scale):
+    def __init__(self, front_distance_k, front_distance_b, wheelbase,  wheel_degree_scale,
+                 search_window=50, relocate_distance=5.0, pose_predictor=None,
+                 history=None, speed_window=10):
         """
         初始化gnss点追踪功能需要的属性
 
@@ -167,6 +190,11 @@ class GnssTracking(object):
             self._wheelbase: 轴距
             self._navigation_point_index: 追踪的导航点
             self._wheel_degree_scale: 方向盘和车轮转角比例
+            self._search_window: 最近点局部搜索窗口的半宽
+            self._relocate_distance: 重新全局搜索的距离阈值
+            self._pose_predictor: 位姿预测器(PosePredictor)，None 表示直接使用定位点
+            self._history: 定位点历史缓冲(GnssHistory)，None 表示不估计车速(按零计算)
+            self._speed_window: 估计车速使用的历史点数
         """
         
         self._front_distance_k = front_distance_k
@@ -174,9 +202,90 @@ class GnssTracking(object):
 
         self._wheelbase = wheelbase
         self._navi_index = None
+        self._delta = 0.0
         
         self._wheel_degree_scale = wheel_degree_scale
 
+        # 上次追踪时的路径、车道和最近点，用于局部搜索和切换车道时的下标映射
+        self._search_window = search_window
+        self._relocate_distance = relocate_distance
+        self._route = None
+        self._driveway = None
+        self._near_index = None
+
+        self._pose_predictor = pose_predictor
+        # 没有单独给出历史缓冲时和位姿预测器共用
+        if history is None and pose_predictor is not None:
+            history = pose_predictor.history
+        self._history = history
+        self._speed_window = speed_window
+
+
+    @property
+    def near_index(self):
+        """
+        上次追踪时的最近点下标
+        """
+        return self._near_index
+
+
+    @property
+    def navi_index(self):
+        """
+        上次追踪时的导航点下标
+        """
+        return self._navi_index
+
+
+    @property
+    def delta(self):
+        """
+        上次追踪时求出的前轮角度(弧度，向左为正)
+        """
+        return self._delta
+
+
+    def _transfer_index(self, index, route):
+        """
+        把上次路径上的下标转换为新路径上的下标
+        只处理进入和离开换道路径(带有 base_route 属性的路径)的情况，其他情况返回 None
+        """
+        prev_route = self._route
+        if index is None or prev_route is None:
+            return None
+
+        if getattr(prev_route, 'base_route', None) is route:
+            driveway, base_index = prev_route.base_point(index)
+            return route.map_index(base_index, driveway, route.driveway)
+        if getattr(route, 'base_route', None) is prev_route:
+            return route.locate(self._driveway, index)
+
+        return None
+
+
+    def _calcu_near_index(self, x, y, navi_X, navi_Y, route):
+        """
+        求出最近点下标
+        同一路径上从上次的最近点开始局部搜索，切换车道或进出换道路径后先把上次的下标映射到新路径上
+        换了无关的路径或者局部搜索结果偏离太远时才做全局搜索
+        """
+        near_hint = self._near_index
+        if route is not self._route:
+            near_hint = self._transfer_index(near_hint, route)
+            self._navi_index = self._transfer_index(self._navi_index, route)
+        elif route.driveway != self._driveway:
+            near_hint = route.map_index(near_hint, self._driveway, route.driveway)
+            self._navi_index = route.map_index(self._navi_index, self._driveway, route.driveway)
+        self._route = route
+        self._driveway = route.driveway
+
+        if near_hint is not None:
+            near_index = calcu_near_point_index(x, y, navi_X, navi_Y, near_hint, self._search_window, route.closed)
+            if math.hypot(navi_X[near_index] - x, navi_Y[near_index] - y) <= self._relocate_distance:
+                return near_index
+
+        return calcu_near_point_index(x, y, navi_X, navi_Y)
+
 
     def pure_tracking(self, gnss_data, route):
         """
@@ -188,26 +297,40 @@ class GnssTracking(object):
         返回:
             wheel_degree: 方向盘角度
         """
-        # 求出前视距离,前视距离用来辅助计算导航点
-        front_distance = calcu_front_distance(0, self._front_distance_k, self._front_distance_b)
+        # 没有历史缓冲时无法获得速度，速度设定为零
+        v = 0
+        stamp = gnss_data.stamp
+        if self._history is not None:
+            self._history.append(gnss_data)
+            # 没有时间戳的定位点使用历史缓冲记录的时刻，和位姿预测器共用历史时不会重复记录
+            stamp = self._history.stamps(1)[0]
+            v = abs(self._history.speed(self._speed_window))
+        # 有位姿预测器时把定位点外推到执行时刻
+        if self._pose_predictor is not None:
+            self._pose_predictor.update(gnss_data, stamp)
+            gnss_data = self._pose_predictor.predict()
 
-        # 缓存上次找到的导航点
-        prev_index = self._navi_index
-        # 下面的if语句是用来解决环绕问题的的临时办法，当追踪的点为最后一个点时，把追踪点换为全局导航点的第一个点
-        if prev_index >= len(route):
-            prev_index = 0
+        # 求出前视距离,前视距离用来辅助计算导航点
+        front_distance = calcu_front_distance(v, self._front_distance_k, self._front_distance_b)
 
         # 获取当前车辆所在的xy坐标和车辆航向角
         x, y, yaw = gnss_data.get()
         # 获取路径导航点集X和点集Y
         navi_X, navi_Y = route.get()
-        # 因当前无法获得速度，所以速度设定为零
-        v = 0
+
+        # 求出最近点(同时处理切换车道和切换路径)
+        self._near_index = self._calcu_near_index(x, y, navi_X, navi_Y, route)
+
+        # 缓存上次找到的导航点(闭环路径的环绕由 pure_pursuit_point 按取模处理)
+        prev_index = self._navi_index
 
         # 追踪算法求出前轮转角以及导航点
-        delta, self._navigation_point_index = pure_pursuit_point(x, y, yaw, v, navi_X, navi_Y,
-                                                prev_index, front_distance, self._wheelbase)
+        delta, self._navi_index = pure_pursuit_point(x, y, yaw, v, navi_X, navi_Y,
+                                                prev_index, front_distance, self._wheelbase, self._near_index,
+                                                route.closed)
         
+        self._delta = delta
+
         # 把前轮转角转换为方向盘转角
         wheel_degree = delta_to_wheel_degree(delta, self._wheel_degree_scale)
 
@@ -101,14 +101,16 @@ class LaneTracking(object):
         self._wheel_degree_scale = wheel_degree_scale
 
 
-    def lane_keeping(self, lane_data):
+    def lane_offset(self, lane_data):
         """
-        车道保持功能方法，通过输入的车道线点求出方向盘转角
+        求出车辆相对车道的航向角差和横向位置
 
         参数:
             lane_data: 车道线点云数据
         返回:
-            wheel_degree: 方向盘转角
+            angle_average: 车辆航向和车道方向的夹角
+            distance_for_road_center: 车道中心线相对车辆的横向距离(负右左正)
+            road_width: 道路宽度
         """
         # 求出车辆和车道线的夹角，方便把激光雷达的坐标旋转至和车道平行(这样才能方便的使用激光雷达点云中的y坐标
         # 因为旋转后的坐标系的y值就为激光雷达到两边车道的距离
@@ -127,8 +129,25 @@ class LaneTracking(object):
         y_left_average = (point_left_0.y + point_left_1.y) / 2
         y_right_average = (point_right_0.y + point_right_1.y) / 2
 
-        # 计算出车辆距离目标先距离， 道路宽度，方向盘
-        distance_for_target_line, road_width = calcu_distance_for_target_line(y_left_average, y_right_average, self._target_line)
+        # 计算出车道中心线距离和道路宽度
+        distance_for_road_center, road_width = calcu_distance_for_target_line(y_left_average, y_right_average, 0)
+
+        return angle_average, distance_for_road_center, road_width
+
+
+    def lane_keeping(self, lane_data):
+        """
+        车道保持功能方法，通过输入的车道线点求出方向盘转角
+
+        参数:
+            lane_data: 车道线点云数据
+        返回:
+            wheel_degree: 方向盘转角
+        """
+        angle_average, distance_for_road_center, road_width = self.lane_offset(lane_data)
+
+        # 计算出车辆距离目标先距离，方向盘
+        distance_for_target_line = distance_for_road_center + self._target_line
         wheel_degree = calcu_wheel_degree(self._wheel_degree_scale, angle_average, distance_for_target_line, road_width)
 
         return wheel_degree
\ No newline at end of file
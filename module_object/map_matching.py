@@ -0,0 +1,216 @@
+# -*- coding:utf-8 -*-
+"""
+基于GNSS历史的地图匹配
+用隐马尔可夫模型(HMM)在附近的候选路径线段上做增量维特比(Viterbi)解码
+输出稳定的 (车道, 下标, 横向偏差)，避免在路口和平行车道上逐点最近点匹配来回跳动
+每个定位点的计算量只和候选线段数量有关，和路径长度无关
+@author: QinYu TianHao
+
+使用方法:
+    map_matcher = MapMatcher(route)
+    match = map_matcher.update(gnss_data)
+    if match is not None:
+        lane, index, offset = match.lane, match.index, match.offset
+"""
+import collections
+import math
+import numpy as np
+
+from ..navigation_map.spatial_index import SegmentGrid
+
+
+# 匹配结果: 车道号、线段起点下标、线段上的插值参数、带符号的横向偏差(左正)
+MatchResult = collections.namedtuple('MatchResult', ('lane', 'index', 't', 'offset'))
+
+
+class MapMatcher(object):
+    """
+    增量HMM地图匹配器
+    发射概率由定位点到候选线段的距离和航向差决定
+    转移概率由两次定位之间的直线距离和沿路径距离之差决定，跨车道转移额外加上换道代价
+
+    sigma: 定位误差标准差(米)\n
+    sigma_yaw: 航向误差标准差(弧度)\n
+    beta: 转移距离差的尺度(米)\n
+    search_radius: 候选线段搜索半径(米)\n
+    max_candidates: 每条车道最多候选线段数\n
+    lane_change_cost: 跨车道转移的代价(对数概率)\n
+    window: 保留的回溯窗口长度
+    """
+
+    def __init__(self, route, sigma=2.0, sigma_yaw=0.5, beta=5.0, search_radius=10.0, max_candidates=16,
+                 lane_change_cost=2.0, window=10, cell_size=10.0):
+        """
+        初始化地图匹配器并建立线段空间索引
+
+        参数:
+            route: 路径对象
+            sigma: 定位误差标准差(米)
+            sigma_yaw: 航向误差标准差(弧度)，None 表示不使用航向
+            beta: 转移距离差的尺度(米)
+            search_radius: 候选线段搜索半径(米)
+            max_candidates: 每条车道最多候选线段数
+            lane_change_cost: 跨车道转移的代价
+            window: 保留的回溯窗口长度
+            cell_size: 空间索引的栅格边长(米)
+        """
+        self._route = route
+        self._sigma = sigma
+        self._sigma_yaw = sigma_yaw
+        self._beta = beta
+        self._search_radius = search_radius
+        self._max_candidates = max_candidates
+        self._lane_change_cost = lane_change_cost
+
+        self._grid = SegmentGrid(route.get_all(), cell_size, route.closed)
+        self._stations = tuple(projected_coordinate.stations()
+                               for projected_coordinate in route.projected_coordinate_tuple)
+        self._lane_lengths = tuple(route.lane_length(lane) for lane in route.driveway_num)
+
+        # 上一个定位点的候选线段、候选里程和对数概率
+        self._prev_segments = None
+        self._prev_stations = None
+        self._prev_scores = None
+        self._prev_point = None
+        # 回溯窗口: 每一步的 (候选线段, 插值参数, 横向偏差, 回溯指针)
+        self._history = collections.deque(maxlen=window)
+
+        self.resets = 0
+
+
+    def reset(self):
+        """
+        清除匹配状态，下一个定位点重新开始匹配
+        """
+        self._prev_segments = None
+        self._prev_stations = None
+        self._prev_scores = None
+        self._prev_point = None
+        self._history.clear()
+        self.resets += 1
+
+
+    def _candidate_stations(self, segments, t):
+        """
+        求出候选投影点在所在车道上的里程
+        """
+        lanes = self._grid.lanes[segments]
+        starts = self._grid.starts[segments]
+        stations = np.empty(len(segments))
+        for lane in np.unique(lanes).tolist():
+            mask = lanes == lane
+            stations[mask] = self._stations[lane][starts[mask]] + t[mask] * self._grid.lengths[segments[mask]]
+        return stations
+
+
+    def _route_distance(self, lanes, stations):
+        """
+        求出上一组候选到当前候选的沿路径距离矩阵(P x C)
+        不同车道时先用横向下标映射把上一组候选的下标映射到当前候选的车道上
+
+        参数:
+            lanes: 当前候选的车道号数组
+            stations: 当前候选的里程数组
+        返回:
+            distance: 沿路径距离矩阵
+            lane_change: 是否跨车道的矩阵
+        """
+        prev_lanes = self._grid.lanes[self._prev_segments]
+        prev_starts = self._grid.starts[self._prev_segments]
+        distance = np.empty((len(self._prev_segments), len(lanes)))
+        for lane in np.unique(lanes).tolist():
+            column = lanes == lane
+            mapped = self._prev_stations.copy()
+            for prev_lane in np.unique(prev_lanes).tolist():
+                if prev_lane == lane:
+                    continue
+                row = prev_lanes == prev_lane
+                mapped_index = [self._route.map_index(index, prev_lane, lane) for index in prev_starts[row].tolist()]
+                mapped[row] = self._stations[lane][mapped_index]
+            distance[:, column] = stations[column][None, :] - mapped[:, None]
+
+        if self._route.closed:
+            # 闭环路径跨过起点时按正向距离计算
+            lane_lengths = np.array(self._lane_lengths)[lanes]
+            half = lane_lengths / 2
+            distance = np.where(distance < -half, distance + lane_lengths, distance)
+            distance = np.where(distance > half, distance - lane_lengths, distance)
+
+        return distance, prev_lanes[:, None] != lanes[None, :]
+
+
+    def update(self, gnss_data):
+        """
+        输入一个定位点，更新匹配结果
+
+        参数:
+            gnss_data: gnss数据对象
+        返回:
+            MatchResult 匹配结果，附近没有路径时返回 None
+        """
+        x, y, yaw = gnss_data.get()
+        segments, t, distance, cross_track = self._grid.nearest(x, y, self._search_radius, self._max_candidates,
+                                                                    per_lane=True)
+        if len(segments) == 0:
+            self.reset()
+            return None
+
+        lanes = self._grid.lanes[segments]
+        starts = self._grid.starts[segments]
+        stations = self._candidate_stations(segments, t)
+
+        # 发射概率(对数)
+        scores = -0.5 * (distance / self._sigma)**2
+        if self._sigma_yaw is not None:
+            yaw_error = np.angle(np.exp(1j * (self._grid.headings[segments] - yaw)))
+            scores -= 0.5 * (yaw_error / self._sigma_yaw)**2
+
+        if self._prev_segments is None:
+            back = np.full(len(segments), -1)
+        else:
+            # 转移概率(对数): 沿路径距离和直线距离之差，倒退和换道额外扣分
+            step = math.hypot(x - self._prev_point[0], y - self._prev_point[1])
+            route_distance, lane_change = self._route_distance(lanes, stations)
+            transition = -np.abs(route_distance - step) / self._beta
+            transition -= np.where(route_distance < -self._sigma, np.abs(route_distance) / self._beta, 0.0)
+            transition -= np.where(lane_change, self._lane_change_cost, 0.0)
+
+            total = self._prev_scores[:, None] + transition
+            back = total.argmax(axis=0)
+            scores += total[back, np.arange(len(segments))]
+
+        # 归一化防止数值下溢
+        scores -= scores.max()
+
+        self._prev_segments = segments
+        self._prev_stations = stations
+        self._prev_scores = scores
+        self._prev_point = (x, y)
+        self._history.append((segments, t, cross_track, back))
+
+        best = int(scores.argmax())
+        return MatchResult(int(lanes[best]), int(starts[best]), float(t[best]), float(cross_track[best]))
+
+
+    def path(self):
+        """
+        沿回溯指针求出窗口内最可能的匹配序列(由旧到新)
+
+        返回:
+            MatchResult 列表
+        """
+        if not self._history:
+            return []
+
+        results = []
+        best = int(self._prev_scores.argmax())
+        for segments, t, cross_track, back in reversed(self._history):
+            segment = segments[best]
+            results.append(MatchResult(int(self._grid.lanes[segment]), int(self._grid.starts[segment]),
+                                       float(t[best]), float(cross_track[best])))
+            best = int(back[best])
+            if best < 0:
+                break
+
+        results.reverse()
+        return results
@@ -3,27 +3,42 @@
 目标反馈器
 @author: QinYu TianHao
 """
+from ..tools import kernels
+
+
 class ObjectFeedback(object):
     """
     对目标检测的障碍物反馈信息
     设置左中右三个警戒区，反馈警戒区中的障碍物情况
     
     length: 长\n
-    width: 宽
+    width: 宽\n
+    object_filter: 点云预处理器，给出时先降采样和去除离群点再判断
     """
 
-    def __init__(self, length=7, width=2):
+    def __init__(self, length=7, width=2, object_filter=None):
         """
         初始化类，设定警戒区域长和宽
 
         参数:
             length: 长
             width: 宽
+            object_filter: 点云预处理器(ObjectFilter)，None 表示直接使用原始点云
         """
         half_width = width / 2
 
         self._zone_len = length
         self._zone_wid = (-half_width, half_width)
+        self._object_filter = object_filter
+
+
+    def _preprocess(self, object_data):
+        """
+        有点云预处理器时先处理点云
+        """
+        if self._object_filter is None:
+            return object_data
+        return self._object_filter.filter(object_data)
 
 
     def _is_in_mid_zone(self, x, y):
@@ -83,12 +98,9 @@ class ObjectFeedback(object):
         返回:
             返回在区域内障碍物数量，最少是0
         """
-        alert_zone_list = []
-        for iobject in object_data:
-            if self._is_in_mid_zone(iobject.x, iobject.y):
-                alert_zone_list.append(iobject)
-
-        return len(alert_zone_list)
+        object_array = self._preprocess(object_data).as_array()
+        mid_count, = kernels.zone_counts(object_array[:, 1], object_array[:, 2], self._zone_len, (self._zone_wid,))
+        return mid_count
 
 
     def is_zone_barrier(self, object_data):
@@ -100,20 +112,15 @@ class ObjectFeedback(object):
         返回:
             返回左中右三个警戒区是否有障碍物的元组 有是True 无是False(分别用于左转预警，前方预警， 右转预警)
         """
-        left = []
-        mid = [] 
-        right = []
-
-        for iobject in object_data:
-            if self._is_in_left_zone(iobject.x, iobject.y):
-                left.append(iobject)
-            if self._is_in_mid_zone(iobject.x, iobject.y):
-                mid.append(iobject)
-            if self._is_in_right_zone(iobject.x, iobject.y):
-                right.append(iobject)
-
-        left_barrier = False if len(left) == 0 else True
-        mid_barrier = False if len(mid) == 0 else True
-        right_barrier = False if len(right) == 0 else True
+        object_array = self._preprocess(object_data).as_array()
+        # 左中右警戒区的y范围，与 _is_in_left_zone 等的默认偏移一致
+        zones = ((self._zone_wid[0] + 1.5, self._zone_wid[1] + 1.5),
+                 self._zone_wid,
+                 (self._zone_wid[0] - 1.5, self._zone_wid[1] - 1.5))
+        left, mid, right = kernels.zone_counts(object_array[:, 1], object_array[:, 2], self._zone_len, zones)
+
+        left_barrier = False if left == 0 else True
+        mid_barrier = False if mid == 0 else True
+        right_barrier = False if right == 0 else True
 
         return left_barrier, mid_barrier, right_barrier
\ No newline at end of file
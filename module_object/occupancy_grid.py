@@ -0,0 +1,354 @@
+# -*- coding:utf-8 -*-
+"""
+车辆坐标系的占据栅格
+把每一帧目标点云向量化地落入栅格，旧的证据按比例衰减，车辆移动时按GNSS位姿的变化平移旋转栅格
+警戒区、可通行和最近障碍物查询都是对栅格切片的数组归约，计算量和原始点数无关
+栅格和所有中间数组在初始化时预先分配，运行时不重新分配
+@author: QinYu TianHao
+
+使用方法:
+    occupancy_grid = OccupancyGrid(front=30, back=10, half_width=10, resolution=0.2)
+    occupancy_grid.update(object_data, gnss_data)
+    left_barrier, mid_barrier, right_barrier = occupancy_grid.is_zone_barrier()
+    distance = occupancy_grid.closest_in_path(width=2.0)
+"""
+import math
+import numpy as np
+
+
+class OccupancyGrid(object):
+    """
+    车辆坐标系(x向前, y向左, 原点为激光雷达)的占据栅格
+    每个栅格保存占据证据值，每帧被点云命中加 hit(同一帧多个点只加一次)，每帧乘以 decay 衰减
+    证据值不小于 threshold 的栅格认为被占据
+
+    resolution: 栅格边长(米)\n
+    shape: 栅格行列数(行沿x, 列沿y)\n
+    shifts: 因车辆移动平移旋转栅格的次数
+    """
+
+    def __init__(self, front=30.0, back=10.0, half_width=10.0, resolution=0.2, hit=1.0, decay=0.7,
+                 threshold=0.9, max_value=3.0, z_range=None, shift_angle=0.02,
+                 zone_length=7, zone_width=2, zone_offset=1.5):
+        """
+        初始化并预先分配栅格
+
+        参数:
+            front: 车辆前方的范围(米)
+            back: 车辆后方的范围(米)
+            half_width: 车辆左右两侧的范围(米)
+            resolution: 栅格边长(米)
+            hit: 每帧命中增加的证据值
+            decay: 每帧证据值的衰减比例
+            threshold: 占据的证据值门限
+            max_value: 证据值上限
+            z_range: 只使用 z 在 (z_min, z_max) 内的点，None 表示不限制
+            shift_angle: 累计转动超过此角度时旋转栅格(弧度)，转动更小时只按整数个栅格平移
+            zone_length: 默认警戒区的长(和 ObjectFeedback 相同)
+            zone_width: 默认警戒区的宽
+            zone_offset: 左右警戒区相对中间警戒区的横向偏移
+        """
+        self.resolution = float(resolution)
+        self._x_min = -float(back)
+        self._y_min = -float(half_width)
+        rows = int(math.ceil((front + back) / resolution))
+        columns = int(math.ceil(2 * half_width / resolution))
+        self.shape = (rows, columns)
+
+        self._hit = hit
+        self._decay = decay
+        self._threshold = threshold
+        self._max_value = max_value
+        self._z_range = z_range
+        self._shift_angle = shift_angle
+
+        self._grid = np.zeros(self.shape)
+        self._scratch = np.zeros(self.shape)
+
+        # 栅格中心在车辆坐标系中的坐标，以及到原点的距离
+        center_x = self._x_min + (np.arange(rows) + 0.5) * resolution
+        center_y = self._y_min + (np.arange(columns) + 0.5) * resolution
+        self._center_x = np.repeat(center_x[:, None], columns, axis=1)
+        self._center_y = np.repeat(center_y[None, :], rows, axis=0)
+        self._center_distance = np.hypot(self._center_x, self._center_y)
+        self._row_x = center_x
+
+        # 平移旋转栅格时用的中间数组
+        self._buffer_x = np.zeros(self.shape)
+        self._buffer_y = np.zeros(self.shape)
+        self._buffer = np.zeros(self.shape)
+        self._index = np.zeros(self.shape, dtype=np.intp)
+        self._index_y = np.zeros(self.shape, dtype=np.intp)
+        self._valid = np.zeros(self.shape, dtype=bool)
+        self._valid_y = np.zeros(self.shape, dtype=bool)
+
+        # 栅格当前对齐的车辆位姿
+        self._anchor = None
+        self.shifts = 0
+
+        # 警戒区(栅格切片)和车辆正前方通道的列切片缓存
+        self._zones = {}
+        self._corridors = {}
+        half_zone = zone_width / 2.0
+        self.add_zone('left', 0, zone_length, -half_zone + zone_offset, half_zone + zone_offset)
+        self.add_zone('mid', 0, zone_length, -half_zone, half_zone)
+        self.add_zone('right', 0, zone_length, -half_zone - zone_offset, half_zone - zone_offset)
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> shape:{} resolution:{} occupied:{}'.format(
+            self_class.__name__, self.shape, self.resolution, int(self.occupied().sum()))
+
+
+    def _row_of(self, x):
+        return int(math.floor((x - self._x_min) / self.resolution))
+
+
+    def _column_of(self, y):
+        return int(math.floor((y - self._y_min) / self.resolution))
+
+
+    def _row_slice(self, x_min, x_max):
+        rows = self.shape[0]
+        return slice(min(max(self._row_of(x_min), 0), rows), min(max(self._row_of(x_max) + 1, 0), rows))
+
+
+    def _column_slice(self, y_min, y_max):
+        columns = self.shape[1]
+        return slice(min(max(self._column_of(y_min), 0), columns), min(max(self._column_of(y_max) + 1, 0), columns))
+
+
+    def add_zone(self, name, x_min, x_max, y_min, y_max):
+        """
+        添加(或替换)一个矩形警戒区，预先求出它在栅格中的切片
+
+        参数:
+            name: 警戒区名称
+            x_min, x_max: 警戒区x范围
+            y_min, y_max: 警戒区y范围
+        """
+        self._zones[name] = (self._row_slice(x_min, x_max), self._column_slice(y_min, y_max))
+
+
+    def clear(self):
+        """
+        清除所有证据
+        """
+        self._grid.fill(0.0)
+        self._anchor = None
+
+
+    @property
+    def grid(self):
+        """
+        证据值数组(内部数组，只读使用)
+        """
+        return self._grid
+
+
+    def occupied(self):
+        """
+        返回占据栅格的布尔数组
+        """
+        return self._grid >= self._threshold
+
+
+    def _shift(self, forward, left, dyaw):
+        """
+        按车辆在旧坐标系中的位移和转角平移旋转栅格
+        对每个新栅格中心求出它在旧坐标系中的位置，取旧栅格的值(最近邻)，超出范围的置零
+        """
+        cos_yaw = math.cos(dyaw)
+        sin_yaw = math.sin(dyaw)
+        rows, columns = self.shape
+        buffer_x, buffer_y, buffer = self._buffer_x, self._buffer_y, self._buffer
+
+        # 新栅格中心在旧坐标系中的坐标
+        np.multiply(self._center_x, cos_yaw, out=buffer_x)
+        np.multiply(self._center_y, sin_yaw, out=buffer)
+        np.subtract(buffer_x, buffer, out=buffer_x)
+        np.multiply(self._center_x, sin_yaw, out=buffer_y)
+        np.multiply(self._center_y, cos_yaw, out=buffer)
+        np.add(buffer_y, buffer, out=buffer_y)
+
+        # 转换为旧栅格的行列号
+        np.subtract(buffer_x, self._x_min - forward, out=buffer_x)
+        np.divide(buffer_x, self.resolution, out=buffer_x)
+        np.floor(buffer_x, out=buffer_x)
+        np.subtract(buffer_y, self._y_min - left, out=buffer_y)
+        np.divide(buffer_y, self.resolution, out=buffer_y)
+        np.floor(buffer_y, out=buffer_y)
+
+        valid, valid_y = self._valid, self._valid_y
+        np.greater_equal(buffer_x, 0, out=valid)
+        np.less(buffer_x, rows, out=valid_y)
+        np.logical_and(valid, valid_y, out=valid)
+        np.greater_equal(buffer_y, 0, out=valid_y)
+        np.logical_and(valid, valid_y, out=valid)
+        np.less(buffer_y, columns, out=valid_y)
+        np.logical_and(valid, valid_y, out=valid)
+
+        np.clip(buffer_x, 0, rows - 1, out=buffer_x)
+        np.clip(buffer_y, 0, columns - 1, out=buffer_y)
+        index, index_y = self._index, self._index_y
+        np.copyto(index, buffer_x, casting='unsafe')
+        np.copyto(index_y, buffer_y, casting='unsafe')
+        np.multiply(index, columns, out=index)
+        np.add(index, index_y, out=index)
+
+        np.take(self._grid.reshape(-1), index, out=self._scratch)
+        np.multiply(self._scratch, valid, out=self._scratch)
+        self._grid, self._scratch = self._scratch, self._grid
+        self.shifts += 1
+
+
+    def update_pose(self, gnss_data):
+        """
+        根据车辆位姿的变化平移旋转栅格
+        累计移动和转动都很小时不处理，避免每帧重采样使证据模糊
+
+        参数:
+            gnss_data: gnss数据对象
+        """
+        x, y, yaw = gnss_data.get()
+        if self._anchor is None:
+            self._anchor = (x, y, yaw)
+            return
+
+        anchor_x, anchor_y, anchor_yaw = self._anchor
+        dx = x - anchor_x
+        dy = y - anchor_y
+        cos_yaw = math.cos(anchor_yaw)
+        sin_yaw = math.sin(anchor_yaw)
+        forward = cos_yaw * dx + sin_yaw * dy
+        left = -sin_yaw * dx + cos_yaw * dy
+        dyaw = math.atan2(math.sin(yaw - anchor_yaw), math.cos(yaw - anchor_yaw))
+
+        if abs(dyaw) < self._shift_angle:
+            # 只平移整数个栅格，余下的位移留到下次，平移不会累积取整误差
+            shift_rows = int(round(forward / self.resolution))
+            shift_columns = int(round(left / self.resolution))
+            if shift_rows == 0 and shift_columns == 0:
+                return
+            forward = shift_rows * self.resolution
+            left = shift_columns * self.resolution
+            self._shift(forward, left, 0.0)
+            self._anchor = (anchor_x + cos_yaw * forward - sin_yaw * left,
+                            anchor_y + sin_yaw * forward + cos_yaw * left,
+                            anchor_yaw)
+        else:
+            self._shift(forward, left, dyaw)
+            self._anchor = (x, y, yaw)
+
+
+    def update(self, object_data, gnss_data=None):
+        """
+        输入一帧目标点云(和当前位姿)，更新栅格
+
+        参数:
+            object_data: 目标点云数据
+            gnss_data: gnss数据对象，给出时先按位姿变化移动栅格
+        """
+        if gnss_data is not None:
+            self.update_pose(gnss_data)
+
+        grid = self._grid
+        np.multiply(grid, self._decay, out=grid)
+
+        points = object_data.as_array()
+        if len(points):
+            if self._z_range is not None:
+                z = points[:, 3]
+                points = points[(z > self._z_range[0]) & (z < self._z_range[1])]
+            rows = np.floor((points[:, 1] - self._x_min) / self.resolution).astype(np.intp)
+            columns = np.floor((points[:, 2] - self._y_min) / self.resolution).astype(np.intp)
+            inside = (rows >= 0) & (rows < self.shape[0]) & (columns >= 0) & (columns < self.shape[1])
+            # 同一个栅格在一帧中被多个点命中时只加一次
+            grid.reshape(-1)[rows[inside] * self.shape[1] + columns[inside]] += self._hit
+            np.minimum(grid, self._max_value, out=grid)
+
+
+    def zone_barrier(self, name):
+        """
+        警戒区中是否有占据的栅格
+
+        参数:
+            name: 警戒区名称
+        返回:
+            有是True, 无是False
+        """
+        row_slice, column_slice = self._zones[name]
+        region = self._grid[row_slice, column_slice]
+        return bool(region.size > 0 and region.max() >= self._threshold)
+
+
+    def is_zone_barrier(self):
+        """
+        左中右三个默认警戒区是否有障碍物(和 ObjectFeedback.is_zone_barrier 相同的返回值)
+
+        返回:
+            左中右三个警戒区是否有障碍物的元组
+        """
+        return self.zone_barrier('left'), self.zone_barrier('mid'), self.zone_barrier('right')
+
+
+    def closest_in_path(self, width, max_distance=None):
+        """
+        车辆正前方宽度为 width 的通道中最近的占据栅格距离
+
+        参数:
+            width: 通道宽度(米)
+            max_distance: 只查找这个距离以内，默认到栅格前端
+        返回:
+            最近占据栅格中心的x坐标，没有时返回 None
+        """
+        column_slice = self._corridors.get(width)
+        if column_slice is None:
+            column_slice = self._column_slice(-width / 2.0, width / 2.0)
+            self._corridors[width] = column_slice
+        start = max(self._row_of(0), 0)
+        stop = self.shape[0] if max_distance is None else min(max(self._row_of(max_distance) + 1, 0), self.shape[0])
+        if start >= stop:
+            return None
+
+        row_max = self._grid[start:stop, column_slice].max(axis=1)
+        rows = np.flatnonzero(row_max >= self._threshold)
+        if not len(rows):
+            return None
+        return float(self._row_x[start + rows[0]])
+
+
+    def free_path(self, distance, width):
+        """
+        车辆正前方 distance 以内宽度为 width 的通道是否没有障碍物
+
+        参数:
+            distance: 距离(米)
+            width: 通道宽度(米)
+        返回:
+            没有障碍物返回True, 否则返回False
+        """
+        return self.closest_in_path(width, distance) is None
+
+
+    def closest_obstacle(self):
+        """
+        离车辆最近的占据栅格
+
+        返回:
+            (距离, x, y)，没有占据栅格时返回 None
+        """
+        distance = np.where(self._grid >= self._threshold, self._center_distance, np.inf)
+        index = int(distance.argmin())
+        row, column = divmod(index, self.shape[1])
+        if not np.isfinite(distance[row, column]):
+            return None
+        return float(distance[row, column]), float(self._center_x[row, column]), float(self._center_y[row, column])
+
+
+if __name__ == '__main__':
+    """
+    测试正常
+    """
+    pass
@@ -0,0 +1,184 @@
+# -*- coding:utf-8 -*-
+"""
+延迟补偿的位姿预测
+用定位点历史缓冲(GnssHistory)估计车速和横摆角速度，按恒定转弯率和速度(CTRV)模型
+把位姿外推到预计的执行时刻，再交给最近点搜索和纯追踪
+@author: QinYu TianHao
+
+使用方法:
+    pose_predictor = PosePredictor(latency=0.08)
+    pose_predictor.update(gnss_data, stamp)
+    predicted_gnss_data = pose_predictor.predict()
+或者交给GnssTracking自动使用:
+    gnss_tracking = GnssTracking(k, b, wheelbase, scale, pose_predictor=PosePredictor(latency=0.08))
+"""
+import math
+import time
+
+from ..data_object import GnssData, GnssHistory
+
+
+def ctrv_predict(x, y, yaw, v, yaw_rate, dt):
+    """
+    恒定转弯率和速度模型的位姿外推
+
+    参数:
+        x: 当前x坐标
+        y: 当前y坐标
+        yaw: 当前航向角
+        v: 车速(米/秒)
+        yaw_rate: 横摆角速度(弧度/秒)
+        dt: 外推时间(秒)
+    返回:
+        x, y, yaw: 外推后的位姿
+    """
+    dyaw = yaw_rate * dt
+    if abs(dyaw) < 1e-6:
+        # 近似直线行驶
+        return x + v * dt * math.cos(yaw), y + v * dt * math.sin(yaw), yaw
+    radius = v / yaw_rate
+    new_yaw = yaw + dyaw
+    return (x + radius * (math.sin(new_yaw) - math.sin(yaw)),
+            y - radius * (math.cos(new_yaw) - math.cos(yaw)),
+            new_yaw)
+
+
+class PosePredictor(object):
+    """
+    位姿预测器
+    每个定位点用最近 window 个历史点估计车速和横摆角速度，计算量和运行时间无关
+    预测时外推的时间为 定位点的延迟 + 执行延迟，并统计测量到的定位点延迟
+
+    latency: 执行延迟(秒)，即从计算控制量到执行机构动作的时间\n
+    history: 定位点历史缓冲(可以和跟踪器、录制器共用)\n
+    v: 估计的车速(米/秒，倒车为负)\n
+    yaw_rate: 估计的横摆角速度(弧度/秒)
+    """
+
+    def __init__(self, latency=0.1, window=5, max_horizon=0.5, history=None, clock=time.monotonic):
+        """
+        初始化位姿预测器
+
+        参数:
+            latency: 执行延迟(秒)
+            window: 估计车速和横摆角速度使用的历史点数
+            max_horizon: 最长外推时间(秒)，定位点过旧时不再继续外推
+            history: 共用的定位点历史缓冲，None 表示新建一个
+            clock: 单调时钟函数，需要和定位点时间戳使用同一个时钟
+        """
+        self.latency = latency
+        self._window = window
+        self._max_horizon = max_horizon
+        self._clock = clock
+        if history is None:
+            history = GnssHistory(max(window, 16), clock)
+        self.history = history
+
+        self.v = 0.0
+        self.yaw_rate = 0.0
+
+        # 测量到的定位点延迟统计(预测时刻 - 定位点时间戳)
+        self._latency_count = 0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._latency_last = 0.0
+
+
+    def reset(self):
+        """
+        清除定位点历史和速度估计
+        """
+        self.history.clear()
+        self.v = 0.0
+        self.yaw_rate = 0.0
+
+
+    @property
+    def ready(self):
+        """
+        是否已经收到定位点
+        """
+        return len(self.history) > 0
+
+
+    def update(self, gnss_data, stamp=None):
+        """
+        输入一个定位点，更新车速和横摆角速度的估计
+        时间戳和历史中最新的点相同时(如共用的历史已经记录了该点)不重复记录
+
+        参数:
+            gnss_data: gnss数据对象
+            stamp: 定位点的采样时刻，默认取 gnss_data.stamp，都没有时取当前时钟
+        """
+        history = self.history
+        if stamp is None:
+            stamp = gnss_data.stamp
+        if len(history) and stamp is not None and stamp < history.stamps(1)[0]:
+            # 时间戳倒退(如重放数据)时重新开始估计
+            self.reset()
+        history.append(gnss_data, stamp)
+
+        self.v = history.speed(self._window)
+        self.yaw_rate = history.yaw_rate(self._window)
+
+
+    def predict(self, now=None, latency=None):
+        """
+        把最新的定位点外推到执行时刻
+
+        参数:
+            now: 当前时刻，默认取当前时钟
+            latency: 执行延迟(秒)，默认为 self.latency
+        返回:
+            外推后的gnss数据对象，没有收到定位点时返回 None
+        """
+        latest = self.history.latest()
+        if latest is None:
+            return None
+        if now is None:
+            now = self._clock()
+        if latency is None:
+            latency = self.latency
+
+        age = max(now - latest.stamp, 0.0)
+        self._latency_count += 1
+        self._latency_sum += age
+        self._latency_last = age
+        if age > self._latency_max:
+            self._latency_max = age
+
+        horizon = min(age + latency, self._max_horizon)
+        x, y, yaw = ctrv_predict(latest.x, latest.y, latest.yaw, self.v, self.yaw_rate, horizon)
+
+        return GnssData(x, y, yaw, latest.usable, now + latency)
+
+
+    def stats(self):
+        """
+        返回定位点延迟统计
+
+        返回:
+            {'count': 预测次数, 'mean': 平均延迟, 'max': 最大延迟, 'last': 最近一次延迟} 字典(秒)
+        """
+        count = self._latency_count
+        return {'count': count,
+                'mean': self._latency_sum / count if count else 0.0,
+                'max': self._latency_max,
+                'last': self._latency_last}
+
+
+if __name__ == '__main__':
+    """
+    以 5 米/秒 在半径 20 米的圆上行驶，定位点 50 毫秒一次，延迟 100 毫秒
+    """
+    radius, v, period = 20.0, 5.0, 0.05
+    pose_predictor = PosePredictor(latency=0.1)
+    for i in range(40):
+        theta = v / radius * i * period
+        pose_predictor.update(GnssData(radius * math.sin(theta), radius - radius * math.cos(theta), theta, True),
+                              i * period)
+    predicted = pose_predictor.predict(now=39 * period + 0.02)
+    theta = v / radius * (39 * period + 0.12)
+    print(predicted)
+    print('truth x:{} y:{} yaw:{}'.format(radius * math.sin(theta), radius - radius * math.cos(theta), theta))
+    print(pose_predictor.v, pose_predictor.yaw_rate, pose_predictor.stats())
@@ -0,0 +1,235 @@
+# -*- coding:utf-8 -*-
+"""
+纯追踪圆弧的扫掠区碰撞检查
+按纯追踪求出的前轮角度，车辆以后轴中心为参考沿半径 R = 轴距 / tan(delta) 的圆弧行驶，
+车身扫过的区域是以转向中心为圆心的圆环的一段
+把整帧点云一次转换到以转向中心为原点的极坐标，用圆环和角度范围判断每个点会不会被车身扫到，
+以及车辆再行驶多远(后轴中心的弧长)会碰到它
+@author: QinYu TianHao
+
+使用方法:
+    checker = SweptPathChecker(wheelbase=2.7, width=2.0, front_overhang=0.9, rear_overhang=0.8,
+                               rear_axle=-1.2, horizon=20)
+    wheel_degree = gnss_tracking.pure_tracking(gnss_data, route)
+    distance = checker.check(object_data, gnss_tracking.delta)
+"""
+import math
+import numpy as np
+
+
+class SweptPathChecker(object):
+    """
+    扫掠区碰撞检查器
+    点云坐标系为 x 向前、y 向左(与 ObjectFeedback 相同)，前轮角度向左转为正(与 pure_pursuit_point 相同)
+
+    horizon: 检查的行驶距离(米)\n
+    max_points: 每帧最多检查的点数，超出时只保留前方最近的点\n
+    last_point: 最近一次检查中最先碰到的点 (x, y)，没有时为 None
+    """
+
+    def __init__(self, wheelbase, width=2.0, front_overhang=1.0, rear_overhang=1.0, rear_axle=0.0,
+                 horizon=20.0, margin=0.2, max_points=20000, z_range=None, straight_angle=1e-4):
+        """
+        初始化车辆外形和检查范围
+
+        参数:
+            wheelbase: 轴距(米)
+            width: 车宽(米)
+            front_overhang: 前轴到车头的距离(米)
+            rear_overhang: 后轴到车尾的距离(米)
+            rear_axle: 后轴中心在点云坐标系中的x坐标(米)，激光雷达在后轴前方时为负数
+            horizon: 检查的行驶距离(米)
+            margin: 车身四周的安全余量(米)
+            max_points: 每帧最多检查的点数
+            z_range: 只检查 z 在 (z_min, z_max) 内的点，None 表示不限制
+            straight_angle: 前轮角度绝对值小于此值时按直线行驶检查(弧度)
+        """
+        self._rear_axle = float(rear_axle)
+        self._wheelbase = float(wheelbase)
+        # 以后轴中心为原点的车身范围(包括安全余量)
+        self._front = wheelbase + front_overhang + margin
+        self._rear = rear_overhang + margin
+        self._half_width = width / 2.0 + margin
+        self.horizon = float(horizon)
+        self.max_points = max_points
+        self._z_range = z_range
+        self._straight_angle = straight_angle
+
+        self.last_point = None
+        self.checks = 0
+        self.conflicts = 0
+        self.truncated = 0
+
+
+    def turning_radius(self, delta):
+        """
+        后轴中心的转弯半径
+
+        参数:
+            delta: 前轮角度(弧度)，向左为正
+        返回:
+            带符号的半径(向左转为正)，直线行驶时返回 None
+        """
+        if abs(delta) < self._straight_angle:
+            return None
+        return self._wheelbase / math.tan(delta)
+
+
+    def _candidates(self, object_array, radius):
+        """
+        用扫掠区的包围盒粗筛点云，点数超过预算时只保留前方最近的点
+        """
+        X = object_array[:, 1]
+        Y = object_array[:, 2]
+        reach = self.horizon + self._front
+        mask = (X >= self._rear_axle - self._rear - reach) & (X <= self._rear_axle + reach)
+        if radius is None:
+            mask &= np.abs(Y) <= self._half_width
+        else:
+            # 圆弧行驶时车身扫过以转向中心为圆心、半径不超过车身最远角的圆盘
+            # 转弯外侧只有车角扫出车宽以外(车尾外角在起步时会扫到后方外侧的点)
+            outer = abs(radius) + self._half_width
+            corner = math.hypot(max(self._front, self._rear), outer)
+            if radius > 0:
+                mask &= (Y >= radius - corner) & (Y <= radius + corner)
+            else:
+                mask &= (Y <= radius + corner) & (Y >= radius - corner)
+            mask &= np.abs(Y) <= reach + self._half_width
+        if self._z_range is not None:
+            Z = object_array[:, 3]
+            mask &= (Z >= self._z_range[0]) & (Z <= self._z_range[1])
+
+        index = np.flatnonzero(mask)
+        if len(index) > self.max_points:
+            # 到后轴中心的距离最近的 max_points 个点
+            distance = np.hypot(X[index] - self._rear_axle, Y[index])
+            index = index[np.argpartition(distance, self.max_points - 1)[:self.max_points]]
+            self.truncated += 1
+        return X[index], Y[index]
+
+
+    def _straight_distance(self, U, Y):
+        """
+        直线行驶时每个点被碰到前的行驶距离，不会碰到的点为无穷大
+        """
+        inside = (np.abs(Y) <= self._half_width) & (U >= -self._rear)
+        return np.where(inside, np.maximum(U - self._front, 0.0), np.inf)
+
+
+    def _arc_distance(self, U, Y, radius):
+        """
+        圆弧行驶时每个点被碰到前的行驶距离(后轴中心的弧长)，不会碰到的点为无穷大
+        """
+        turn_radius = abs(radius)
+        # 以转向中心为原点的极坐标，角度从后轴中心的方向开始沿行驶方向增加
+        V = turn_radius - math.copysign(1.0, radius) * Y
+        R = np.hypot(U, V)
+        angle = np.arctan2(U, V)
+
+        inner = max(turn_radius - self._half_width, 0.0)
+        outer = turn_radius + self._half_width
+        # 车头部分(后轴前方)和车尾部分(后轴后方)各自能扫到的半径范围
+        has_front = (R >= inner) & (R <= math.hypot(self._front, outer))
+        has_rear = (R >= inner) & (R <= math.hypot(self._rear, outer))
+
+        # 半径 R 上车头部分覆盖 [gap, front_angle]，车尾部分覆盖 [-back_angle, -gap]
+        # 最大角度在内侧边或车头(车尾)边上，比外侧边远的半径上两部分之间有空隙
+        safe_R = np.maximum(R, 1e-9)
+        side_angle = np.arccos(np.clip(inner / safe_R, -1.0, 1.0))
+        front_angle = np.minimum(side_angle, np.arcsin(np.clip(self._front / safe_R, 0.0, 1.0)))
+        back_angle = np.minimum(side_angle, np.arcsin(np.clip(self._rear / safe_R, 0.0, 1.0)))
+        gap = np.arcsin(np.sqrt(np.maximum(R * R - outer * outer, 0.0)) / safe_R)
+
+        # 车辆前进时覆盖范围的角度增加，点先碰到它后方最近的那个前沿(车头部分的 front_angle 或车尾部分的 -gap)
+        two_pi = 2 * math.pi
+        front_turn = np.where(has_front, np.mod(angle - front_angle, two_pi), np.inf)
+        rear_turn = np.where(has_rear, np.mod(angle + gap, two_pi), np.inf)
+        turn = np.minimum(front_turn, rear_turn)
+        covered = ((has_front & (angle >= gap) & (angle <= front_angle)) |
+                   (has_rear & (angle >= -back_angle) & (angle <= -gap)))
+        return np.where(covered, 0.0, turn * turn_radius)
+
+
+    def distances(self, X, Y, delta):
+        """
+        求出每个点被车身碰到前的行驶距离(向量化)
+
+        参数:
+            X: 点x坐标数组(点云坐标系)
+            Y: 点y坐标数组
+            delta: 前轮角度(弧度)，向左为正
+        返回:
+            行驶距离数组(米)，已经在车身范围内的点为0，不会碰到的点为无穷大
+        """
+        U = np.asarray(X, dtype=np.float64) - self._rear_axle
+        Y = np.asarray(Y, dtype=np.float64)
+        radius = self.turning_radius(delta)
+        if radius is None:
+            return self._straight_distance(U, Y)
+        return self._arc_distance(U, Y, radius)
+
+
+    def check_array(self, object_array, delta):
+        """
+        检查 (kind, x, y, z) 数组
+
+        参数:
+            object_array: N x 4 数组
+            delta: 前轮角度(弧度)，向左为正
+        返回:
+            到最先碰到的点的行驶距离(米)，检查范围内没有碰撞时返回 None
+        """
+        self.checks += 1
+        self.last_point = None
+        object_array = np.asarray(object_array, dtype=np.float64).reshape(-1, 4)
+        radius = self.turning_radius(delta)
+        X, Y = self._candidates(object_array, radius)
+        if not len(X):
+            return None
+
+        distance = self.distances(X, Y, delta)
+        first = int(distance.argmin())
+        if distance[first] > self.horizon:
+            return None
+
+        self.conflicts += 1
+        self.last_point = (float(X[first]), float(Y[first]))
+        return float(distance[first])
+
+
+    def check(self, object_data, delta):
+        """
+        检查目标信息对象
+
+        参数:
+            object_data: 目标信息对象
+            delta: 前轮角度(弧度)，向左为正
+        返回:
+            到最先碰到的点的行驶距离(米)，检查范围内没有碰撞时返回 None
+        """
+        return self.check_array(object_data.as_array(), delta)
+
+
+    def stats(self):
+        """
+        返回检查统计
+        """
+        return {'checks': self.checks,
+                'conflicts': self.conflicts,
+                'truncated': self.truncated}
+
+
+if __name__ == '__main__':
+    """
+    直行时先碰到正前方的点，左转时先碰到弯道内侧的点
+    起步转弯时车尾外角会扫到后方外侧的点，粗筛不能把它去掉
+    """
+    checker = SweptPathChecker(wheelbase=2.7, width=2.0, front_overhang=0.9, rear_overhang=0.8, horizon=20)
+    points = np.array([[1, 10.0, 0.0, 0.5], [1, 8.0, 3.0, 0.5]])
+    print(checker.check_array(points, 0.0), checker.last_point)
+    print(checker.check_array(points, 0.3), checker.last_point)
+    for y, delta in ((-1.25, 0.5), (1.25, -0.6)):
+        distance = checker.check_array(np.array([[1, -0.3, y, 0.5]]), delta)
+        assert distance is not None and abs(distance - checker.distances([-0.3], [y], delta)[0]) < 1e-9
+        print(distance, checker.last_point)
+    print(checker.stats())
@@ -7,4 +7,16 @@
 # 地图坐标点容器
 from .coordinate import geog_to_proj, geographic_to_projected, ProjectedCoordinate, GeographicCoordinate, read_coordinate
 # 路径容器
-from .route import Route, build_route
\ No newline at end of file
+from .route import Route, build_route
+# 平滑换道路径规划
+from .lane_change import LaneChangePlanner, LaneChangePath, quintic_blend
+# 路径点精炼(重采样、平滑、简化)
+from .refine import resample_xy, collapse_stop_clusters, smooth_xy, simplify_index, vertex_radius
+# 实时路径录制器
+from .recorder import RouteRecorder
+# 路径限速曲线
+from .speed_profile import SpeedProfile, calcu_speed_limit
+# 分块地图存储
+from .tile_store import build_tiles, TiledRoute
+# 路径线段的空间索引
+from .spatial_index import SegmentGrid
\ No newline at end of file
@@ -15,6 +15,9 @@ import numbers
 import matplotlib.pyplot as plt
 import copy
 
+from . import refine
+from .spatial_index import SegmentGrid
+
 
 def geog_to_proj(geographic_coordinate_obj):
     """
@@ -136,6 +139,9 @@ class MapCoordinate(object):
             raise TypeError('{self_class.__name__} '
                 'input_X value and input_Y value should be int float list'.format(self_class=type(self)))
 
+        # 由坐标点派生出的缓存数据(数组、里程等)，坐标点改变时清空
+        self._cache = {}
+
 
     def __len__(self):
         '''
@@ -199,6 +205,7 @@ class MapCoordinate(object):
             self._X.append(input_x)
             self._Y.append(input_y)
             self._len += 1
+            self._cache.clear()
         else:
             msg = '{self_class.__name__} x type and y type should be int float list'
             raise TypeError(msg.format(self_class=type(self)))
@@ -216,6 +223,7 @@ class MapCoordinate(object):
                 self._X.extend(input_X)
                 self._Y.extend(input_Y)
                 self._len += X_len
+                self._cache.clear()
             else:
                 raise ValueError('{self_class.__name__} '
                     'input_X length should equal input_Y length'.format(self_class=type(self)))
@@ -237,6 +245,7 @@ class MapCoordinate(object):
             output_x = self._X.pop(index)
             output_y = self._Y.pop(index)
             self._len -= 1
+            self._cache.clear()
             return output_x, output_y 
         else:
             raise IndexError('{self_class.__name__} '
@@ -254,6 +263,19 @@ class MapCoordinate(object):
         return self._X, self._Y
 
 
+    def as_array(self):
+        '''
+        以 numpy 数组形式获取坐标点序列(缓存，坐标点改变前重复调用不会重新转换)
+
+        返回:
+            X: 地图点 x 坐标数组
+            Y: 地图点 y 坐标数组
+        '''
+        if 'array' not in self._cache:
+            self._cache['array'] = (np.array(self._X, dtype=np.float64), np.array(self._Y, dtype=np.float64))
+        return self._cache['array']
+
+
 
 class ProjectedCoordinate(MapCoordinate):
     """
@@ -302,6 +324,264 @@ class ProjectedCoordinate(MapCoordinate):
         return self._Y
 
 
+    def stations(self):
+        '''
+        获取每个坐标点的里程(从第一个点开始沿路径累加的距离，缓存)
+
+        返回:
+            stations: 里程数组，第一个点为0
+        '''
+        if 'stations' not in self._cache:
+            X, Y = self.as_array()
+            stations = np.zeros(len(X))
+            if len(X) > 1:
+                np.cumsum(np.hypot(np.diff(X), np.diff(Y)), out=stations[1:])
+            self._cache['stations'] = stations
+        return self._cache['stations']
+
+
+    def length(self, closed=False):
+        '''
+        获取路径总长度
+
+        参数:
+            closed: 是否为闭环路径(包括最后一个点回到第一个点的距离)
+        返回:
+            总长度(米)
+        '''
+        stations = self.stations()
+        if len(stations) == 0:
+            return 0.0
+        if not closed:
+            return float(stations[-1])
+        X, Y = self.as_array()
+        return float(stations[-1] + math.hypot(X[0] - X[-1], Y[0] - Y[-1]))
+
+
+    def segment_grid(self, closed=False, cell_size=10.0):
+        '''
+        获取路径线段的空间索引(缓存)
+
+        参数:
+            closed: 是否为闭环路径(包括最后一个点回到第一个点的线段)
+            cell_size: 栅格边长(米)
+        返回:
+            线段栅格索引(SegmentGrid)，线段编号就是线段起点的下标
+        '''
+        key = ('segment_grid', bool(closed), float(cell_size))
+        if key not in self._cache:
+            self._cache[key] = SegmentGrid([self.as_array()], cell_size, closed)
+        return self._cache[key]
+
+
+    def _normalize_projection(self, index, t, closed):
+        '''
+        投影正好在线段终点时改为下一条线段的起点(开环路径的最后一条线段除外)
+        '''
+        if t >= 1.0 and (closed or index + 2 < len(self)):
+            return (index + 1) % len(self), 0.0
+        return index, t
+
+
+    def project(self, x, y, hint=None, window=None, closed=False):
+        '''
+        把位置投影到最近的线段上
+        用线段空间索引查询，结果不受路径点疏密的影响；给出 hint 和 window 时只投影到窗口内的线段上，
+        hint 超出路径范围时收回到首尾线段
+
+        参数:
+            x: 位置x坐标
+            y: 位置y坐标
+            hint: 上次的点下标(可选)
+            window: 搜索窗口的半宽(线段数)(可选)
+            closed: 是否为闭环路径
+        返回:
+            index: 线段起点下标
+            t: 投影点在线段上的插值参数(0到1)
+            cross_track: 带符号的横向偏差(在行驶方向左侧为正)
+            heading: 线段的方向角(弧度)
+        '''
+        count = len(self)
+        if count == 0:
+            raise IndexError('<class:{}> project on empty coordinate'.format(type(self).__name__))
+        if count == 1:
+            return 0, 0.0, 0.0, 0.0
+
+        grid = self.segment_grid(closed)
+        segments = None
+        if hint is not None and window is not None:
+            segment_count = len(grid)
+            if closed and 2 * window + 1 < segment_count:
+                segments = np.arange(hint - window, hint + window + 1) % segment_count
+            else:
+                # 超出范围的 hint(如换了路径后沿用的旧下标)收回到首尾线段上
+                hint = min(max(hint, 0), segment_count - 1)
+                segments = np.arange(max(hint - window, 0), min(hint + window + 1, segment_count))
+        # 窗口为空时(window 为负)改为在整个索引中查询
+        if segments is not None and len(segments):
+            t, distance, cross_track = grid.project(x, y, segments)
+            best = int(distance.argmin())
+            index, t, cross_track = int(segments[best]), float(t[best]), float(cross_track[best])
+        else:
+            index, t, _, cross_track = grid.nearest_segment(x, y)
+
+        index, t = self._normalize_projection(index, t, closed)
+        return index, t, cross_track, float(grid.headings[index])
+
+
+    def project_many(self, X, Y, closed=False):
+        '''
+        批量把位置投影到最近的线段上(向量化)
+
+        参数:
+            X: 位置x坐标数组
+            Y: 位置y坐标数组
+            closed: 是否为闭环路径
+        返回:
+            index, t, cross_track, heading: 与 project 含义相同的数组
+        '''
+        if len(self) < 2:
+            raise IndexError('<class:{}> project_many needs at least two points'.format(type(self).__name__))
+
+        grid = self.segment_grid(closed)
+        index, t, _, cross_track = grid.nearest_segments(X, Y)
+        # 投影正好在线段终点时改为下一条线段的起点
+        move = t >= 1.0
+        if not closed:
+            move &= index + 2 < len(self)
+        index = np.where(move, (index + 1) % len(self), index)
+        t = np.where(move, 0.0, t)
+        return index, t, cross_track, grid.headings[index]
+
+
+    def station_of(self, x, y, hint=None, window=None, closed=False):
+        '''
+        求出位置在路径上的里程(投影到最近的线段上)
+
+        参数:
+            x: 位置x坐标
+            y: 位置y坐标
+            hint: 上次的点下标(可选)
+            window: 搜索窗口的半宽(点数)(可选)，和 hint 一起给出时只在窗口内搜索
+            closed: 是否为闭环路径
+        返回:
+            s: 里程(米)
+            index: 投影所在线段的起点下标
+        '''
+        index, t, _, _ = self.project(x, y, hint, window, closed)
+        if len(self) == 1:
+            return 0.0, 0
+        return float(self.stations()[index] + t * self.segment_grid(closed).lengths[index]), index
+
+
+    def point_at(self, s, closed=False):
+        '''
+        求出里程处的插值点(二分查找，O(log N))
+
+        参数:
+            s: 里程(米)，可以是数组；开环路径超出范围时取端点，闭环路径按总长度取模
+            closed: 是否为闭环路径
+        返回:
+            x, y: 插值点坐标
+            heading: 所在线段的方向角(弧度)
+        '''
+        X, Y = self.as_array()
+        stations = self.stations()
+        count = len(X)
+        if count == 0:
+            raise IndexError('<class:{}> point_at on empty coordinate'.format(type(self).__name__))
+
+        total = self.length(closed)
+        # 闭环路径最后一个点所在的线段是回到第一个点的线段
+        last = count - 1 if closed else max(count - 2, 0)
+
+        if np.ndim(s) == 0:
+            # 单个里程不用数组运算
+            s = float(s)
+            if closed and total > 0:
+                s %= total
+            else:
+                s = min(max(s, 0.0), float(stations[-1]))
+            index = min(max(int(np.searchsorted(stations, s, side='right')) - 1, 0), last)
+            stop = (index + 1) % count
+            segment_length = (float(stations[index + 1]) if index + 1 < count else total) - float(stations[index])
+            t = (s - float(stations[index])) / segment_length if segment_length > 0 else 0.0
+            dx = float(X[stop] - X[index])
+            dy = float(Y[stop] - Y[index])
+            return float(X[index]) + t * dx, float(Y[index]) + t * dy, math.atan2(dy, dx)
+
+        s = np.asarray(s, dtype=np.float64)
+        if closed and total > 0:
+            s = np.mod(s, total)
+        else:
+            s = np.clip(s, 0.0, stations[-1])
+        index = np.clip(np.searchsorted(stations, s, side='right') - 1, 0, last)
+        stop = (index + 1) % count
+        segment_end = np.where(index + 1 < count, stations[np.minimum(index + 1, count - 1)], total)
+        segment_length = segment_end - stations[index]
+        t = np.where(segment_length > 0, (s - stations[index]) / np.where(segment_length > 0, segment_length, 1.0), 0.0)
+
+        dx = X[stop] - X[index]
+        dy = Y[stop] - Y[index]
+        return X[index] + t * dx, Y[index] + t * dy, np.arctan2(dy, dx)
+
+
+    def remaining_distance(self, s, closed=False):
+        '''
+        求出里程处到路径终点的距离(闭环路径为到第一个点的距离)
+
+        参数:
+            s: 里程(米)，可以是数组
+            closed: 是否为闭环路径
+        返回:
+            剩余距离(米)
+        '''
+        total = self.length(closed)
+        if closed and total > 0:
+            remaining = total - np.mod(s, total)
+        else:
+            remaining = np.maximum(total - np.asarray(s, dtype=np.float64), 0.0)
+        if np.ndim(s) == 0:
+            return float(remaining)
+        return remaining
+
+
+    def resample(self, spacing, smooth=0.0, stop_radius=None, closed=False):
+        '''
+        按弧长等间距重采样，可选停车点聚合和平滑
+
+        参数:
+            spacing: 重采样的点间距(米)
+            smooth: 平滑的高斯核标准差(米)，0 表示不平滑
+            stop_radius: 停车点聚合的栅格大小(米)，None 表示不聚合
+            closed: 是否为闭环路径(平滑时首尾相接)
+        返回:
+            重采样后的新坐标对象
+        '''
+        X, Y = refine.resample_xy(self._X, self._Y, spacing, smooth, stop_radius, closed)
+        return type(self)(X.tolist(), Y.tolist())
+
+
+    def simplify(self, tolerance, curve_radius=100, curve_spacing=2.0):
+        '''
+        折线简化，删除直道上多余的共线点
+
+        参数:
+            tolerance: 最大横向偏差(米)
+            curve_radius: 弯道判定半径(米)，弯道上保留点的间距不超过 curve_spacing
+            curve_spacing: 弯道上保留点的最大间距(米)
+        返回:
+            simplified: 简化后的新坐标对象
+            ratio: 压缩比(原点数 / 简化后点数)
+        '''
+        keep_index = refine.simplify_index(self._X, self._Y, tolerance, curve_radius, curve_spacing)
+        X, Y = self.as_array()
+        simplified = type(self)(X[keep_index].tolist(), Y[keep_index].tolist())
+        ratio = float(len(self)) / len(simplified) if len(simplified) else 1.0
+
+        return simplified, ratio
+
+
 
 class GeographicCoordinate(MapCoordinate):
     """
@@ -366,25 +646,34 @@ class GeographicCoordinate(MapCoordinate):
         return projected_coordinate_obj
 
 
-def read_coordinate(file_path, class_type=ProjectedCoordinate):
+def read_coordinate(file_path, class_type=ProjectedCoordinate, file_format='text'):
     """
     读取存储的坐标函数
     从 .txt 文件中读取坐标
     文件中每行是一对坐标点,坐标中间由空格隔开
+    二进制格式的文件是连续的 float64 (x, y) 对(RouteRecorder 录制的格式)
 
     参数:
         route_file_path: 路径点文件读取路径
+        class_type: 坐标对象类型
+        file_format: 文件格式('text' 或 'binary')
     返回:
         coordinate： class_type 类型的坐标对象
     """
 
     print('Reading {}: {}.'.format(class_type.__name__, file_path))
     
-    coordinate = class_type()
-    with open(file_path, 'r') as f:
-        for line in f.readlines():
-            line = line.split()
-            coordinate.append(float(line[0]), float(line[1]))
+    if file_format == 'binary':
+        points = np.fromfile(file_path, dtype='<f8').reshape(-1, 2)
+        coordinate = class_type(points[:, 0].tolist(), points[:, 1].tolist())
+    elif file_format == 'text':
+        coordinate = class_type()
+        with open(file_path, 'r') as f:
+            for line in f.readlines():
+                line = line.split()
+                coordinate.append(float(line[0]), float(line[1]))
+    else:
+        raise ValueError("<func:read_coordinate> file_format must be in ('text', 'binary')")
 
     print('Complete read {}.'.format(class_type.__name__))
 
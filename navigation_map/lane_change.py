@@ -0,0 +1,326 @@
+# -*- coding:utf-8 -*-
+"""
+平滑换道路径规划
+在路径的起始车道和目标车道之间生成五次多项式过渡的换道路径，代替 Route.change 的瞬间切换
+生成的换道路径按 (起始车道, 目标车道, 里程区间, 换道距离区间) 缓存，重复超车时不需要重新计算
+@author: QinYu TianHao
+
+使用方法:
+    planner = LaneChangePlanner(route)
+    path = planner.plan(1, near_index, v)
+    wheel_degree = gnss_tracking.pure_tracking(gnss_data, path)
+    # 换道完成后回到原路径
+    if path.finished(near_index):
+        route.change(1)
+"""
+import collections
+import math
+import numpy as np
+
+from . import coordinate
+from .route import Route
+
+
+def quintic_blend(t):
+    """
+    五次多项式过渡函数 10t^3 - 15t^4 + 6t^5
+    在 t=0 和 t=1 处一阶导数和二阶导数都为0，换道的起点和终点处横向速度和加速度连续
+
+    参数:
+        t: 过渡进度(0到1)，可以是数组
+    返回:
+        过渡权重(0到1)
+    """
+    t = np.clip(t, 0.0, 1.0)
+    return t * t * t * (10 - 15 * t + 6 * t * t)
+
+
+class LaneChangePath(Route):
+    """
+    换道路径
+    只有一条车道的路径，可以像普通路径一样用 GnssTracking 追踪
+    每个路径点都记录了它对应原路径上的车道号和下标，用于进出换道路径时的下标映射
+
+    base_route: 原路径\n
+    from_driveway: 起始车道号\n
+    to_driveway: 目标车道号\n
+    transition_end: 换道过渡段结束处的路径点下标
+    """
+
+    def __init__(self, projected_coordinate, base_route, from_driveway, to_driveway,
+                 base_driveway, base_index, transition_end):
+        """
+        初始化换道路径
+
+        参数:
+            projected_coordinate: 换道路径的坐标点对象
+            base_route: 原路径
+            from_driveway: 起始车道号
+            to_driveway: 目标车道号
+            base_driveway: 每个路径点对应原路径的车道号数组
+            base_index: 每个路径点对应原路径车道上的下标数组
+            transition_end: 换道过渡段结束处的路径点下标
+        """
+        super(LaneChangePath, self).__init__((projected_coordinate,), 0)
+        self.base_route = base_route
+        self.from_driveway = from_driveway
+        self.to_driveway = to_driveway
+        self.transition_end = transition_end
+        self._base_driveway = base_driveway
+        self._base_index = base_index
+
+
+    def base_point(self, index):
+        """
+        求出换道路径点对应原路径上的点
+
+        参数:
+            index: 换道路径点下标
+        返回:
+            driveway: 原路径车道号
+            base_index: 原路径车道上的下标
+        """
+        return int(self._base_driveway[index]), int(self._base_index[index])
+
+
+    def locate(self, driveway, index):
+        """
+        求出原路径上的点在换道路径中的下标
+
+        参数:
+            driveway: 原路径车道号
+            index: 原路径车道上的下标
+        返回:
+            换道路径点下标，该点不在换道路径上时返回 None
+        """
+        matched = np.flatnonzero((self._base_driveway == driveway) & (self._base_index == index))
+        if len(matched) == 0:
+            return None
+        return int(matched[0])
+
+
+    def finished(self, index):
+        """
+        换道过渡段是否已经走完
+
+        参数:
+            index: 当前追踪的换道路径点下标
+        """
+        return index >= self.transition_end
+
+
+class LaneChangePlanner(object):
+    """
+    换道路径规划器
+    换道距离和车速成正比(换道时间 x 车速)，并限制在最小和最大换道距离之间
+    换道起点按里程区间对齐，同一区间、同一换道距离区间的换道路径只计算一次
+
+    route: 原路径\n
+    change_time: 换道时间(秒)\n
+    min_distance: 最小换道距离(米)\n
+    max_distance: 最大换道距离(米)\n
+    bucket: 里程和换道距离的缓存区间长度(米)\n
+    lead_distance: 换道路径在过渡段前保留的起始车道长度(米)\n
+    tail_distance: 换道路径在过渡段后保留的目标车道长度(米)
+    """
+
+    def __init__(self, route, change_time=3.0, min_distance=15.0, max_distance=60.0,
+                 bucket=5.0, lead_distance=5.0, tail_distance=30.0, cache_size=64):
+        """
+        初始化换道路径规划器
+
+        参数:
+            route: 原路径
+            change_time: 换道时间(秒)
+            min_distance: 最小换道距离(米)
+            max_distance: 最大换道距离(米)
+            bucket: 缓存区间长度(米)
+            lead_distance: 过渡段前保留的起始车道长度(米)
+            tail_distance: 过渡段后保留的目标车道长度(米)
+            cache_size: 最多缓存的换道路径数量
+        """
+        self._route = route
+        self._change_time = change_time
+        self._min_distance = min_distance
+        self._max_distance = max_distance
+        self._bucket = bucket
+        self._lead_distance = lead_distance
+        self._tail_distance = tail_distance
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+
+    @property
+    def route(self):
+        """
+        原路径
+        """
+        return self._route
+
+
+    @route.setter
+    def route(self, route):
+        """
+        更换原路径(如重新加载或重采样地图)，旧路径的换道路径不再使用
+        """
+        self._route = route
+        self._cache.clear()
+
+
+    def change_distance(self, v):
+        """
+        根据车速求出换道距离
+
+        参数:
+            v: 当前车速(米/秒)
+        返回:
+            换道距离(米)
+        """
+        return min(max(abs(v) * self._change_time, self._min_distance), self._max_distance)
+
+
+    def plan(self, to_driveway, index, v, from_driveway=None):
+        """
+        规划换道路径
+
+        参数:
+            to_driveway: 目标车道号
+            index: 车辆在起始车道上的最近点下标
+            v: 当前车速(米/秒)
+            from_driveway: 起始车道号，默认为原路径的当前车道
+        返回:
+            换道路径对象
+        """
+        route = self._route
+        if from_driveway is None:
+            from_driveway = route.driveway
+        if to_driveway == from_driveway or to_driveway not in route.driveway_num:
+            raise ValueError('<class:LaneChangePlanner> cannot change from driveway {} to {}'.format(
+                from_driveway, to_driveway))
+
+        stations = route.projected_coordinate_tuple[from_driveway].stations()
+        if not 0 <= index < len(stations):
+            raise IndexError('<class:LaneChangePlanner> index {} out of range for driveway {} with {} points'.format(
+                index, from_driveway, len(stations)))
+        station_bucket = int(stations[index] // self._bucket)
+        distance_bucket = int(math.ceil(self.change_distance(v) / self._bucket))
+        # 闭环路径的换道路径可以跨过起点，只要求换道距离短于一圈
+        if route.closed:
+            enough = distance_bucket * self._bucket < route.lane_length(from_driveway)
+        else:
+            enough = (station_bucket + distance_bucket) * self._bucket <= stations[-1]
+        if len(stations) < 2 or not enough:
+            raise ValueError('<class:LaneChangePlanner> not enough route left to change from driveway {} to {} '
+                             'at index {}'.format(from_driveway, to_driveway, index))
+
+        # 更换路径时会清空缓存，键中不需要区分路径
+        key = (from_driveway, to_driveway, station_bucket, distance_bucket)
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.misses += 1
+        path = self._build(from_driveway, to_driveway, station_bucket * self._bucket, distance_bucket * self._bucket)
+        self._cache[key] = path
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+        return path
+
+
+    def _unroll(self, projected_coordinate, end_station):
+        """
+        闭环路径把车道展开成首尾相接的多圈(起点前多展开一圈)，里程跨过起点后继续增加，
+        里程区间的查找不需要再处理跨过起点的情况；非闭环路径原样返回
+
+        参数:
+            projected_coordinate: 车道的坐标点对象
+            end_station: 需要覆盖到的里程(米)
+        返回:
+            X, Y, stations: 展开后的坐标和里程数组(起点前一圈的里程为负)
+            origin: 原车道第一个点在展开数组中的下标
+        """
+        X, Y = projected_coordinate.as_array()
+        stations = projected_coordinate.stations()
+        if not self._route.closed:
+            return X, Y, stations, 0
+
+        length = projected_coordinate.length(True)
+        laps = int(end_station // length) + 2
+        offsets = np.arange(-1, laps) * length
+        stations = (stations[np.newaxis, :] + offsets[:, np.newaxis]).ravel()
+        return np.tile(X, laps + 1), np.tile(Y, laps + 1), stations, len(X)
+
+
+    def _build(self, from_driveway, to_driveway, start_station, distance):
+        """
+        生成换道路径
+        过渡段使用起始车道上的点作为采样里程，每个采样点和目标车道上的对应点按五次多项式权重混合
+        闭环路径在展开的车道上计算，换道路径可以跨过起点
+        """
+        route = self._route
+        from_coordinate = route.projected_coordinate_tuple[from_driveway]
+        to_coordinate = route.projected_coordinate_tuple[to_driveway]
+        end_station = start_station + distance
+        cover_station = end_station + self._tail_distance
+        from_count = len(from_coordinate.stations())
+        to_count = len(to_coordinate.stations())
+        from_X, from_Y, from_stations, from_origin = self._unroll(from_coordinate, cover_station)
+        to_X, to_Y, to_stations, to_origin = self._unroll(to_coordinate, cover_station)
+
+        # 过渡段前的起始车道点和过渡段的采样点
+        lead_start = np.searchsorted(from_stations, start_station - self._lead_distance)
+        trans_start = np.searchsorted(from_stations, start_station)
+        trans_end = np.searchsorted(from_stations, end_station)
+        trans_stations = from_stations[trans_start:trans_end]
+        if len(trans_stations) == 0:
+            raise ValueError('<class:LaneChangePlanner> no route points in the lane change section')
+
+        # 过渡段(包括结束处的下一个点)在目标车道上对应点的里程
+        window = np.arange(trans_start, min(trans_end + 1, len(from_stations)))
+        window_stations = from_stations[window]
+        mapped_index = np.array([route.map_index(i, from_driveway, to_driveway)
+                                 for i in ((window - from_origin) % from_count).tolist()])
+        mapped_stations = to_stations[to_origin + mapped_index]
+        if route.closed:
+            # 对应点可能在起点的另一侧，按两条车道的长度比例选出里程最接近的一圈
+            from_length = from_coordinate.length(True)
+            to_length = to_coordinate.length(True)
+            laps = np.round((window_stations * (to_length / from_length) - mapped_stations) / to_length)
+            mapped_stations = mapped_stations + laps * to_length
+
+        # 目标车道上的对应点(按里程插值)和混合权重
+        target_stations = np.interp(trans_stations, window_stations, mapped_stations)
+        target_X = np.interp(target_stations, to_stations, to_X)
+        target_Y = np.interp(target_stations, to_stations, to_Y)
+        weight = quintic_blend((trans_stations - start_station) / distance)
+        trans_X = from_X[trans_start:trans_end] + weight * (target_X - from_X[trans_start:trans_end])
+        trans_Y = from_Y[trans_start:trans_end] + weight * (target_Y - from_Y[trans_start:trans_end])
+        trans_to_index = np.searchsorted(to_stations, target_stations).clip(0, len(to_stations) - 1)
+
+        # 过渡段后的目标车道点
+        tail_start_station = np.interp(end_station, window_stations, mapped_stations)
+        tail_start = np.searchsorted(to_stations, tail_start_station, side='right')
+        tail_end = np.searchsorted(to_stations, tail_start_station + self._tail_distance, side='right')
+
+        path_X = np.concatenate((from_X[lead_start:trans_start], trans_X, to_X[tail_start:tail_end]))
+        path_Y = np.concatenate((from_Y[lead_start:trans_start], trans_Y, to_Y[tail_start:tail_end]))
+
+        # 记录每个路径点对应原路径的车道号和下标(过渡段过半后算作目标车道)
+        in_target = weight >= 0.5
+        base_driveway = np.concatenate((np.full(trans_start - lead_start, from_driveway),
+                                        np.where(in_target, to_driveway, from_driveway),
+                                        np.full(tail_end - tail_start, to_driveway)))
+        base_index = np.concatenate(((np.arange(lead_start, trans_start) - from_origin) % from_count,
+                                     np.where(in_target, (trans_to_index - to_origin) % to_count,
+                                              (np.arange(trans_start, trans_end) - from_origin) % from_count),
+                                     (np.arange(tail_start, tail_end) - to_origin) % to_count))
+        transition_end = trans_end - lead_start
+
+        projected_coordinate = coordinate.ProjectedCoordinate(path_X.tolist(), path_Y.tolist())
+        return LaneChangePath(projected_coordinate, route, from_driveway, to_driveway,
+                              base_driveway, base_index, transition_end)
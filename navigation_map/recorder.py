@@ -0,0 +1,237 @@
+# -*- coding:utf-8 -*-
+"""
+实时路径录制器
+直接用行驶中接收的 GnssData 录制地图，数据按块写入固定大小的数组
+写满的块交给后台线程写入文件，控制线程不会因为写磁盘而阻塞
+所有块缓冲在建立录制器时预先分配，录制多长时间内存占用都不变
+写入跟不上、空闲块用完时把当前块抽稀一半继续录制，路径变稀疏但不会出现整段缺失
+@author: QinYu TianHao
+
+使用方法:
+    recorder = RouteRecorder('route.txt', min_distance=0.2)
+    # ROS回调或控制循环中
+    recorder.record(sia.msg_to_gnssdata(gnss_msg))
+    # 也可以和跟踪器共用定位点历史缓冲
+    recorder = RouteRecorder('route.txt', history=gnss_history)
+    # 录制结束
+    recorder.close()
+"""
+import threading
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import coordinate
+
+
+class RouteRecorder(object):
+    """
+    实时路径录制器
+    丢弃不可用的定位点和距离上一个录制点太近的定位点
+    文件格式和 read_coordinate 相同，文本格式每行一对坐标，二进制格式是连续的 float64 (x, y) 对
+
+    received: 收到的定位点数\n
+    unusable: 因定位不可用丢弃的点数\n
+    too_close: 因距离太近丢弃的点数\n
+    recorded: 录制的点数\n
+    chunks_written: 写入文件的块数\n
+    decimated: 后台写入跟不上时抽稀丢弃的点数\n
+    error: 后台写入线程的异常(如磁盘已满)，没有时为 None
+    """
+
+    def __init__(self, file_path, min_distance=0.2, chunk_size=1024, file_format='text', max_pending=32,
+                 history=None):
+        """
+        初始化录制器并启动后台写入线程
+
+        参数:
+            file_path: 录制文件路径
+            min_distance: 相邻录制点的最小距离(米)
+            chunk_size: 每个块的点数
+            file_format: 文件格式('text' 或 'binary')
+            max_pending: 最多等待写入的块数
+            history: 共用的定位点历史缓冲(GnssHistory)，给出时收到的定位点同时记录到历史中
+        """
+        if file_format not in ('text', 'binary'):
+            raise ValueError("<class:RouteRecorder> file_format must be in ('text', 'binary')")
+
+        self._file_path = file_path
+        self._min_distance_square = min_distance**2
+        self._chunk_size = chunk_size
+        self._file_format = file_format
+        self.history = history
+
+        # 预先分配的块缓冲，空闲的块在 _free 队列中，写满的块在 _pending 队列中
+        self._free = queue.Queue()
+        for _ in range(max_pending + 1):
+            self._free.put(np.empty((chunk_size, 2), dtype=np.float64))
+        self._pending = queue.Queue()
+        self._chunk = self._free.get_nowait()
+        self._count = 0
+        self._last_point = None
+
+        self.received = 0
+        self.unusable = 0
+        self.too_close = 0
+        self.recorded = 0
+        self.chunks_written = 0
+        self.decimated = 0
+        self.error = None
+
+        self._closed = False
+        mode = 'w' if file_format == 'text' else 'wb'
+        self._file = open(file_path, mode)
+        self._writer = threading.Thread(target=self._write_loop, name='RouteRecorder')
+        self._writer.daemon = True
+        self._writer.start()
+
+
+    def __len__(self):
+        return self.recorded
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> file:{} recorded:{} written chunks:{} decimated:{}'.format(
+            self_class.__name__, self._file_path, self.recorded, self.chunks_written, self.decimated)
+
+
+    def record(self, gnss_data):
+        """
+        录制一个定位点
+
+        参数:
+            gnss_data: gnss数据对象
+        返回:
+            是否录制了该点
+        """
+        if self._closed:
+            raise ValueError('<class:RouteRecorder> record on closed recorder')
+
+        self.received += 1
+        if self.history is not None:
+            self.history.append(gnss_data)
+        if not gnss_data.usable:
+            self.unusable += 1
+            return False
+
+        x, y = gnss_data.x, gnss_data.y
+        if self._last_point is not None:
+            dx = x - self._last_point[0]
+            dy = y - self._last_point[1]
+            if dx * dx + dy * dy < self._min_distance_square:
+                self.too_close += 1
+                return False
+
+        self._chunk[self._count, 0] = x
+        self._chunk[self._count, 1] = y
+        self._count += 1
+        self._last_point = (x, y)
+        self.recorded += 1
+
+        if self._count == self._chunk_size:
+            self._submit()
+
+        return True
+
+
+    def _submit(self):
+        """
+        把当前块交给后台线程写入，并换上一个空闲块
+        没有空闲块时(后台写入跟不上或已经出错)不分配新块也不等待，
+        把当前块隔一个点保留一个(保留最新的点)，腾出一半空间继续录制，丢弃的点计入 decimated
+        """
+        try:
+            free_chunk = self._free.get_nowait()
+        except queue.Empty:
+            count = self._count
+            half = count // 2
+            self._chunk[:half] = self._chunk[count - 2 * half + 1:count:2]
+            self._count = half
+            self.decimated += count - half
+            return
+
+        self._pending.put((self._chunk, self._count))
+        self._chunk = free_chunk
+        self._count = 0
+
+
+    def _write_loop(self):
+        """
+        后台写入线程
+        写入出错时保存异常并结束线程，之后空闲块不再归还，录制方按写入跟不上处理(抽稀)
+        """
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+
+            chunk, count = item
+            try:
+                if self._file_format == 'text':
+                    np.savetxt(self._file, chunk[:count], fmt='%.6f')
+                else:
+                    chunk[:count].astype('<f8').tofile(self._file)
+                self._file.flush()
+            except Exception as error:
+                self.error = error
+                break
+            self.chunks_written += 1
+            self._free.put(chunk)
+
+
+    def current_chunk(self):
+        """
+        以坐标点对象返回当前还未写入的块(用于显示)
+
+        返回:
+            ProjectedCoordinate 坐标点对象
+        """
+        points = self._chunk[:self._count]
+        return coordinate.ProjectedCoordinate(points[:, 0].tolist(), points[:, 1].tolist())
+
+
+    def flush(self):
+        """
+        把当前未写满的块也交给后台线程写入
+        """
+        if self._count:
+            self._submit()
+
+
+    def close(self):
+        """
+        写入剩余的数据并结束后台线程，后台写入出错时抛出该异常
+        """
+        if self._closed:
+            return
+        # 结束录制时不需要换上空闲块，直接把当前块交给后台线程，最后一块不会因为没有空闲块而丢失
+        if self._count:
+            self._pending.put((self._chunk, self._count))
+            self._count = 0
+        self._closed = True
+        self._pending.put(None)
+        self._writer.join()
+        try:
+            self._file.close()
+        except Exception as error:
+            if self.error is None:
+                self.error = error
+        if self.error is not None:
+            raise self.error
+
+
+    def stats(self):
+        """
+        返回录制统计(后台写入出错时 error 为异常对象)
+        """
+        return {'received': self.received,
+                'unusable': self.unusable,
+                'too_close': self.too_close,
+                'recorded': self.recorded,
+                'chunks_written': self.chunks_written,
+                'decimated': self.decimated,
+                'error': self.error}
@@ -0,0 +1,251 @@
+# -*- coding:utf-8 -*-
+"""
+路径点精炼
+对采集的路径点做停车点聚合、按弧长等间距重采样和平滑，全部使用数组运算
+@author: QinYu TianHao
+"""
+import numpy as np
+
+
+def collapse_stop_clusters(X, Y, stop_radius):
+    """
+    聚合停车时采集的密集点
+    把点按 stop_radius 大小的栅格划分，沿路径连续落在同一个栅格中的点合并为它们的平均点
+    再用错开半个栅格的栅格重复一次，合并在栅格边界上来回跳动的点
+
+    参数:
+        X: 路径点x坐标数组
+        Y: 路径点y坐标数组
+        stop_radius: 聚合的栅格大小(米)
+    返回:
+        X: 聚合后的x坐标数组
+        Y: 聚合后的y坐标数组
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    weights = np.ones(len(X))
+
+    for offset in (0.0, 0.5):
+        if len(X) < 2:
+            break
+        cell_X = np.floor(X / stop_radius + offset)
+        cell_Y = np.floor(Y / stop_radius + offset)
+        new_cell = (np.diff(cell_X) != 0) | (np.diff(cell_Y) != 0)
+        labels = np.concatenate(([0], np.cumsum(new_cell)))
+
+        counts = np.bincount(labels, weights)
+        X = np.bincount(labels, X * weights) / counts
+        Y = np.bincount(labels, Y * weights) / counts
+        weights = counts
+
+    return X, Y
+
+
+def smooth_xy(X, Y, sigma, spacing, closed=False):
+    """
+    高斯核平滑等间距路径点
+    首尾点保持不变(闭环路径按环形处理)
+
+    参数:
+        X: 等间距路径点x坐标数组
+        Y: 等间距路径点y坐标数组
+        sigma: 高斯核标准差(米)
+        spacing: 点间距(米)
+        closed: 是否为闭环路径
+    返回:
+        X: 平滑后的x坐标数组
+        Y: 平滑后的y坐标数组
+    """
+    half = int(np.ceil(3 * sigma / spacing))
+    if half == 0 or len(X) < 3:
+        return X, Y
+    half = min(half, len(X) - 1)
+
+    kernel = np.exp(-0.5 * (np.arange(-half, half + 1) * spacing / sigma)**2)
+    kernel /= kernel.sum()
+
+    mode = 'wrap' if closed else 'reflect'
+    smooth_X = np.convolve(np.pad(X, half, mode=mode), kernel, mode='valid')
+    smooth_Y = np.convolve(np.pad(Y, half, mode=mode), kernel, mode='valid')
+    if not closed:
+        smooth_X[0], smooth_X[-1] = X[0], X[-1]
+        smooth_Y[0], smooth_Y[-1] = Y[0], Y[-1]
+
+    return smooth_X, smooth_Y
+
+
+def resample_xy(X, Y, spacing, smooth=0.0, stop_radius=None, closed=False):
+    """
+    按弧长等间距重采样路径点
+
+    参数:
+        X: 路径点x坐标序列
+        Y: 路径点y坐标序列
+        spacing: 重采样的点间距(米)
+        smooth: 平滑的高斯核标准差(米)，0 表示不平滑
+        stop_radius: 停车点聚合的栅格大小(米)，None 表示不聚合
+        closed: 是否为闭环路径(包括最后一个点回到第一个点的线段，接缝处点间距相同，平滑时首尾相接)
+    返回:
+        X: 重采样后的x坐标数组
+        Y: 重采样后的y坐标数组
+    """
+    if spacing <= 0:
+        raise ValueError('<func:resample_xy> spacing must be greater than zero')
+
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    if stop_radius:
+        X, Y = collapse_stop_clusters(X, Y, stop_radius)
+    if len(X) < 2:
+        return X.copy(), Y.copy()
+
+    if closed:
+        # 闭环路径在末尾接上第一个点，里程包括回到起点的线段
+        X = np.append(X, X[0])
+        Y = np.append(Y, Y[0])
+
+    # 去掉重合点，保证里程严格递增
+    steps = np.hypot(np.diff(X), np.diff(Y))
+    keep = np.concatenate(([True], steps > 0))
+    X, Y = X[keep], Y[keep]
+    stations = np.concatenate(([0.0], np.cumsum(steps[steps > 0])))
+    if len(X) < 2:
+        return X, Y
+
+    if closed:
+        # 闭环路径把总长度等分，间距取最接近 spacing 的值，最后一个点到第一个点的间距也相同
+        count = max(int(round(stations[-1] / spacing)), 3)
+        spacing = stations[-1] / count
+        new_stations = np.arange(count) * spacing
+        new_X = np.interp(new_stations, stations, X)
+        new_Y = np.interp(new_stations, stations, Y)
+        if smooth:
+            new_X, new_Y = smooth_xy(new_X, new_Y, smooth, spacing, closed)
+        return new_X, new_Y
+
+    # 等间距里程，最后一个点保留原路径终点
+    new_stations = np.arange(0.0, stations[-1], spacing)
+    if len(new_stations) > 1 and stations[-1] - new_stations[-1] < spacing / 2:
+        new_stations = new_stations[:-1]
+    new_stations = np.append(new_stations, stations[-1])
+    new_X = np.interp(new_stations, stations, X)
+    new_Y = np.interp(new_stations, stations, Y)
+
+    if smooth:
+        new_X, new_Y = smooth_xy(new_X, new_Y, smooth, spacing, closed)
+
+    return new_X, new_Y
+
+
+def segment_distance(X, Y, ax, ay, bx, by):
+    """
+    求点集到线段 ab 的距离
+
+    参数:
+        X: 点集x坐标数组
+        Y: 点集y坐标数组
+        ax, ay: 线段起点
+        bx, by: 线段终点
+    返回:
+        距离数组
+    """
+    dx = bx - ax
+    dy = by - ay
+    length_square = dx * dx + dy * dy
+    if length_square == 0:
+        return np.hypot(X - ax, Y - ay)
+    t = np.clip(((X - ax) * dx + (Y - ay) * dy) / length_square, 0.0, 1.0)
+    return np.hypot(X - (ax + t * dx), Y - (ay + t * dy))
+
+
+def vertex_radius(X, Y, span):
+    """
+    求每个路径点处的曲率半径
+    用路径点前后各 span 米处的点和该点三点求外接圆半径，避免密集点上的定位噪声使半径偏小
+
+    参数:
+        X: 路径点x坐标数组
+        Y: 路径点y坐标数组
+        span: 前后取点的里程距离(米)
+    返回:
+        曲率半径数组(首尾点和共线点为无穷大)
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    count = len(X)
+    radius = np.full(count, np.inf)
+    if count < 3:
+        return radius
+
+    stations = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(X), np.diff(Y)))))
+    prev_index = (np.searchsorted(stations, stations - span, side='right') - 1).clip(0, count - 1)
+    next_index = np.searchsorted(stations, stations + span).clip(0, count - 1)
+
+    ax, ay = X[prev_index], Y[prev_index]
+    bx, by = X[next_index], Y[next_index]
+    # 外接圆半径 R = abc / (4 * 面积)
+    a = np.hypot(X - ax, Y - ay)
+    b = np.hypot(bx - X, by - Y)
+    c = np.hypot(bx - ax, by - ay)
+    double_area = np.abs((X - ax) * (by - ay) - (Y - ay) * (bx - ax))
+    valid = double_area > 1e-12
+    radius[valid] = a[valid] * b[valid] * c[valid] / (2 * double_area[valid])
+
+    return radius
+
+
+def simplify_index(X, Y, tolerance, curve_radius=None, curve_spacing=2.0, span=2.0):
+    """
+    Douglas-Peucker 折线简化(用栈迭代，不递归)
+    被删除的点到保留下来的相邻线段的距离都不超过 tolerance
+    曲率半径小于 curve_radius 的弯道上，保留点的间距不超过 curve_spacing，保证 compute_R 拟合有足够的点
+
+    参数:
+        X: 路径点x坐标序列
+        Y: 路径点y坐标序列
+        tolerance: 最大横向偏差(米)
+        curve_radius: 弯道判定半径(米)，None 表示不特殊处理弯道
+        curve_spacing: 弯道上保留点的最大间距(米)
+        span: 计算曲率半径时前后取点的里程距离(米)
+    返回:
+        保留点的下标数组
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    count = len(X)
+    if count < 3:
+        return np.arange(count)
+
+    if curve_radius is None:
+        in_curve = np.zeros(count, dtype=bool)
+    else:
+        in_curve = vertex_radius(X, Y, span) < curve_radius
+    # 前缀和用于 O(1) 判断一段路径中是否有弯道点
+    curve_count = np.concatenate(([0], np.cumsum(in_curve)))
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        inner_X = X[start + 1:end]
+        inner_Y = Y[start + 1:end]
+        distances = segment_distance(inner_X, inner_Y, X[start], Y[start], X[end], Y[end])
+        split = int(distances.argmax())
+
+        need_split = distances[split] > tolerance
+        if not need_split and curve_count[end] - curve_count[start + 1] > 0:
+            need_split = np.hypot(X[end] - X[start], Y[end] - Y[start]) > curve_spacing
+            if distances[split] == 0:
+                split = (end - start) // 2 - 1
+
+        if need_split:
+            split += start + 1
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return np.flatnonzero(keep)
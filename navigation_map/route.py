@@ -7,49 +7,111 @@
 # reload(sys)
 # sys.setdefaultencoding('utf-8') 
 
-import coordinate
-# from strelitzia_control.navigation_map import coordinate
+from . import coordinate
 import numbers
+import numpy as np
 import matplotlib.pyplot as plt
 
 
-def build_route(projected_coordinate0, projected_coordinate1, driveway=0):
+def build_route(*projected_coordinates, **kwargs):
     """
     通过多个坐标点对象建立路径信息(车道编号从行驶方向右到左增大)
 
     参数:
-        projected_coordinate1: 1号车道gnss点对象
-        projected_coordinate2: 2号车道gnss点对象
-        driveway: 当前车道号
+        projected_coordinates: 各车道gnss点对象，按车道编号排列
+        driveway: 当前车道号(也兼容旧的写法，作为最后一个位置参数传入)
+        closed: 是否为闭环路径(默认False)
     返回:
         路径信息对象
     """
-    projected_coordinate_tuple = (projected_coordinate0, projected_coordinate1)
-    route = Route(projected_coordinate_tuple, driveway)
+    driveway = kwargs.pop('driveway', 0)
+    closed = kwargs.pop('closed', False)
+    if kwargs:
+        raise TypeError('<func:build_route> unexpected keyword arguments {}'.format(tuple(kwargs)))
+
+    if projected_coordinates and isinstance(projected_coordinates[-1], numbers.Integral):
+        driveway = projected_coordinates[-1]
+        projected_coordinates = projected_coordinates[:-1]
+
+    route = Route(tuple(projected_coordinates), driveway, closed)
 
     return route
 
 
+def calcu_lateral_index(projected_coordinate_from, projected_coordinate_to, window=5, closed=False):
+    """
+    计算车道之间的横向下标映射
+    对 from 车道上的每个点，求出 to 车道上与之对应的最近点下标
+    先按归一化里程在 to 车道上定位，再在附近窗口内找最近点，避免全局最近点搜索
+
+    参数:
+        projected_coordinate_from: 起始车道坐标点对象
+        projected_coordinate_to: 目标车道坐标点对象
+        window: 局部搜索窗口的半宽(点数)
+        closed: 是否为闭环路径(闭环时窗口首尾相接，不要求下标单调)
+    返回:
+        lateral_index: 与起始车道点一一对应的目标车道下标数组
+    """
+    len_from = len(projected_coordinate_from)
+    len_to = len(projected_coordinate_to)
+    if len_from == 0 or len_to == 0:
+        return np.zeros(len_from, dtype=np.intp)
+
+    from_X, from_Y = projected_coordinate_from.as_array()
+    to_X, to_Y = projected_coordinate_to.as_array()
+
+    # 用归一化里程在目标车道上找出初始的对应点
+    from_stations = projected_coordinate_from.stations()
+    to_stations = projected_coordinate_to.stations()
+    from_ratio = from_stations / from_stations[-1] if from_stations[-1] > 0 else from_stations
+    to_ratio = to_stations / to_stations[-1] if to_stations[-1] > 0 else to_stations
+    guess = np.searchsorted(to_ratio, from_ratio).clip(0, len_to - 1)
+
+    # 两条车道点密度不同时按比例放大窗口
+    window = int(window * max(1.0, float(len_to) / len_from))
+    candidates = guess[:, None] + np.arange(-window, window + 1)
+    if closed:
+        candidates %= len_to
+    else:
+        candidates = candidates.clip(0, len_to - 1)
+    distances = np.hypot(to_X[candidates] - from_X[:, None], to_Y[candidates] - from_Y[:, None])
+    lateral_index = candidates[np.arange(len_from), distances.argmin(axis=1)]
+
+    if closed:
+        return lateral_index
+    # 保证映射的下标沿行驶方向不回退
+    return np.maximum.accumulate(lateral_index)
+
+
 class Route(object):
     """
-    构建一个有虚拟双车道的路径
-    可以通过 driveway_change 方法来切换路径
+    构建一个有多条虚拟车道的路径
+    可以通过 change 方法来切换路径
+    各车道之间的横向下标映射在建立路径时预先计算，切换车道时 O(1) 得到新车道上对应的下标
+    闭环路径的最后一个点和第一个点相连，下标按路径长度取模
     """
 
-    def __init__(self, projected_coordinate_tuple=(), driveway=0):
+    def __init__(self, projected_coordinate_tuple=(), driveway=0, closed=False):
         """
         通过多个坐标点对象建立路径信息(车道编号从行驶方向右到左增大)
 
         参数:
             projected_coordinate_tuple: 车道gnss点对象元组，每个元素是一条路径点集
             driveway: 当前车道号
+            closed: 是否为闭环路径
          """
         assert isinstance(projected_coordinate_tuple, tuple)
         self.projected_coordinate_tuple = projected_coordinate_tuple
         self.driveway_num = tuple(range(len(self.projected_coordinate_tuple)))
         self._driveway = driveway
+        self._closed = bool(closed)
         self.current_projected_coordinate = self.projected_coordinate_tuple[self.driveway]
 
+        # 车道间横向下标映射 self._lateral_index[i][j] 是车道 i 上每个点在车道 j 上的对应下标
+        self._lateral_index = [[None if i == j else calcu_lateral_index(icoordinate, jcoordinate, closed=self._closed)
+                                for j, jcoordinate in enumerate(self.projected_coordinate_tuple)]
+                               for i, icoordinate in enumerate(self.projected_coordinate_tuple)]
+
 
     @property
     def driveway(self):
@@ -66,12 +128,168 @@ class Route(object):
         return len(self.driveway_num)
 
 
-    def change(self, driveway):
+    @property
+    def closed(self):
+        """
+        返回是否为闭环路径
+        """
+        return self._closed
+
+
+    def lane_length(self, driveway=None):
+        """
+        返回车道的总长度，闭环路径包括最后一个点回到第一个点的距离
+
+        参数:
+            driveway: 车道号，默认为当前车道
+        返回:
+            车道总长度(米)
+        """
+        if driveway is None:
+            driveway = self._driveway
+        return self.projected_coordinate_tuple[driveway].length(self._closed)
+
+
+    def forward_distance(self, index_from, index_to, driveway=None):
+        """
+        求出沿行驶方向从 index_from 到 index_to 的路径距离(O(1))
+        闭环路径在终点处接回起点继续计算，开环路径 index_to 在后面时返回负数
+
+        参数:
+            index_from: 起始点下标
+            index_to: 终止点下标
+            driveway: 车道号，默认为当前车道
+        返回:
+            路径距离(米)
+        """
+        if driveway is None:
+            driveway = self._driveway
+        stations = self.projected_coordinate_tuple[driveway].stations()
+        distance = float(stations[index_to] - stations[index_from])
+        if self._closed and distance < 0:
+            distance += self.lane_length(driveway)
+        return distance
+
+
+    def station_of(self, x, y, driveway=None, hint=None, window=None):
+        """
+        求出位置在车道上的里程
+
+        参数:
+            x: 位置x坐标
+            y: 位置y坐标
+            driveway: 车道号，默认为当前车道
+            hint: 上次的点下标(可选)
+            window: 搜索窗口的半宽(点数)(可选)
+        返回:
+            s: 里程(米)
+            index: 投影所在线段的起点下标
+        """
+        if driveway is None:
+            driveway = self._driveway
+        return self.projected_coordinate_tuple[driveway].station_of(x, y, hint, window, self._closed)
+
+
+    def project(self, x, y, driveway=None, hint=None, window=None):
+        """
+        把位置投影到车道上最近的线段上
+
+        参数:
+            x: 位置x坐标
+            y: 位置y坐标
+            driveway: 车道号，默认为当前车道
+            hint: 上次的点下标(可选)
+            window: 搜索窗口的半宽(线段数)(可选)
+        返回:
+            index: 线段起点下标
+            t: 投影点在线段上的插值参数(0到1)
+            cross_track: 带符号的横向偏差(在行驶方向左侧为正)
+            heading: 线段的方向角(弧度)
+        """
+        if driveway is None:
+            driveway = self._driveway
+        return self.projected_coordinate_tuple[driveway].project(x, y, hint, window, self._closed)
+
+
+    def project_many(self, X, Y, driveway=None):
+        """
+        批量把位置投影到车道上最近的线段上(向量化)
+
+        参数:
+            X: 位置x坐标数组
+            Y: 位置y坐标数组
+            driveway: 车道号，默认为当前车道
+        返回:
+            index, t, cross_track, heading: 与 project 含义相同的数组
+        """
+        if driveway is None:
+            driveway = self._driveway
+        return self.projected_coordinate_tuple[driveway].project_many(X, Y, self._closed)
+
+
+    def point_at(self, s, driveway=None):
+        """
+        求出车道上里程处的插值点(O(log N))
+
+        参数:
+            s: 里程(米)，可以是数组
+            driveway: 车道号，默认为当前车道
+        返回:
+            x, y: 插值点坐标
+            heading: 所在线段的方向角(弧度)
+        """
+        if driveway is None:
+            driveway = self._driveway
+        return self.projected_coordinate_tuple[driveway].point_at(s, self._closed)
+
+
+    def remaining_distance(self, s, driveway=None):
+        """
+        求出车道上里程处到终点的距离(闭环路径为到起点的距离)
+
+        参数:
+            s: 里程(米)，可以是数组
+            driveway: 车道号，默认为当前车道
+        返回:
+            剩余距离(米)
+        """
+        if driveway is None:
+            driveway = self._driveway
+        return self.projected_coordinate_tuple[driveway].remaining_distance(s, self._closed)
+
+
+    def map_index(self, index, from_driveway, to_driveway=None):
+        """
+        把一条车道上的下标映射为另一条车道上对应点的下标(查表，O(1))
+
+        参数:
+            index: from_driveway 车道上的下标
+            from_driveway: 下标所在的车道号
+            to_driveway: 目标车道号，默认为当前车道
+        返回:
+            目标车道上对应点的下标
+        """
+        if to_driveway is None:
+            to_driveway = self._driveway
+        if from_driveway == to_driveway:
+            return index
+
+        return int(self._lateral_index[from_driveway][to_driveway][index])
+
+
+    def change(self, driveway, index=None):
         """
         切换路径
+
+        参数:
+            driveway: 目标车道号
+            index: 当前车道上的下标(可选)，给出时返回目标车道上对应点的下标
+        返回:
+            目标车道上对应点的下标，未给出 index 时返回 None
         """
         assert isinstance(driveway, numbers.Integral)
 
+        prev_driveway = self._driveway
         if self.driveway == driveway:
             print('It`s already in the driveway, don`t need to change.')
         else:
@@ -79,6 +297,10 @@ class Route(object):
                 self._driveway = driveway
                 self.current_projected_coordinate = self.projected_coordinate_tuple[self._driveway]
 
+        if index is None:
+            return None
+        return self.map_index(index, prev_driveway, self._driveway)
+
 
     def __len__(self):
         """
@@ -115,21 +337,80 @@ class Route(object):
         响应切片和索引操作
 
         返回:
-            切片后的新对象
+            切片后的新对象(Route，子类如换道路径的构造参数不同，也返回 Route)
             或是索引后的值
+        切片只在覆盖整条车道时保持闭环，截取的一段路径是开环路径
+        闭环路径上其他车道的对应路段跨过起点时，从起点前的部分接到起点后的部分
         '''
         self_class = type(self)
 
         if isinstance(index, slice):
-            new_projected_coordinate_tuple = (self.projected_coordinate_tuple[0][index], 
-                                              self.projected_coordinate_tuple[1][index])
-            return self_class(new_projected_coordinate_tuple, self.driveway)
+            # 按当前车道切片，其他车道用横向下标映射截取对应的路段
+            count = len(self.current_projected_coordinate)
+            start, stop, step = index.indices(count)
+            if step < 1:
+                raise ValueError('<class:Route> slice step must be positive')
+            new_projected_coordinate_list = []
+            for i, projected_coordinate in enumerate(self.projected_coordinate_tuple):
+                if i == self._driveway or start >= stop:
+                    new_projected_coordinate_list.append(projected_coordinate[start:stop:step])
+                    continue
+                lane_start = self.map_index(start, self._driveway, i)
+                lane_stop = self.map_index(stop - 1, self._driveway, i) + 1
+                if lane_stop > lane_start:
+                    new_projected_coordinate_list.append(projected_coordinate[lane_start:lane_stop:step])
+                elif self._closed:
+                    # 对应路段跨过闭环路径的起点
+                    X, Y = projected_coordinate.get()
+                    X = (list(X[lane_start:]) + list(X[:lane_stop]))[::step]
+                    Y = (list(Y[lane_start:]) + list(Y[:lane_stop]))[::step]
+                    new_projected_coordinate_list.append(type(projected_coordinate)(X, Y))
+                else:
+                    new_projected_coordinate_list.append(projected_coordinate[lane_start:lane_start])
+            closed = self._closed and start == 0 and stop == count and step == 1
+            return Route(tuple(new_projected_coordinate_list), self.driveway, closed)
         elif isinstance(index, numbers.Integral):
-            return self.current_projected_coordinate[index], self.current_projected_coordinate[index]
+            return self.current_projected_coordinate[index]
         else:
             msg = '{self_class.__name__} indices must be integers'
             raise TypeError(msg.format(self_class=self_class))
 
+    def resample(self, spacing, smooth=0.0, stop_radius=None):
+        """
+        对每条车道按弧长等间距重采样，返回新的路径对象(车道间横向下标映射重新计算)
+
+        参数:
+            spacing: 重采样的点间距(米)
+            smooth: 平滑的高斯核标准差(米)，0 表示不平滑
+            stop_radius: 停车点聚合的栅格大小(米)，None 表示不聚合
+        返回:
+            重采样后的新路径对象(Route，子类如换道路径的构造参数不同，也返回 Route)
+        """
+        new_projected_coordinate_tuple = tuple(projected_coordinate.resample(spacing, smooth, stop_radius, self._closed)
+                                               for projected_coordinate in self.projected_coordinate_tuple)
+        return Route(new_projected_coordinate_tuple, self.driveway, self._closed)
+
+
+    def simplify(self, tolerance, curve_radius=100, curve_spacing=2.0):
+        """
+        对每条车道做折线简化，返回新的路径对象(车道间横向下标映射重新计算)
+
+        参数:
+            tolerance: 最大横向偏差(米)
+            curve_radius: 弯道判定半径(米)
+            curve_spacing: 弯道上保留点的最大间距(米)
+        返回:
+            simplified: 简化后的新路径对象(Route)
+            ratios: 每条车道的压缩比元组
+        """
+        results = [projected_coordinate.simplify(tolerance, curve_radius, curve_spacing)
+                   for projected_coordinate in self.projected_coordinate_tuple]
+        simplified = Route(tuple(result[0] for result in results), self.driveway, self._closed)
+        ratios = tuple(result[1] for result in results)
+
+        return simplified, ratios
+
+
     def get(self):
         """
         获取当前使用的坐标点序列
@@ -147,7 +428,7 @@ class Route(object):
         返回:
             所有路径的坐标点序列
         """
-        return self.projected_coordinate_tuple[0].get(), self.projected_coordinate_tuple[1].get()
+        return tuple(projected_coordinate.get() for projected_coordinate in self.projected_coordinate_tuple)
 
 
 if __name__ == "__main__":
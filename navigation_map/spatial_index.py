@@ -0,0 +1,369 @@
+# -*- coding:utf-8 -*-
+"""
+路径线段的空间索引
+把路径所有车道的线段放入均匀栅格，按位置查询附近的候选线段，并把点投影到候选线段上
+@author: QinYu TianHao
+"""
+import math
+import numpy as np
+
+
+class SegmentGrid(object):
+    """
+    线段栅格索引
+    线段 k 连接车道 lanes[k] 上的第 starts[k] 个点和下一个点(闭环路径最后一个点的下一个点是第一个点)
+    栅格用压缩存储: 按栅格编号排序的线段编号数组加每个栅格的起止位置
+
+    cell_size: 栅格边长(米)\n
+    lanes: 每条线段所在的车道号数组\n
+    starts: 每条线段起点在车道上的下标数组
+    """
+
+    def __init__(self, lane_points, cell_size=10.0, closed=False):
+        """
+        建立线段栅格索引
+
+        参数:
+            lane_points: 各车道 (X, Y) 坐标序列的列表，如 route.get_all()
+            cell_size: 栅格边长(米)
+            closed: 是否为闭环路径
+        """
+        self.cell_size = float(cell_size)
+        self.closed = closed
+
+        lanes, starts, ax, ay, bx, by = [], [], [], [], [], []
+        for lane, (X, Y) in enumerate(lane_points):
+            X = np.asarray(X, dtype=np.float64)
+            Y = np.asarray(Y, dtype=np.float64)
+            count = len(X)
+            if count < 2:
+                continue
+            end_X = np.roll(X, -1) if closed else X[1:]
+            end_Y = np.roll(Y, -1) if closed else Y[1:]
+            segment_count = count if closed else count - 1
+            lanes.append(np.full(segment_count, lane, dtype=np.intp))
+            starts.append(np.arange(segment_count, dtype=np.intp))
+            ax.append(X[:segment_count])
+            ay.append(Y[:segment_count])
+            bx.append(end_X)
+            by.append(end_Y)
+
+        if lanes:
+            self.lanes = np.concatenate(lanes)
+            self.starts = np.concatenate(starts)
+            self._ax, self._ay = np.concatenate(ax), np.concatenate(ay)
+            self._bx, self._by = np.concatenate(bx), np.concatenate(by)
+        else:
+            self.lanes = self.starts = np.zeros(0, dtype=np.intp)
+            self._ax = self._ay = self._bx = self._by = np.zeros(0)
+        self._dx = self._bx - self._ax
+        self._dy = self._by - self._ay
+        self.lengths = np.hypot(self._dx, self._dy)
+        self.headings = np.arctan2(self._dy, self._dx)
+        # 所有线段的包围盒 (min_x, max_x, min_y, max_y)
+        if len(self.lanes):
+            all_X = np.concatenate((self._ax, self._bx))
+            all_Y = np.concatenate((self._ay, self._by))
+            self._bounds = (float(all_X.min()), float(all_X.max()), float(all_Y.min()), float(all_Y.max()))
+        else:
+            self._bounds = (0.0, 0.0, 0.0, 0.0)
+
+        self._build_cells()
+
+
+    def __len__(self):
+        return len(self.lanes)
+
+
+    def _cell_key(self, cell_X, cell_Y):
+        return (cell_X.astype(np.int64) << 32) + (cell_Y.astype(np.int64) & 0xffffffff)
+
+
+    def _build_cells(self):
+        """
+        把每条线段放入它包围盒覆盖的所有栅格
+        """
+        size = self.cell_size
+        min_X = np.floor(np.minimum(self._ax, self._bx) / size).astype(np.int64)
+        max_X = np.floor(np.maximum(self._ax, self._bx) / size).astype(np.int64)
+        min_Y = np.floor(np.minimum(self._ay, self._by) / size).astype(np.int64)
+        max_Y = np.floor(np.maximum(self._ay, self._by) / size).astype(np.int64)
+
+        span_X = max_X - min_X + 1
+        span_Y = max_Y - min_Y + 1
+        cover = span_X * span_Y
+        segment = np.repeat(np.arange(len(self.lanes)), cover)
+        # 每条线段覆盖的栅格在包围盒内的序号
+        local = np.arange(cover.sum()) - np.repeat(np.cumsum(cover) - cover, cover)
+        cell_X = np.repeat(min_X, cover) + local // np.repeat(span_Y, cover)
+        cell_Y = np.repeat(min_Y, cover) + local % np.repeat(span_Y, cover)
+
+        keys = self._cell_key(cell_X, cell_Y)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        self._segments = segment[order]
+        self._cell_keys, self._cell_starts = np.unique(keys, return_index=True)
+        self._cell_stops = np.append(self._cell_starts[1:], len(keys))
+
+
+    def _cell_segments(self, position):
+        """
+        展开栅格中的线段
+
+        参数:
+            position: 栅格在压缩存储中的序号数组
+        返回:
+            cell: 每条线段所在栅格在 position 中的序号数组
+            segments: 线段编号数组
+        """
+        starts = self._cell_starts[position]
+        lengths = self._cell_stops[position] - starts
+        cell = np.repeat(np.arange(len(position)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return cell, self._segments[offsets + np.repeat(starts, lengths)]
+
+
+    def query(self, x, y, radius):
+        """
+        查询 (x, y) 附近 radius 范围内栅格中的候选线段
+
+        参数:
+            x: 查询点x坐标
+            y: 查询点y坐标
+            radius: 查询半径(米)
+        返回:
+            候选线段编号数组(不重复)
+        """
+        size = self.cell_size
+        # 查询范围限制在包围盒内，远处的大半径查询不会产生大量空栅格
+        min_X, max_X, min_Y, max_Y = self._bounds
+        cell_X = np.arange(int(math.floor(max(x - radius, min_X) / size)), int(math.floor(min(x + radius, max_X) / size)) + 1)
+        cell_Y = np.arange(int(math.floor(max(y - radius, min_Y) / size)), int(math.floor(min(y + radius, max_Y) / size)) + 1)
+        if not len(cell_X) or not len(cell_Y):
+            return np.zeros(0, dtype=np.intp)
+        keys = self._cell_key(np.repeat(cell_X, len(cell_Y)), np.tile(cell_Y, len(cell_X)))
+
+        position = np.searchsorted(self._cell_keys, keys)
+        valid = position < len(self._cell_keys)
+        position, keys = position[valid], keys[valid]
+        position = position[self._cell_keys[position] == keys]
+        if len(position) == 0:
+            return np.zeros(0, dtype=np.intp)
+
+        return np.unique(self._cell_segments(position)[1])
+
+
+    def project(self, x, y, segments):
+        """
+        把点投影到线段上(对线段向量化)
+
+        参数:
+            x: 点x坐标
+            y: 点y坐标
+            segments: 线段编号数组
+        返回:
+            t: 投影点在线段上的插值参数(0到1)
+            distance: 点到线段的距离
+            cross_track: 带符号的横向偏差(点在线段前进方向左侧为正)
+        """
+        ax = self._ax[segments]
+        ay = self._ay[segments]
+        dx = self._dx[segments]
+        dy = self._dy[segments]
+        length_square = dx * dx + dy * dy
+        safe_square = np.where(length_square > 0, length_square, 1.0)
+        t = np.clip(((x - ax) * dx + (y - ay) * dy) / safe_square, 0.0, 1.0)
+        t = np.where(length_square > 0, t, 0.0)
+
+        distance = np.hypot(x - (ax + t * dx), y - (ay + t * dy))
+        cross = dx * (y - ay) - dy * (x - ax)
+        cross_track = np.copysign(distance, cross)
+
+        return t, distance, cross_track
+
+
+    def nearest(self, x, y, radius, max_candidates=None, per_lane=False):
+        """
+        查询附近的候选线段并按距离排序
+
+        参数:
+            x: 点x坐标
+            y: 点y坐标
+            radius: 查询半径(米)，只返回距离不超过 radius 的线段
+            max_candidates: 最多返回的线段数量
+            per_lane: 为 True 时 max_candidates 是每条车道的数量，点很密时平行车道的线段也不会被挤出候选
+        返回:
+            segments: 候选线段编号数组(由近到远)
+            t: 插值参数数组
+            distance: 距离数组
+            cross_track: 带符号的横向偏差数组
+        """
+        segments = self.query(x, y, radius)
+        t, distance, cross_track = self.project(x, y, segments)
+        keep = distance <= radius
+        segments, t, distance, cross_track = segments[keep], t[keep], distance[keep], cross_track[keep]
+
+        order = np.argsort(distance, kind='stable')
+        if max_candidates is not None and per_lane:
+            # 按距离排好序后再按车道稳定排序，每条车道内的名次小于 max_candidates 的线段保留
+            lanes = self.lanes[segments[order]]
+            by_lane = np.argsort(lanes, kind='stable')
+            sorted_lanes = lanes[by_lane]
+            first = np.searchsorted(sorted_lanes, sorted_lanes)
+            rank = np.empty(len(order), dtype=np.intp)
+            rank[by_lane] = np.arange(len(order)) - first
+            order = order[rank < max_candidates]
+        elif max_candidates is not None:
+            order = order[:max_candidates]
+
+        return segments[order], t[order], distance[order], cross_track[order]
+
+
+    def nearest_segment(self, x, y, lane=None, radius=None):
+        """
+        求出离点最近的线段
+        先查询 radius 范围内的候选线段，最近的候选线段比 radius 远时把范围扩大一倍再查，
+        范围覆盖整个索引后对所有线段计算
+
+        参数:
+            x: 点x坐标
+            y: 点y坐标
+            lane: 车道号，None 表示所有车道
+            radius: 初始查询半径(米)，默认为栅格边长
+        返回:
+            segment: 线段编号，索引中没有线段时为 None
+            t: 插值参数(0到1)
+            distance: 距离
+            cross_track: 带符号的横向偏差(左侧为正)
+        """
+        if not len(self.lanes):
+            return None, 0.0, 0.0, 0.0
+
+        min_X, max_X, min_Y, max_Y = self._bounds
+        # 点在包围盒外时从到包围盒的距离开始查询
+        outside = math.hypot(max(min_X - x, 0.0, x - max_X), max(min_Y - y, 0.0, y - max_Y))
+        extent = math.hypot(max(abs(x - min_X), abs(x - max_X)), max(abs(y - min_Y), abs(y - max_Y)))
+        radius = max(self.cell_size if radius is None else float(radius), outside)
+        while True:
+            exhausted = radius >= extent
+            if exhausted:
+                segments = np.arange(len(self.lanes)) if lane is None else np.flatnonzero(self.lanes == lane)
+            else:
+                segments = self.query(x, y, radius)
+                if lane is not None:
+                    segments = segments[self.lanes[segments] == lane]
+            if len(segments):
+                t, distance, cross_track = self.project(x, y, segments)
+                best = int(distance.argmin())
+                # 距离不超过查询半径时，范围外的线段不可能更近
+                if distance[best] <= radius or exhausted:
+                    return int(segments[best]), float(t[best]), float(distance[best]), float(cross_track[best])
+            if exhausted:
+                return None, 0.0, 0.0, 0.0
+            radius *= 2
+
+
+    def _nearest_in_cells(self, X, Y, lane, reach):
+        """
+        对每个点在周围 (2 * reach + 1)^2 个栅格的线段中求出最近的线段(向量化)
+        返回的距离不超过 reach 个栅格边长时一定是全局最近的线段
+        """
+        count = len(X)
+        segments = np.full(count, -1, dtype=np.intp)
+        t = np.zeros(count)
+        distance = np.full(count, np.inf)
+        cross_track = np.zeros(count)
+
+        size = self.cell_size
+        steps = np.arange(-reach, reach + 1, dtype=np.int64)
+        offset_X = np.repeat(steps, len(steps))
+        offset_Y = np.tile(steps, len(steps))
+        cell_X = np.floor(X / size).astype(np.int64)
+        cell_Y = np.floor(Y / size).astype(np.int64)
+        keys = self._cell_key((cell_X[:, None] + offset_X).reshape(-1), (cell_Y[:, None] + offset_Y).reshape(-1))
+        owners = np.repeat(np.arange(count), len(offset_X))
+
+        position = np.minimum(np.searchsorted(self._cell_keys, keys), len(self._cell_keys) - 1)
+        found = self._cell_keys[position] == keys
+        owners, position = owners[found], position[found]
+
+        # 展开为 (点, 候选线段) 对
+        cell, pair_segment = self._cell_segments(position)
+        pair_owner = owners[cell]
+        if lane is not None:
+            keep = self.lanes[pair_segment] == lane
+            pair_owner, pair_segment = pair_owner[keep], pair_segment[keep]
+        if not len(pair_owner):
+            return segments, t, distance, cross_track
+
+        ax = self._ax[pair_segment]
+        ay = self._ay[pair_segment]
+        dx = self._dx[pair_segment]
+        dy = self._dy[pair_segment]
+        px = X[pair_owner]
+        py = Y[pair_owner]
+        length_square = dx * dx + dy * dy
+        pair_t = np.clip(((px - ax) * dx + (py - ay) * dy) / np.where(length_square > 0, length_square, 1.0), 0.0, 1.0)
+        pair_t = np.where(length_square > 0, pair_t, 0.0)
+        pair_distance = np.hypot(px - (ax + pair_t * dx), py - (ay + pair_t * dy))
+        pair_cross = dx * (py - ay) - dy * (px - ax)
+
+        # 候选线段对按点的顺序排列，每个点取距离最小的线段，距离相同时取编号小的(与 nearest_segment 一致)
+        bounds = np.flatnonzero(np.r_[True, pair_owner[1:] != pair_owner[:-1]])
+        group_length = np.diff(np.append(bounds, len(pair_owner)))
+        nearest = pair_distance == np.repeat(np.minimum.reduceat(pair_distance, bounds), group_length)
+        candidate = np.where(nearest, pair_segment, len(self.lanes))
+        nearest &= pair_segment == np.repeat(np.minimum.reduceat(candidate, bounds), group_length)
+        first = np.flatnonzero(nearest)
+        first = first[np.r_[True, pair_owner[first[1:]] != pair_owner[first[:-1]]]]
+        owner = pair_owner[first]
+        segments[owner] = pair_segment[first]
+        t[owner] = pair_t[first]
+        distance[owner] = pair_distance[first]
+        cross_track[owner] = np.copysign(pair_distance[first], pair_cross[first])
+        return segments, t, distance, cross_track
+
+
+    def nearest_segments(self, X, Y, lane=None, max_reach=4):
+        """
+        批量求出离每个点最近的线段(向量化)
+        先在每个点周围的栅格中计算，没有足够近的线段的点把栅格范围扩大一倍再算，
+        范围超过 max_reach 个栅格后剩下的点逐个用 nearest_segment 计算
+
+        参数:
+            X: 点x坐标数组
+            Y: 点y坐标数组
+            lane: 车道号，None 表示所有车道
+            max_reach: 向量化计算的最大栅格范围
+        返回:
+            segments: 线段编号数组(索引中没有线段时为 -1)
+            t: 插值参数数组
+            distance: 距离数组
+            cross_track: 带符号的横向偏差数组
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1)
+        Y = np.asarray(Y, dtype=np.float64).reshape(-1)
+        count = len(X)
+        segments = np.full(count, -1, dtype=np.intp)
+        t = np.zeros(count)
+        distance = np.full(count, np.inf)
+        cross_track = np.zeros(count)
+        if count == 0 or not len(self.lanes):
+            return segments, t, distance, cross_track
+
+        pending = np.arange(count)
+        reach = 1
+        while len(pending) and reach <= max_reach:
+            result = self._nearest_in_cells(X[pending], Y[pending], lane, reach)
+            resolved = result[2] <= reach * self.cell_size
+            done = pending[resolved]
+            for array, values in zip((segments, t, distance, cross_track), result):
+                array[done] = values[resolved]
+            pending = pending[~resolved]
+            reach *= 2
+
+        for i in pending.tolist():
+            segment, t[i], distance[i], cross_track[i] = self.nearest_segment(X[i], Y[i], lane, reach * self.cell_size)
+            segments[i] = -1 if segment is None else segment
+
+        return segments, t, distance, cross_track
@@ -0,0 +1,140 @@
+# -*- coding:utf-8 -*-
+"""
+路径限速曲线
+根据路径曲率和横向、纵向加速度限制，每张地图预先计算一次沿路径的最高车速
+运行时按最近点下标 O(1) 查表得到当前限速
+@author: QinYu TianHao
+
+使用方法:
+    speed_profile = SpeedProfile(route, v_max=10, a_lat=2.0)
+    v_limit = speed_profile.speed_at(gnss_tracking.near_index)
+"""
+import numpy as np
+
+from . import refine
+
+
+def calcu_speed_limit(X, Y, v_max, a_lat, a_accel, a_decel, span=2.0, closed=False, v_end=0.0):
+    """
+    计算沿路径的限速曲线
+    先由曲率和横向加速度限制求出每个点的弯道限速，再正向按加速度限制、反向按减速度限制各扫描一遍
+
+    参数:
+        X: 路径点x坐标数组
+        Y: 路径点y坐标数组
+        v_max: 最高车速(米/秒)
+        a_lat: 最大横向加速度(米/秒^2)
+        a_accel: 最大纵向加速度(米/秒^2)
+        a_decel: 最大纵向减速度(米/秒^2，正数)
+        span: 计算曲率半径时前后取点的里程距离(米)
+        closed: 是否为闭环路径
+        v_end: 开环路径终点的车速(米/秒)，None 表示不限制
+    返回:
+        与路径点一一对应的限速数组
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    count = len(X)
+    if count == 0:
+        return np.zeros(0)
+
+    if closed and count > 2:
+        # 闭环路径前后各接一圈来计算首尾处的曲率
+        radius = refine.vertex_radius(np.tile(X, 3), np.tile(Y, 3), span)[count:2 * count]
+        steps = np.hypot(np.diff(X, append=X[0]), np.diff(Y, append=Y[0]))
+    else:
+        radius = refine.vertex_radius(X, Y, span)
+        steps = np.hypot(np.diff(X), np.diff(Y))
+
+    # 弯道限速 v = sqrt(a_lat * R)
+    speed = np.minimum(np.sqrt(a_lat * radius), v_max)
+    if not closed and v_end is not None:
+        speed[-1] = min(speed[-1], v_end)
+
+    # 闭环路径扫描两圈，使终点处的限制能传递到起点附近
+    laps = 2 if closed else 1
+    accel_2 = 2 * a_accel
+    decel_2 = 2 * a_decel
+    speed_list = speed.tolist()
+    step_list = steps.tolist()
+    for _ in range(laps):
+        for i in range(1, count + 1 if closed else count):
+            j = i % count
+            reachable = (speed_list[i - 1]**2 + accel_2 * step_list[i - 1])**0.5
+            if reachable < speed_list[j]:
+                speed_list[j] = reachable
+    for _ in range(laps):
+        for i in range(count - 2 if not closed else count - 1, -1, -1):
+            j = (i + 1) % count
+            reachable = (speed_list[j]**2 + decel_2 * step_list[i])**0.5
+            if reachable < speed_list[i]:
+                speed_list[i] = reachable
+
+    return np.array(speed_list)
+
+
+class SpeedProfile(object):
+    """
+    路径限速曲线
+    为路径的每条车道预先计算限速数组，下标和路径点下标一致
+
+    v_max: 最高车速(米/秒)\n
+    a_lat: 最大横向加速度(米/秒^2)\n
+    a_accel: 最大纵向加速度(米/秒^2)\n
+    a_decel: 最大纵向减速度(米/秒^2)
+    """
+
+    def __init__(self, route, v_max, a_lat=2.0, a_accel=1.0, a_decel=2.0, span=2.0, v_end=0.0):
+        """
+        初始化并计算所有车道的限速曲线
+
+        参数:
+            route: 路径对象
+            v_max: 最高车速(米/秒)
+            a_lat: 最大横向加速度(米/秒^2)
+            a_accel: 最大纵向加速度(米/秒^2)
+            a_decel: 最大纵向减速度(米/秒^2)
+            span: 计算曲率半径时前后取点的里程距离(米)
+            v_end: 开环路径终点的车速(米/秒)，None 表示不限制
+        """
+        self._route = route
+        self.v_max = v_max
+        self.a_lat = a_lat
+        self.a_accel = a_accel
+        self.a_decel = a_decel
+
+        self._speed = tuple(calcu_speed_limit(X, Y, v_max, a_lat, a_accel, a_decel, span, route.closed, v_end)
+                            for X, Y in route.get_all())
+
+
+    def __len__(self):
+        return len(self._speed[self._route.driveway])
+
+
+    def speed_at(self, index, driveway=None):
+        """
+        查询路径点处的限速(O(1))
+
+        参数:
+            index: 路径点下标(如最近点下标)
+            driveway: 车道号，默认为路径的当前车道
+        返回:
+            限速(米/秒)
+        """
+        if driveway is None:
+            driveway = self._route.driveway
+        return float(self._speed[driveway][index])
+
+
+    def get(self, driveway=None):
+        """
+        获取车道的整条限速数组
+
+        参数:
+            driveway: 车道号，默认为路径的当前车道
+        返回:
+            限速数组
+        """
+        if driveway is None:
+            driveway = self._route.driveway
+        return self._speed[driveway]
@@ -0,0 +1,411 @@
+# -*- coding:utf-8 -*-
+"""
+分块地图存储
+把路径点按固定大小的空间栅格分块存到磁盘，运行时按需读取车辆附近的块
+后台线程沿行驶方向预读，超过内存上限时淘汰最久未使用的块
+TiledRoute 提供和 Route 相同的接口，最近点搜索、前视点搜索和曲率计算可以直接在上面使用
+@author: QinYu TianHao
+
+使用方法:
+    build_tiles(route.current_projected_coordinate, 'map_tiles', tile_size=100)
+    tiled_route = TiledRoute('map_tiles', memory_cap=16 * 2**20)
+    tiled_route.update_pose(gnss_data.x, gnss_data.y, gnss_data.yaw)
+    wheel_degree = gnss_tracking.pure_tracking(gnss_data, tiled_route)
+"""
+import collections
+import json
+import math
+import os
+import threading
+import numpy as np
+
+
+INDEX_FILE = 'index.json'
+RUNS_FILE = 'runs.npy'
+TILE_FILE = 'tile_{}.npy'
+
+
+def build_tiles(projected_coordinate, directory, tile_size=100.0, closed=False):
+    """
+    把坐标点对象分块存储到目录中
+    路径点按 tile_size 大小的空间栅格分块，路径在同一个栅格中连续的一段点称为一个游程
+    每个块文件保存块中所有点的 (x, y, 全局下标)，游程表记录每个游程的起止下标、所在块和块内偏移
+
+    参数:
+        projected_coordinate: 投影坐标点对象
+        directory: 存储目录
+        tile_size: 块的边长(米)
+        closed: 是否为闭环路径
+    返回:
+        块的数量
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    X, Y = projected_coordinate.as_array()
+    count = len(X)
+    cell_X = np.floor(X / tile_size).astype(np.int64)
+    cell_Y = np.floor(Y / tile_size).astype(np.int64)
+
+    # 划分游程
+    run_starts = np.flatnonzero(np.concatenate(([True], (np.diff(cell_X) != 0) | (np.diff(cell_Y) != 0))))
+    run_stops = np.append(run_starts[1:], count)
+
+    # 给每个栅格编号
+    cells = {}
+    tiles = []
+    for start in run_starts.tolist():
+        cell = (int(cell_X[start]), int(cell_Y[start]))
+        if cell not in cells:
+            cells[cell] = len(tiles)
+            tiles.append([])
+        tiles[cells[cell]].append(start)
+
+    # 写入块文件并记录每个游程在块内的偏移
+    runs = np.zeros((len(run_starts), 4), dtype=np.int64)
+    run_position = dict((start, i) for i, start in enumerate(run_starts.tolist()))
+    for tile_id, starts in enumerate(tiles):
+        offset = 0
+        parts = []
+        for start in starts:
+            i = run_position[start]
+            stop = int(run_stops[i])
+            runs[i] = (start, stop, tile_id, offset)
+            parts.append(np.column_stack((X[start:stop], Y[start:stop], np.arange(start, stop, dtype=np.float64))))
+            offset += stop - start
+        np.save(os.path.join(directory, TILE_FILE.format(tile_id)), np.concatenate(parts))
+
+    np.save(os.path.join(directory, RUNS_FILE), runs)
+    index = {'tile_size': tile_size,
+             'length': count,
+             'closed': bool(closed),
+             'cells': [[cell[0], cell[1], tile_id] for cell, tile_id in cells.items()]}
+    with open(os.path.join(directory, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+
+    return len(tiles)
+
+
+class TiledAxis(object):
+    """
+    分块路径的坐标轴序列
+    像列表一样支持 len、下标和切片，访问时才读取需要的块
+    """
+
+    def __init__(self, tiled_route, axis):
+        self._route = tiled_route
+        self._axis = axis
+
+
+    def __len__(self):
+        return len(self._route)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._route.points(index)[:, self._axis]
+        return self._route.point(index)[self._axis]
+
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+    def nearest(self, x, y):
+        """
+        全局最近点搜索，只搜索 (x, y) 附近的块(calcu_near_point_index 会优先调用)
+        """
+        return self._route.near_index(x, y)
+
+
+class TiledRoute(object):
+    """
+    分块存储的单车道路径
+    提供和 Route 相同的接口(driveway, closed, map_index, get, len)，可以直接交给 GnssTracking 和 calcu_radius
+
+    memory_cap: 块缓存的内存上限(字节)\n
+    loads: 读取块的次数\n
+    hits: 块缓存命中次数\n
+    evictions: 淘汰块的次数
+    """
+
+    def __init__(self, directory, memory_cap=64 * 2**20, prefetch_distance=200.0, prefetch=True):
+        """
+        初始化分块路径，只读取索引
+
+        参数:
+            directory: 存储目录
+            memory_cap: 块缓存的内存上限(字节)
+            prefetch_distance: 沿行驶方向预读的距离(米)
+            prefetch: 是否启动后台预读线程
+        """
+        self._directory = directory
+        with open(os.path.join(directory, INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        self._tile_size = index['tile_size']
+        self._length = index['length']
+        self._closed = index['closed']
+        self._cells = dict(((ix, iy), tile_id) for ix, iy, tile_id in index['cells'])
+        # 所有块的编号范围 (min_ix, max_ix, min_iy, max_iy)
+        cell_X = [ix for ix, _ in self._cells]
+        cell_Y = [iy for _, iy in self._cells]
+        self._cell_bounds = (min(cell_X), max(cell_X), min(cell_Y), max(cell_Y)) if self._cells else (0, 0, 0, 0)
+
+        runs = np.load(os.path.join(directory, RUNS_FILE))
+        self._run_starts = runs[:, 0].copy()
+        self._run_stops = runs[:, 1].copy()
+        self._run_tiles = runs[:, 2].copy()
+        self._run_offsets = runs[:, 3].copy()
+
+        self._memory_cap = memory_cap
+        self._memory = 0
+        self._tiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+        self._axes = (TiledAxis(self, 0), TiledAxis(self, 1))
+
+        self._prefetch_distance = prefetch_distance
+        self._pose = None
+        self._pose_event = threading.Event()
+        self._running = prefetch
+        if prefetch:
+            self._prefetcher = threading.Thread(target=self._prefetch_loop, name='TiledRoutePrefetch')
+            self._prefetcher.daemon = True
+            self._prefetcher.start()
+
+
+    def __len__(self):
+        return self._length
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> directory:{} length:{} cached tiles:{} memory:{}'.format(
+            self_class.__name__, self._directory, self._length, len(self._tiles), self._memory)
+
+
+    @property
+    def driveway(self):
+        return 0
+
+
+    @property
+    def num_of_driveway(self):
+        return 1
+
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+    def map_index(self, index, from_driveway, to_driveway=None):
+        return index
+
+
+    def get(self):
+        """
+        获取坐标点序列(按需读取的序列对象)
+        """
+        return self._axes
+
+
+    def _tile(self, tile_id):
+        """
+        读取块(带LRU缓存)，超过内存上限时淘汰最久未使用的块
+        """
+        with self._lock:
+            tile = self._tiles.get(tile_id)
+            if tile is not None:
+                self._tiles.move_to_end(tile_id)
+                self.hits += 1
+                return tile
+
+        tile = np.load(os.path.join(self._directory, TILE_FILE.format(tile_id)))
+
+        with self._lock:
+            if tile_id not in self._tiles:
+                self._tiles[tile_id] = tile
+                self._memory += tile.nbytes
+                self.loads += 1
+                while self._memory > self._memory_cap and len(self._tiles) > 1:
+                    _, evicted = self._tiles.popitem(last=False)
+                    self._memory -= evicted.nbytes
+                    self.evictions += 1
+            return self._tiles.get(tile_id, tile)
+
+
+    def _run_of(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('<class:TiledRoute> index out of range')
+        return int(np.searchsorted(self._run_starts, index, side='right')) - 1, index
+
+
+    def point(self, index):
+        """
+        获取一个路径点
+
+        参数:
+            index: 路径点下标
+        返回:
+            (x, y) 坐标
+        """
+        run, index = self._run_of(index)
+        tile = self._tile(self._run_tiles[run])
+        row = tile[self._run_offsets[run] + index - self._run_starts[run]]
+        return row[0], row[1]
+
+
+    def points(self, index_slice):
+        """
+        获取一段路径点
+
+        参数:
+            index_slice: 下标切片
+        返回:
+            N x 2 的 (x, y) 数组
+        """
+        start, stop, step = index_slice.indices(self._length)
+        if start >= stop:
+            return np.zeros((0, 2))
+
+        parts = []
+        run = int(np.searchsorted(self._run_starts, start, side='right')) - 1
+        position = start
+        while position < stop:
+            run_stop = min(self._run_stops[run], stop)
+            tile = self._tile(self._run_tiles[run])
+            begin = self._run_offsets[run] + position - self._run_starts[run]
+            parts.append(tile[begin:begin + run_stop - position, :2])
+            position = run_stop
+            run += 1
+
+        return np.concatenate(parts)[::step]
+
+
+    def _cell_of(self, x, y):
+        return int(math.floor(x / self._tile_size)), int(math.floor(y / self._tile_size))
+
+
+    def _ring_cells(self, cell_X, cell_Y, ring):
+        """
+        以 (cell_X, cell_Y) 为中心的第 ring 圈块编号
+        """
+        if ring == 0:
+            return [(cell_X, cell_Y)]
+        cells = [(cell_X + dx, cell_Y + dy) for dx in range(-ring, ring + 1) for dy in (-ring, ring)]
+        cells.extend((cell_X + dx, cell_Y + dy) for dx in (-ring, ring) for dy in range(-ring + 1, ring))
+        return cells
+
+
+    def near_index(self, x, y):
+        """
+        全局最近点搜索，从 (x, y) 所在块开始逐圈向外读取块
+        第 ring 圈以外的点到 (x, y) 的距离不小于 ring 个块边长，找到的最近点在这个距离以内时停止
+
+        参数:
+            x: 当前车辆所在点的x坐标
+            y: 当前车辆所在点的y坐标
+        返回:
+            最近点的全局下标
+        """
+        cell_X, cell_Y = self._cell_of(x, y)
+        min_X, max_X, min_Y, max_Y = self._cell_bounds
+        # 搜索到这一圈时所有块都已经检查过
+        max_ring = max(cell_X - min_X, max_X - cell_X, cell_Y - min_Y, max_Y - cell_Y, 0)
+
+        best_index = 0
+        best_distance = None
+        ring = 0
+        while ring <= max_ring:
+            if 8 * ring > len(self._cells):
+                # 一圈的块编号比块数还多(离路径很远)，直接检查所有块
+                tile_ids = list(self._cells.values())
+                ring = max_ring
+            else:
+                tile_ids = [self._cells[cell] for cell in self._ring_cells(cell_X, cell_Y, ring) if cell in self._cells]
+
+            for tile_id in tile_ids:
+                tile = self._tile(tile_id)
+                distances = (tile[:, 0] - x)**2 + (tile[:, 1] - y)**2
+                i = int(distances.argmin())
+                if best_distance is None or distances[i] < best_distance:
+                    best_distance = distances[i]
+                    best_index = int(tile[i, 2])
+
+            if best_distance is not None and best_distance <= (ring * self._tile_size)**2:
+                break
+            ring += 1
+
+        return best_index
+
+
+    def update_pose(self, x, y, yaw):
+        """
+        通知预读线程当前车辆位姿(不阻塞)
+
+        参数:
+            x: 车辆x坐标
+            y: 车辆y坐标
+            yaw: 车辆航向角
+        """
+        self._pose = (x, y, yaw)
+        self._pose_event.set()
+
+
+    def prefetch(self, x, y, yaw):
+        """
+        读取车辆周围和行驶方向前方 prefetch_distance 以内的块
+        """
+        cells = set()
+        cell_X, cell_Y = self._cell_of(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cells.add((cell_X + dx, cell_Y + dy))
+
+        steps = int(self._prefetch_distance / self._tile_size * 2) + 1
+        for i in range(1, steps + 1):
+            distance = self._prefetch_distance * i / steps
+            cells.add(self._cell_of(x + distance * math.cos(yaw), y + distance * math.sin(yaw)))
+
+        for cell in cells:
+            tile_id = self._cells.get(cell)
+            if tile_id is not None:
+                self._tile(tile_id)
+
+
+    def _prefetch_loop(self):
+        """
+        后台预读线程
+        """
+        while self._running:
+            self._pose_event.wait()
+            self._pose_event.clear()
+            if not self._running:
+                break
+            self.prefetch(*self._pose)
+
+
+    def close(self):
+        """
+        结束后台预读线程
+        """
+        self._running = False
+        self._pose_event.set()
+
+
+    def stats(self):
+        """
+        返回块缓存统计
+        """
+        return {'cached_tiles': len(self._tiles),
+                'memory': self._memory,
+                'loads': self.loads,
+                'hits': self.hits,
+                'evictions': self.evictions}
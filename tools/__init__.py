@@ -6,4 +6,19 @@
 """
 # 包含:
 # 组件
-from .unit import change_system, trans_wheel_degree_format, EZdata, ShowMessage
\ No newline at end of file
+from .unit import change_system, trans_wheel_degree_format, EZdata, ShowMessage
+# 固定频率控制调度器
+from .scheduler import ControlScheduler, Stage
+# asyncio传感器数据接入前端
+from .ingestion import SensorIngestion, SensorStream, LatestMailbox, LocalMessageSource
+# CAN控制指令编码器
+from .can_encoder import CanCommandEncoder, CanFrame, FRAME_LAYOUTS
+# 变化驱动的CAN输出
+from .can_output import ChangeDrivenOutput, CONTINUOUS_IDS
+# 数值热点的计算核(python/numpy/numba 可切换)
+from . import kernels
+from .kernels import set_backend, get_backend, available_backends
+# 控制周期的内存分配分析
+from .profiling import AllocationProfiler, StageAllocation
+# 共享内存中的路径和控制状态
+from .shared_state import SharedRoute, SharedControlState, ControlState, STATE_FIELDS
\ No newline at end of file
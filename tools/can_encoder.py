@@ -0,0 +1,236 @@
+# -*- coding:utf-8 -*-
+"""
+CAN控制指令编码器
+预先编译方向盘(0x6c1)、油门(0x6c3)、刹车(0x6c5)、档位(0x6c7)报文的 struct 格式
+并重复使用预先分配的报文缓冲，每个控制周期不再新建消息
+@author: QinYu TianHao
+
+使用方法:
+    encoder = CanCommandEncoder()
+    for frame in encoder.encode(wheel_degree=wheel_degree, brake=0, gear=3):
+        can_send(frame.id, frame.payload())
+"""
+import struct
+
+
+# 报文格式: 名称 -> (CAN ID, struct 格式, 数据长度)
+# 方向盘: 控制模式(2:目标模式) + 方向盘目标值(1000 是回中) + 转动速度(0:慢速 1:中速 2:快速)
+# 油门: 油门量(暂时未使用)
+# 刹车: 刹车量(完全松开 0-8 完全踩下)
+# 档位: 档位(0:P 1:R 2:N 3:D)
+FRAME_LAYOUTS = {
+    'steering': (0x6c1, '>BHB', 4),
+    'throttle': (0x6c3, '>B', 1),
+    'brake':    (0x6c5, '>B2x', 3),
+    'gear':     (0x6c7, '>B2x', 3),
+}
+
+
+class CanFrame(object):
+    """
+    CAN报文
+    data 是预先分配的 8 字节缓冲，每次编码原地改写
+
+    id: CAN ID\n
+    dlc: 数据长度\n
+    data: 数据缓冲\n
+    fields: 最近一次编码的字段值(与 EZdata 写入 Data 的值相同)\n
+    value: 最近一次编码的控制量
+    """
+
+    __slots__ = ('name', 'id', 'dlc', 'data', 'fields', 'value', '_struct')
+
+    def __init__(self, name, can_id, fmt, dlc):
+        self.name = name
+        self.id = can_id
+        self.dlc = dlc
+        self.data = bytearray(8)
+        self.fields = ()
+        self.value = None
+        self._struct = struct.Struct(fmt)
+        if self._struct.size != dlc:
+            raise ValueError('<class:CanFrame> {} layout size {} not equal dlc {}'.format(
+                name, self._struct.size, dlc))
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> name:{} id:{:#x} dlc:{} data:{}'.format(
+            self_class.__name__, self.name, self.id, self.dlc, list(self.data[:self.dlc]))
+
+
+    def pack(self, *fields):
+        """
+        把字段原地编码进数据缓冲
+        """
+        self._struct.pack_into(self.data, 0, *fields)
+        self.fields = fields
+
+
+    def payload(self):
+        """
+        返回有效数据的只读视图(不复制)
+        """
+        return memoryview(self.data)[:self.dlc]
+
+
+    def to_msg(self, controlmsg):
+        """
+        把报文写入自定义的 ROS CAN 消息(与 EZdata 使用相同的报头属性和数据格式)
+        Data 中是字段值而不是编码后的字节，方向盘报文为 [控制模式, 方向盘目标值, 转动速度]，
+        和 EZdata 一样由接收方按字段解析；需要原始字节时使用 payload
+
+        参数:
+            controlmsg: 自定义ROS的消息类型
+        返回:
+            controlmsg
+        """
+        controlmsg.SendType   = 1
+        controlmsg.RemoteFlag = 0
+        controlmsg.ExternFlag = 0
+        controlmsg.ID = self.id
+        controlmsg.DataLen = self.dlc
+        controlmsg.Data = list(self.fields)
+        return controlmsg
+
+
+class CanCommandEncoder(object):
+    """
+    CAN控制指令编码器
+    方向盘角度在编码时直接完成 trans_wheel_degree_format 的目标模式转换(加 1000 和偏移校准量并取整)
+
+    steering_mode: 方向盘控制模式(默认 2 目标模式)\n
+    steering_speed: 方向盘转动速度(默认 2 快速)\n
+    wheel_degree_offset: 方向盘偏移校准量\n
+    wheel_degree_limit: 方向盘角度限幅(度)，None 表示不限幅
+    """
+
+    def __init__(self, steering_mode=2, steering_speed=2, wheel_degree_offset=-13, wheel_degree_limit=None,
+                 layouts=None):
+        """
+        初始化编码器并预先分配所有报文
+
+        参数:
+            steering_mode: 方向盘控制模式
+            steering_speed: 方向盘转动速度
+            wheel_degree_offset: 方向盘偏移校准量
+            wheel_degree_limit: 方向盘角度限幅(度)
+            layouts: 报文格式字典，默认使用 FRAME_LAYOUTS
+        """
+        if layouts is None:
+            layouts = FRAME_LAYOUTS
+
+        self._steering_mode = steering_mode
+        self._steering_speed = steering_speed
+        self._wheel_degree_offset = wheel_degree_offset
+        self._wheel_degree_limit = wheel_degree_limit
+
+        self._frames = dict((name, CanFrame(name, can_id, fmt, dlc)) for name, (can_id, fmt, dlc) in layouts.items())
+        self._steering = self._frames['steering']
+        self._throttle = self._frames['throttle']
+        self._brake = self._frames['brake']
+        self._gear = self._frames['gear']
+        # 每个控制周期重复使用的报文批次列表
+        self._batch = []
+
+
+    def __getitem__(self, name):
+        return self._frames[name]
+
+
+    def steering_target(self, wheel_degree):
+        """
+        把方向盘角度转换为目标模式的方向盘目标值(同 trans_wheel_degree_format)
+
+        参数:
+            wheel_degree: 方向盘角度
+        返回:
+            方向盘目标值(整数)
+        """
+        if self._wheel_degree_limit is not None:
+            wheel_degree = min(max(wheel_degree, -self._wheel_degree_limit), self._wheel_degree_limit)
+        return int(round(wheel_degree + 1000 + self._wheel_degree_offset))
+
+
+    def encode_steering(self, wheel_degree):
+        """
+        编码方向盘报文
+
+        参数:
+            wheel_degree: 方向盘角度(未转换格式)
+        返回:
+            方向盘报文
+        """
+        target = self.steering_target(wheel_degree)
+        frame = self._steering
+        frame.pack(self._steering_mode, target, self._steering_speed)
+        frame.value = target
+        return frame
+
+
+    def encode_throttle(self, value):
+        """
+        编码油门报文，控制量取整后编码
+        """
+        value = int(round(value))
+        frame = self._throttle
+        frame.pack(value)
+        frame.value = value
+        return frame
+
+
+    def encode_brake(self, value):
+        """
+        编码刹车报文，控制量取整后编码
+        """
+        value = int(round(value))
+        frame = self._brake
+        frame.pack(value)
+        frame.value = value
+        return frame
+
+
+    def encode_gear(self, value):
+        """
+        编码档位报文，控制量取整后编码
+        """
+        value = int(round(value))
+        frame = self._gear
+        frame.pack(value)
+        frame.value = value
+        return frame
+
+
+    def encode(self, wheel_degree=None, throttle=None, brake=None, gear=None):
+        """
+        编码一个控制周期的所有指令，为 None 的指令不发送
+        返回的列表和报文在下一次调用时会被改写，需要在本周期内发送完
+
+        参数:
+            wheel_degree: 方向盘角度(未转换格式)
+            throttle: 油门量
+            brake: 刹车量
+            gear: 档位
+        返回:
+            本周期要发送的报文列表
+        """
+        batch = self._batch
+        del batch[:]
+        if wheel_degree is not None:
+            batch.append(self.encode_steering(wheel_degree))
+        if throttle is not None:
+            batch.append(self.encode_throttle(throttle))
+        if brake is not None:
+            batch.append(self.encode_brake(brake))
+        if gear is not None:
+            batch.append(self.encode_gear(gear))
+        return batch
+
+
+if __name__ == '__main__':
+    """
+    函数功能测试
+    """
+    encoder = CanCommandEncoder()
+    for frame in encoder.encode(wheel_degree=35.4, brake=0, gear=3):
+        print(frame)
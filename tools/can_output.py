@@ -0,0 +1,142 @@
+# -*- coding:utf-8 -*-
+"""
+变化驱动的CAN输出
+按CAN ID记录上次发送的控制量，只有变化超过死区或者超过保活间隔时才发送，降低总线负载
+死区只用于连续的控制量(方向盘、油门)，刹车和档位这类离散指令一变化就发送
+@author: QinYu TianHao
+
+使用方法:
+    encoder = CanCommandEncoder()
+    output = ChangeDrivenOutput(deadband={0x6c1: 1}, keep_alive=0.2)
+    for frame in output.filter(encoder.encode(wheel_degree=wheel_degree, brake=0, gear=3)):
+        can_send(frame.id, frame.payload())
+"""
+import numbers
+import time
+
+from .can_encoder import FRAME_LAYOUTS
+
+
+# 连续控制量的CAN ID(方向盘、油门)，数值死区只用于这些报文
+CONTINUOUS_IDS = (FRAME_LAYOUTS['steering'][0], FRAME_LAYOUTS['throttle'][0])
+
+
+class ChangeDrivenOutput(object):
+    """
+    变化驱动的CAN输出级
+    报文的控制量和上次发送的控制量之差超过死区，或者距离上次发送超过保活间隔时才发送
+
+    keep_alive: 保活间隔(秒)\n
+    sent: 以CAN ID为键的发送报文数\n
+    suppressed: 以CAN ID为键的抑制报文数
+    """
+
+    def __init__(self, deadband=0, keep_alive=0.5, clock=time.monotonic, continuous_ids=None):
+        """
+        初始化输出级
+
+        参数:
+            deadband: 死区，可以是连续控制量共用的数值(其他报文死区为0)，也可以是以CAN ID为键的字典(未给出的ID死区为0)
+            keep_alive: 保活间隔(秒)，None 表示不做保活
+            clock: 单调时钟函数
+            continuous_ids: 使用共用数值死区的CAN ID，默认为 CONTINUOUS_IDS
+        """
+        if continuous_ids is None:
+            continuous_ids = CONTINUOUS_IDS
+
+        if isinstance(deadband, numbers.Number):
+            deadband = dict((can_id, deadband) for can_id in continuous_ids)
+        self._deadband = deadband
+        self._keep_alive = keep_alive
+        self._clock = clock
+
+        # 以CAN ID为键的上次发送控制量和发送时刻
+        self._last_value = {}
+        self._last_time = {}
+        # 每个控制周期重复使用的发送列表
+        self._output = []
+
+        self.sent = {}
+        self.suppressed = {}
+
+
+    def _get_deadband(self, can_id):
+        return self._deadband.get(can_id, 0)
+
+
+    def should_send(self, can_id, value, now=None):
+        """
+        判断一个控制量是否需要发送，需要发送时记录为已发送
+
+        参数:
+            can_id: CAN ID
+            value: 控制量
+            now: 当前时刻，默认取当前时钟
+        返回:
+            需要发送返回True, 否则返回False
+        """
+        if now is None:
+            now = self._clock()
+
+        last_value = self._last_value.get(can_id)
+        send = (last_value is None or value is None
+                or abs(value - last_value) > self._get_deadband(can_id)
+                or (self._keep_alive is not None and now - self._last_time[can_id] >= self._keep_alive))
+
+        if send:
+            self._last_value[can_id] = value
+            self._last_time[can_id] = now
+            self.sent[can_id] = self.sent.get(can_id, 0) + 1
+        else:
+            self.suppressed[can_id] = self.suppressed.get(can_id, 0) + 1
+
+        return send
+
+
+    def filter(self, frames, now=None):
+        """
+        从一个控制周期的报文中选出需要发送的报文
+        返回的列表在下一次调用时会被改写
+
+        参数:
+            frames: 报文序列(带有 id 和 value 属性，如 CanCommandEncoder.encode 的返回值)
+            now: 当前时刻，默认取当前时钟
+        返回:
+            需要发送的报文列表
+        """
+        if now is None:
+            now = self._clock()
+
+        output = self._output
+        del output[:]
+        for frame in frames:
+            if self.should_send(frame.id, frame.value, now):
+                output.append(frame)
+        return output
+
+
+    def reset(self, can_id=None):
+        """
+        清除上次发送的记录，下一次必定发送(如重新连接总线后)
+
+        参数:
+            can_id: 要清除的CAN ID，None 表示全部清除
+        """
+        if can_id is None:
+            self._last_value.clear()
+            self._last_time.clear()
+        else:
+            self._last_value.pop(can_id, None)
+            self._last_time.pop(can_id, None)
+
+
+    def stats(self):
+        """
+        返回发送统计
+
+        返回:
+            以CAN ID为键的 {'sent': 发送数, 'suppressed': 抑制数} 字典
+        """
+        can_ids = set(self.sent) | set(self.suppressed)
+        return dict((can_id, {'sent': self.sent.get(can_id, 0), 'suppressed': self.suppressed.get(can_id, 0)})
+                    for can_id in can_ids)
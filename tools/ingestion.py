@@ -0,0 +1,451 @@
+# -*- coding:utf-8 -*-
+"""
+基于 asyncio 的传感器数据接入前端
+每个传感器数据流在自己的任务中解码，结果放入只保存最新值的单槽信箱
+控制器无锁读取所有信箱的快照，来不及解码的旧帧直接计数丢弃而不排队
+@author: QinYu TianHao
+
+使用方法:
+    ingestion = SensorIngestion()
+    ingestion.add_stream('gnss', gnss_source, sia.msg_to_gnssdata, max_age=0.2)
+    ingestion.add_stream('object', object_source, sia.msg_to_objectdata, max_age=0.3)
+    await ingestion.run()
+    ...
+    snapshot = ingestion.snapshot()
+    gnss_data = snapshot['gnss'].value
+"""
+import asyncio
+import collections
+import threading
+import time
+
+
+# 信箱中的一条记录: 序号、时间戳、数据值
+Sample = collections.namedtuple('Sample', ('seq', 'stamp', 'value'))
+
+EMPTY_SAMPLE = Sample(0, None, None)
+
+
+class LatestMailbox(object):
+    """
+    单槽最新值信箱
+    新值直接覆盖旧值，每次写入序号加一
+    写入的是一个不可变元组，单次属性赋值即完成替换，所以读取时不需要加锁也能得到一致的记录
+
+    written: 写入次数\n
+    overwritten: 未被读取就被覆盖的次数(丢弃帧)\n
+    stale: 读取时数据已经超过最大时效的次数
+    """
+
+    def __init__(self, max_age=None, clock=time.time):
+        """
+        初始化信箱
+
+        参数:
+            max_age: 数据最大时效(秒)，None 表示不检查
+            clock: 时间戳使用的时钟函数
+        """
+        self._sample = EMPTY_SAMPLE
+        self._read_seq = 0
+        self._max_age = max_age
+        self._clock = clock
+
+        self.written = 0
+        self.overwritten = 0
+        self.stale = 0
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> seq:{} written:{} overwritten:{} stale:{}'.format(
+            self_class.__name__, self._sample.seq, self.written, self.overwritten, self.stale)
+
+
+    @property
+    def seq(self):
+        return self._sample.seq
+
+
+    def put(self, value, stamp=None):
+        """
+        写入新值
+
+        参数:
+            value: 数据值
+            stamp: 数据时间戳，默认取当前时钟
+        返回:
+            seq: 写入后的序号
+        """
+        if stamp is None:
+            stamp = self._clock()
+        prev_seq = self._sample.seq
+        if prev_seq > self._read_seq:
+            self.overwritten += 1
+
+        self._sample = Sample(prev_seq + 1, stamp, value)
+        self.written += 1
+
+        return prev_seq + 1
+
+
+    def peek(self):
+        """
+        读取最新记录，不改变已读序号
+        """
+        return self._sample
+
+
+    def get(self, now=None):
+        """
+        读取最新记录并记为已读
+
+        参数:
+            now: 当前时刻，用来判断数据是否过期，默认取当前时钟
+        返回:
+            sample: (seq, stamp, value) 记录，没有数据时 seq 为 0
+        """
+        sample = self._sample
+        if sample.seq > self._read_seq:
+            self._read_seq = sample.seq
+        if self.is_stale(sample, now):
+            self.stale += 1
+
+        return sample
+
+
+    def is_stale(self, sample=None, now=None):
+        """
+        判断记录是否过期
+
+        参数:
+            sample: 要判断的记录，默认为最新记录
+            now: 当前时刻，默认取当前时钟
+        返回:
+            过期返回True, 未过期或者不检查时效返回False
+        """
+        if sample is None:
+            sample = self._sample
+        if self._max_age is None or sample.stamp is None:
+            return False
+        if now is None:
+            now = self._clock()
+
+        return now - sample.stamp > self._max_age
+
+
+    def stats(self):
+        """
+        返回信箱统计
+        """
+        return {'seq': self._sample.seq,
+                'written': self.written,
+                'overwritten': self.overwritten,
+                'stale': self.stale}
+
+
+class LocalMessageSource(object):
+    """
+    本地消息源
+    用于测试时代替 ROS 订阅，是一个异步迭代器
+    可以给定消息列表按固定周期输出，也可以通过 push 方法实时推入消息
+    """
+
+    def __init__(self, messages=(), period=0.0, repeat=False):
+        """
+        初始化本地消息源
+
+        参数:
+            messages: 预先给定的消息序列
+            period: 输出消息的周期(秒)
+            repeat: 预先给定的消息输出完后是否重复输出
+        """
+        self._messages = tuple(messages)
+        self._period = period
+        self._repeat = repeat
+        self._queue = None
+        self._closed = False
+
+
+    def _get_queue(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+
+    def push(self, msg):
+        """
+        推入一条消息(需在事件循环线程中调用)
+        """
+        self._get_queue().put_nowait(msg)
+
+
+    def close(self):
+        """
+        结束消息源
+        """
+        self._closed = True
+        self._get_queue().put_nowait(None)
+
+
+    async def __aiter__(self):
+        while True:
+            for msg in self._messages:
+                if self._closed:
+                    return
+                yield msg
+                await asyncio.sleep(self._period)
+            if not (self._repeat and self._messages):
+                break
+
+        # 预先给定的消息输出完后，继续输出推入的消息直到结束
+        queue = self._get_queue()
+        while not self._closed or not queue.empty():
+            msg = await queue.get()
+            if msg is None:
+                return
+            yield msg
+
+
+class SensorStream(object):
+    """
+    单个传感器数据流
+    接收任务只把原始消息放入原始信箱，解码任务总是取最新的原始消息解码
+    解码慢时积压的原始消息被覆盖(计为丢弃帧)，不会排队增加延迟
+
+    name: 数据流名称\n
+    raw: 原始消息信箱\n
+    decoded: 解码后的数据信箱\n
+    errors: 解码出错的次数\n
+    last_error: 最近一次解码抛出的异常，没有出错时为 None
+    """
+
+    def __init__(self, name, source, decoder, max_age=None, offload=True, executor=None, clock=time.time):
+        """
+        初始化数据流
+
+        参数:
+            name: 数据流名称
+            source: 异步可迭代的消息源
+            decoder: 解码函数，如 msg_to_gnssdata
+            max_age: 数据最大时效(秒)
+            offload: 是否在线程池中解码，避免慢解码阻塞事件循环中的其他数据流
+            executor: 解码使用的执行器，None 使用事件循环默认的线程池
+            clock: 时间戳使用的时钟函数
+        """
+        self.name = name
+        self.source = source
+        self.decoder = decoder
+        self.offload = offload
+        self.executor = executor
+        self.raw = LatestMailbox(clock=clock)
+        self.decoded = LatestMailbox(max_age, clock)
+        self.errors = 0
+        self.last_error = None
+
+        self._clock = clock
+        self._event = None
+
+
+    def feed(self, msg, stamp=None):
+        """
+        放入一条原始消息并唤醒解码任务(需在事件循环线程中调用)
+        """
+        self.raw.put(msg, stamp)
+        if self._event is not None:
+            self._event.set()
+
+
+    async def receive(self):
+        """
+        接收任务，从消息源读取原始消息
+        """
+        async for msg in self.source:
+            self.feed(msg)
+
+
+    async def decode(self):
+        """
+        解码任务，总是解码最新的原始消息，解码结果沿用原始消息的时间戳
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._event.wait()
+            self._event.clear()
+
+            sample = self.raw.get()
+            try:
+                if self.offload:
+                    value = await loop.run_in_executor(self.executor, self.decoder, sample.value)
+                else:
+                    value = self.decoder(sample.value)
+            except Exception as error:
+                # 解码出错不能中断数据流，记下异常由 stats 报告
+                self.errors += 1
+                self.last_error = error
+                continue
+            self.decoded.put(value, sample.stamp)
+
+
+    def stats(self):
+        """
+        返回数据流统计
+
+        返回:
+            received: 接收的原始消息数
+            dropped: 未被解码就被覆盖的消息数
+            decoded: 解码完成的消息数
+            stale: 控制器读到过期数据的次数
+            errors: 解码出错的次数
+            last_error: 最近一次解码抛出的异常
+        """
+        return {'received': self.raw.written,
+                'dropped': self.raw.overwritten,
+                'decoded': self.decoded.written,
+                'stale': self.decoded.stale,
+                'errors': self.errors,
+                'last_error': self.last_error}
+
+
+class SensorIngestion(object):
+    """
+    传感器数据接入前端
+    管理多个传感器数据流，每个数据流有独立的接收任务和解码任务
+    """
+
+    def __init__(self, clock=time.time):
+        """
+        初始化数据接入前端
+
+        参数:
+            clock: 时间戳使用的时钟函数
+        """
+        self._clock = clock
+        self._streams = collections.OrderedDict()
+        self._tasks = []
+        self._loop = None
+        # 保护 self._loop 的切换，事件循环启动前后放入的消息都不会丢
+        self._loop_lock = threading.Lock()
+
+
+    def __getitem__(self, name):
+        return self._streams[name]
+
+
+    def __iter__(self):
+        return (stream for stream in self._streams.values())
+
+
+    def add_stream(self, name, source, decoder, max_age=None, offload=True, executor=None):
+        """
+        添加一个传感器数据流
+
+        参数:
+            name: 数据流名称
+            source: 异步可迭代的消息源，None 表示只通过 feed_threadsafe 接收消息(如ROS回调)
+            decoder: 解码函数
+            max_age: 数据最大时效(秒)
+            offload: 是否在线程池中解码
+            executor: 解码使用的执行器
+        返回:
+            stream: 数据流对象
+        """
+        if name in self._streams:
+            raise ValueError('<class:SensorIngestion> stream {} already exists'.format(name))
+        stream = SensorStream(name, source, decoder, max_age, offload, executor, self._clock)
+        self._streams[name] = stream
+        return stream
+
+
+    async def run(self):
+        """
+        启动所有数据流的接收任务和解码任务(立即返回，任务在后台运行)
+        启动前通过 feed_threadsafe 放入的最新消息在启动后立即解码
+        """
+        if self._loop is not None:
+            raise RuntimeError('<class:SensorIngestion> already running')
+        with self._loop_lock:
+            for stream in self._streams.values():
+                stream._event = asyncio.Event()
+                if stream.raw.seq:
+                    stream._event.set()
+            self._loop = asyncio.get_running_loop()
+        for stream in self._streams.values():
+            self._tasks.append(asyncio.ensure_future(stream.decode()))
+            if stream.source is not None:
+                self._tasks.append(asyncio.ensure_future(stream.receive()))
+
+
+    async def stop(self):
+        """
+        取消所有后台任务，之后放入的消息重新缓存到下一次 run
+        """
+        with self._loop_lock:
+            self._loop = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+    def feed_threadsafe(self, name, msg):
+        """
+        从其他线程(如ROS回调线程)放入一条原始消息
+        时间戳在接收时刻记录，解码在事件循环中进行，回调线程不会被解码阻塞
+        事件循环还没有启动时(如ROS订阅先于 run 建立)消息直接放入原始信箱，只保留最新的一条，启动后解码
+
+        参数:
+            name: 数据流名称
+            msg: 原始消息
+        """
+        stream = self._streams.get(name)
+        if stream is None:
+            raise KeyError('<class:SensorIngestion> unknown stream {}'.format(name))
+        stamp = self._clock()
+        with self._loop_lock:
+            if self._loop is None:
+                stream.raw.put(msg, stamp)
+                return
+            self._loop.call_soon_threadsafe(stream.feed, msg, stamp)
+
+
+    def snapshot(self, now=None):
+        """
+        读取所有数据流的最新解码数据
+        不需要加锁，每条记录都是完整一致的
+
+        参数:
+            now: 当前时刻，用来判断数据是否过期
+        返回:
+            以数据流名称为键的 (seq, stamp, value) 记录字典
+        """
+        if now is None:
+            now = self._clock()
+        return dict((name, stream.decoded.get(now)) for name, stream in self._streams.items())
+
+
+    def stats(self):
+        """
+        返回所有数据流的统计
+        """
+        return dict((name, stream.stats()) for name, stream in self._streams.items())
+
+
+if __name__ == '__main__':
+    """
+    函数功能测试
+    """
+    def slow_decoder(msg):
+        time.sleep(0.05)
+        return msg
+
+    async def main():
+        ingestion = SensorIngestion()
+        ingestion.add_stream('gnss', LocalMessageSource(range(100), 0.01), lambda msg: msg, max_age=0.1)
+        ingestion.add_stream('object', LocalMessageSource(range(100), 0.01), slow_decoder, max_age=0.1)
+        await ingestion.run()
+        await asyncio.sleep(1.2)
+        print(ingestion.snapshot())
+        print(ingestion.stats())
+        await ingestion.stop()
+
+    asyncio.run(main())
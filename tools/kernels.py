@@ -0,0 +1,450 @@
+# -*- coding:utf-8 -*-
+"""
+数值热点的计算核
+最近点搜索、前视点的路径行走、坐标系转换和警戒区计数各有三种实现:
+    python: 原来的纯Python逐点循环
+    numpy: 数组运算
+    numba: 用Numba即时编译的循环(安装了numba时才可用)
+三种实现的结果完全相同，可以在运行时切换，默认使用可用的最快实现
+@author: QinYu TianHao
+
+使用方法:
+    from strelitzia_control.tools import kernels
+    kernels.set_backend('numpy')
+    near_index = kernels.nearest_index(x, y, navi_X, navi_Y)
+运行本模块比较各实现的速度:
+    python -m strelitzia_control.tools.kernels
+"""
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+BACKENDS = ('python', 'numpy', 'numba')
+
+_backend = 'numba' if numba is not None else 'numpy'
+
+
+def available_backends():
+    """
+    返回当前环境可用的实现名称
+    """
+    if numba is None:
+        return ('python', 'numpy')
+    return BACKENDS
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(name):
+    """
+    切换计算核的实现
+
+    参数:
+        name: 'python', 'numpy' 或 'numba'
+    返回:
+        切换前的实现名称
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError('<func:set_backend> backend must be in {}'.format(BACKENDS))
+    if name == 'numba' and numba is None:
+        raise ValueError('<func:set_backend> numba is not installed')
+    previous = _backend
+    _backend = name
+    return previous
+
+
+def _as_array(values):
+    if isinstance(values, np.ndarray) and values.dtype == np.float64:
+        return values
+    return np.asarray(values, dtype=np.float64)
+
+
+def _take(values, indexes):
+    """
+    取出序列中的部分元素，不是数组的序列(列表、分块路径)只读取需要的元素
+    """
+    if isinstance(values, np.ndarray):
+        return values[indexes]
+    return np.array([values[i] for i in indexes.tolist()], dtype=np.float64)
+
+
+# -------------------------------------------------------------------------------------------------
+# 纯Python实现
+
+def _nearest_index_python(x, y, X, Y, start, stop):
+    best_index = start
+    best_distance = None
+    for i in range(start, stop):
+        distance = math.sqrt((x - X[i])**2 + (y - Y[i])**2)
+        if best_distance is None or distance < best_distance:
+            best_distance = distance
+            best_index = i
+    return best_index
+
+
+def _nearest_index_wrapped_python(x, y, X, Y, hint, window):
+    length = len(X)
+    best_index = hint % length
+    best_distance = None
+    for offset in range(-window, window + 1):
+        i = (hint + offset) % length
+        distance = math.sqrt((x - X[i])**2 + (y - Y[i])**2)
+        if best_distance is None or distance < best_distance:
+            best_distance = distance
+            best_index = i
+    return best_index
+
+
+def _walk_forward_python(X, Y, index, distance, closed):
+    length = len(X)
+    L = 0.0
+    if closed:
+        steps = 0
+        while distance > L and steps < length:
+            next_index = (index + 1) % length
+            dx = X[next_index] - X[index]
+            dy = Y[next_index] - Y[index]
+            L += math.sqrt(dx**2 + dy**2)
+            index = next_index
+            steps += 1
+        return index
+
+    while distance > L and index + 1 < length:
+        dx = X[index + 1] - X[index]
+        dy = Y[index + 1] - Y[index]
+        L += math.sqrt(dx**2 + dy**2)
+        index += 1
+    return index
+
+
+def _change_system_python(theta, a, b, X, Y):
+    cos_theta = math.cos(theta)
+    sin_theta = math.sin(theta)
+    X1 = []
+    Y1 = []
+    for ix, iy in zip(X, Y):
+        ix = ix - a
+        iy = iy - b
+        X1.append(ix * cos_theta + iy * sin_theta)
+        Y1.append(iy * cos_theta - ix * sin_theta)
+    return X1, Y1
+
+
+def _zone_counts_python(X, Y, length, zones):
+    counts = [0] * len(zones)
+    for x, y in zip(X, Y):
+        if x <= length:
+            for i, (y_min, y_max) in enumerate(zones):
+                if y_min <= y <= y_max:
+                    counts[i] += 1
+    return counts
+
+
+# -------------------------------------------------------------------------------------------------
+# NumPy实现
+
+def _nearest_index_numpy(x, y, X, Y, start, stop):
+    X = _as_array(X[start:stop])
+    Y = _as_array(Y[start:stop])
+    dx = x - X
+    dy = y - Y
+    return int(np.sqrt(dx * dx + dy * dy).argmin()) + start
+
+
+def _nearest_index_wrapped_numpy(x, y, X, Y, hint, window):
+    length = len(X)
+    indexes = np.arange(hint - window, hint + window + 1) % length
+    dx = x - _take(X, indexes)
+    dy = y - _take(Y, indexes)
+    return int(indexes[np.sqrt(dx * dx + dy * dy).argmin()])
+
+
+def _walk_forward_numpy(X, Y, index, distance, closed):
+    length = len(X)
+    L = 0.0
+    steps = 0
+    limit = length if closed else length - 1 - index
+    chunk = 64
+    # 每次取一段路径点计算累计距离，不够时加倍继续，避免每次都计算整条路径
+    while distance > L and steps < limit:
+        count = min(chunk, limit - steps)
+        if closed:
+            indexes = np.arange(index, index + count + 1) % length
+        else:
+            indexes = np.arange(index, index + count + 1)
+        segment_X = _take(X, indexes)
+        segment_Y = _take(Y, indexes)
+        dx = np.diff(segment_X)
+        dy = np.diff(segment_Y)
+        # 和逐点累加的顺序相同，结果和纯Python实现一致
+        cumulative = np.cumsum(np.concatenate(([L], np.sqrt(dx * dx + dy * dy))))[1:]
+        reached = cumulative >= distance
+        if reached.any():
+            step = int(reached.argmax()) + 1
+            return (index + step) % length if closed else index + step
+        L = float(cumulative[-1])
+        index = (index + count) % length if closed else index + count
+        steps += count
+        chunk *= 2
+    return index
+
+
+def _change_system_numpy(theta, a, b, X, Y):
+    X = _as_array(X) - a
+    Y = _as_array(Y) - b
+    cos_theta = math.cos(theta)
+    sin_theta = math.sin(theta)
+    return (X * cos_theta + Y * sin_theta).tolist(), (Y * cos_theta - X * sin_theta).tolist()
+
+
+def _zone_counts_numpy(X, Y, length, zones):
+    X = _as_array(X)
+    Y = _as_array(Y)
+    near = X <= length
+    return [int(np.count_nonzero(near & (Y >= y_min) & (Y <= y_max))) for y_min, y_max in zones]
+
+
+# -------------------------------------------------------------------------------------------------
+# Numba实现
+
+if numba is not None:
+
+    @numba.njit(cache=True)
+    def _nearest_index_jit(x, y, X, Y, start, stop):
+        best_index = start
+        best_distance = np.inf
+        for i in range(start, stop):
+            distance = math.sqrt((x - X[i])**2 + (y - Y[i])**2)
+            if distance < best_distance:
+                best_distance = distance
+                best_index = i
+        return best_index
+
+
+    @numba.njit(cache=True)
+    def _nearest_index_wrapped_jit(x, y, X, Y, hint, window):
+        length = len(X)
+        best_index = hint % length
+        best_distance = np.inf
+        for offset in range(-window, window + 1):
+            i = (hint + offset) % length
+            distance = math.sqrt((x - X[i])**2 + (y - Y[i])**2)
+            if distance < best_distance:
+                best_distance = distance
+                best_index = i
+        return best_index
+
+
+    @numba.njit(cache=True)
+    def _walk_forward_jit(X, Y, index, distance, closed):
+        length = len(X)
+        L = 0.0
+        if closed:
+            steps = 0
+            while distance > L and steps < length:
+                next_index = (index + 1) % length
+                dx = X[next_index] - X[index]
+                dy = Y[next_index] - Y[index]
+                L += math.sqrt(dx**2 + dy**2)
+                index = next_index
+                steps += 1
+            return index
+
+        while distance > L and index + 1 < length:
+            dx = X[index + 1] - X[index]
+            dy = Y[index + 1] - Y[index]
+            L += math.sqrt(dx**2 + dy**2)
+            index += 1
+        return index
+
+
+    @numba.njit(cache=True)
+    def _change_system_jit(theta, a, b, X, Y):
+        cos_theta = math.cos(theta)
+        sin_theta = math.sin(theta)
+        X1 = np.empty(len(X))
+        Y1 = np.empty(len(X))
+        for i in range(len(X)):
+            ix = X[i] - a
+            iy = Y[i] - b
+            X1[i] = ix * cos_theta + iy * sin_theta
+            Y1[i] = iy * cos_theta - ix * sin_theta
+        return X1, Y1
+
+
+    @numba.njit(cache=True)
+    def _zone_counts_jit(X, Y, length, zones):
+        counts = np.zeros(len(zones), dtype=np.int64)
+        for i in range(len(X)):
+            if X[i] <= length:
+                for j in range(len(zones)):
+                    if zones[j, 0] <= Y[i] <= zones[j, 1]:
+                        counts[j] += 1
+        return counts
+
+
+# -------------------------------------------------------------------------------------------------
+# 按当前实现分派的计算核
+
+def nearest_index(x, y, X, Y, start=0, stop=None):
+    """
+    在 X[start:stop], Y[start:stop] 中搜索离 (x, y) 最近的点(距离相同时取下标小的)
+
+    参数:
+        x: 点x坐标
+        y: 点y坐标
+        X: 路径点x坐标序列
+        Y: 路径点y坐标序列
+        start: 搜索起点下标
+        stop: 搜索终点下标(不含)，默认为序列长度
+    返回:
+        最近点在整个序列中的下标
+    """
+    if stop is None:
+        stop = len(X)
+    if _backend == 'numpy':
+        return _nearest_index_numpy(x, y, X, Y, start, stop)
+    if _backend == 'numba':
+        if not isinstance(X, np.ndarray):
+            return start + int(_nearest_index_jit(float(x), float(y), _as_array(X[start:stop]), _as_array(Y[start:stop]),
+                                                  0, stop - start))
+        return int(_nearest_index_jit(float(x), float(y), _as_array(X), _as_array(Y), start, stop))
+    return _nearest_index_python(x, y, X, Y, start, stop)
+
+
+def nearest_index_wrapped(x, y, X, Y, hint, window):
+    """
+    闭环路径上在 hint 前后 window 个点(首尾接续)中搜索离 (x, y) 最近的点
+
+    参数:
+        x: 点x坐标
+        y: 点y坐标
+        X: 路径点x坐标序列
+        Y: 路径点y坐标序列
+        hint: 搜索中心下标
+        window: 搜索窗口的半宽
+    返回:
+        最近点的下标
+    """
+    if _backend == 'numpy':
+        return _nearest_index_wrapped_numpy(x, y, X, Y, hint, window)
+    if _backend == 'numba':
+        if not isinstance(X, np.ndarray):
+            # 列表等序列只取出窗口内的点再编译计算
+            indexes = np.arange(hint - window, hint + window + 1) % len(X)
+            return int(indexes[_nearest_index_jit(float(x), float(y), _take(X, indexes), _take(Y, indexes),
+                                                  0, len(indexes))])
+        return int(_nearest_index_wrapped_jit(float(x), float(y), _as_array(X), _as_array(Y), hint, window))
+    return _nearest_index_wrapped_python(x, y, X, Y, hint, window)
+
+
+def walk_forward(X, Y, index, distance, closed=False):
+    """
+    从 index 沿路径向前累计点间距离，求出累计距离第一次不小于 distance 的点
+    开环路径最多走到最后一个点，闭环路径最多走一圈
+
+    参数:
+        X: 路径点x坐标序列
+        Y: 路径点y坐标序列
+        index: 起点下标
+        distance: 向前的距离
+        closed: 是否为闭环路径
+    返回:
+        点的下标
+    """
+    if _backend == 'numpy':
+        return _walk_forward_numpy(X, Y, index, distance, closed)
+    if _backend == 'numba':
+        if not isinstance(X, np.ndarray):
+            # 列表等序列转换整条路径的代价比行走本身大，按块取点计算
+            return _walk_forward_numpy(X, Y, index, distance, closed)
+        return int(_walk_forward_jit(_as_array(X), _as_array(Y), index, float(distance), closed))
+    return _walk_forward_python(X, Y, index, distance, closed)
+
+
+def change_system(theta, a, b, X, Y):
+    """
+    把点集转换到平移 (a, b)、旋转 theta 后的坐标系中
+
+    参数:
+        theta: 坐标系旋转的角度
+        a: 坐标系x方向的平移量
+        b: 坐标系y方向的平移量
+        X: 点集x坐标序列
+        Y: 点集y坐标序列
+    返回:
+        X1, Y1: 新坐标系中的坐标列表
+    """
+    if _backend == 'numpy':
+        return _change_system_numpy(theta, a, b, X, Y)
+    if _backend == 'numba':
+        X1, Y1 = _change_system_jit(float(theta), float(a), float(b), _as_array(X), _as_array(Y))
+        return X1.tolist(), Y1.tolist()
+    return _change_system_python(theta, a, b, X, Y)
+
+
+def zone_counts(X, Y, length, zones):
+    """
+    统计落在各个警戒区(x <= length 且 y_min <= y <= y_max)中的点数
+
+    参数:
+        X: 点x坐标序列
+        Y: 点y坐标序列
+        length: 警戒区长度
+        zones: 警戒区 (y_min, y_max) 序列
+    返回:
+        各警戒区点数的列表
+    """
+    if _backend == 'numpy':
+        return _zone_counts_numpy(X, Y, length, zones)
+    if _backend == 'numba':
+        counts = _zone_counts_jit(_as_array(X), _as_array(Y), float(length), np.asarray(zones, dtype=np.float64))
+        return counts.tolist()
+    return _zone_counts_python(X, Y, length, zones)
+
+
+if __name__ == '__main__':
+    """
+    比较各实现的速度并检查结果是否一致
+    """
+    import timeit
+
+    count = 20000
+    theta = np.linspace(0, 2 * np.pi, count, endpoint=False)
+    route_X = 500 * np.cos(theta)
+    route_Y = 300 * np.sin(theta)
+    list_X = route_X.tolist()
+    list_Y = route_Y.tolist()
+    rng = np.random.RandomState(0)
+    cloud_X = rng.uniform(0, 30, 50000)
+    cloud_Y = rng.uniform(-10, 10, 50000)
+    zones = ((0.5, 2.5), (-1.0, 1.0), (-2.5, -0.5))
+
+    cases = (('nearest_index', lambda: nearest_index(100.0, 50.0, route_X, route_Y)),
+             ('nearest_index(list)', lambda: nearest_index(100.0, 50.0, list_X, list_Y)),
+             ('nearest_index_wrapped', lambda: nearest_index_wrapped(499.0, 1.0, route_X, route_Y, 5, 50)),
+             ('nearest_index_wrapped(list)', lambda: nearest_index_wrapped(499.0, 1.0, list_X, list_Y, 5, 50)),
+             ('walk_forward', lambda: walk_forward(route_X, route_Y, count - 10, 15.0, True)),
+             ('walk_forward(list)', lambda: walk_forward(list_X, list_Y, count - 10, 15.0, True)),
+             ('change_system', lambda: change_system(0.3, 1.0, 2.0, list_X, list_Y)),
+             ('zone_counts', lambda: zone_counts(cloud_X, cloud_Y, 7.0, zones)))
+
+    for name, func in cases:
+        results = {}
+        for backend in available_backends():
+            set_backend(backend)
+            func()
+            number = 20
+            seconds = timeit.timeit(func, number=number) / number
+            results[backend] = func()
+            print('{:<30}{:<8}{:>12.1f} us'.format(name, backend, seconds * 1e6))
+        reference = results['python']
+        print('{:<30}results match: {}'.format('', all(result == reference for result in results.values())))
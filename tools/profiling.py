@@ -0,0 +1,517 @@
+# -*- coding:utf-8 -*-
+"""
+控制周期的内存分配分析
+用 tracemalloc 快照比较每次执行前后的内存块，按代码行统计新增(留存)的内存
+执行中用 sys.setprofile 跟踪内存的峰值，在峰值时刻做快照，按代码行统计执行中分配、执行结束前又释放的临时内存
+分配位置取调用栈中最近的非标准库代码行，分析器自身的分配不计入:
+快照和 tracemalloc 的分配，以及解释器为 profile 回调建立的帧对象和行号表(记在函数的 def 行上)
+峰值内存由 tracemalloc 统计，包括这些帧对象
+用 gc 回调记录执行中的垃圾回收次数和停顿时间
+可以给每个阶段设定分配预算，在测试中检查不应分配内存的热点路径是否仍然不分配
+分析模式本身开销很大(每次执行都要做多次快照，每次函数调用都要检查内存)，只用于排查和测试，不要在实车控制中打开
+@author: QinYu TianHao
+
+使用方法:
+    profiler = AllocationProfiler()
+    profiler.attach(scheduler)
+    with profiler:
+        scheduler.run(ticks=100)
+    print(profiler.report())
+
+    with profiler.measure('steering'):
+        steering_func()
+    profiler.assert_budget('steering', max_retained=0)
+"""
+import gc
+import os
+import sys
+import sysconfig
+import time
+import tracemalloc
+
+
+class StageAllocation(object):
+    """
+    一个阶段的分配统计
+
+    name: 阶段名称\n
+    calls: 执行次数\n
+    retained_bytes: 执行后留存的新分配内存字节数(累计，只计增加的分配位置)\n
+    retained_blocks: 执行后留存的新分配内存块数(累计)\n
+    freed_bytes: 执行中释放的执行前已有内存字节数(累计，不抵消 retained_bytes)\n
+    freed_blocks: 执行中释放的执行前已有内存块数(累计)\n
+    peak_bytes: 单次执行中高于执行前的最大峰值内存字节数\n
+    peak_sites_bytes: 峰值时刻存活的新分配内存字节数(累计，包括执行结束前又释放的临时内存)\n
+    peak_sites_blocks: 峰值时刻存活的新分配内存块数(累计)\n
+    gc_collections: 执行中各代垃圾回收次数\n
+    gc_pause: 执行中垃圾回收的总停顿时间(秒)\n
+    sites: 以 (文件名, 行号) 为键的 [留存字节数, 留存块数]\n
+    peak_sites: 以 (文件名, 行号) 为键的 [峰值时刻存活的新分配字节数, 块数]\n
+    freed_sites: 以 (文件名, 行号) 为键的 [释放字节数, 释放块数]
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.retained_bytes = 0
+        self.retained_blocks = 0
+        self.freed_bytes = 0
+        self.freed_blocks = 0
+        self.peak_bytes = 0
+        self.peak_sites_bytes = 0
+        self.peak_sites_blocks = 0
+        self.gc_collections = [0, 0, 0]
+        self.gc_pause = 0.0
+        self.sites = {}
+        self.peak_sites = {}
+        self.freed_sites = {}
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> name:{} calls:{} retained_bytes:{} peak_bytes:{}'.format(
+            self_class.__name__, self.name, self.calls, self.retained_bytes, self.peak_bytes)
+
+
+    def top_sites(self, limit=10, kind='retained'):
+        """
+        按字节数从大到小返回分配位置
+
+        参数:
+            limit: 最多返回的位置数
+            kind: 'retained' 返回留存内存的位置，'peak' 返回峰值时刻存活的新分配位置，'freed' 返回释放内存的位置
+        返回:
+            [(文件名, 行号, 字节数, 块数), ...]
+        """
+        if kind not in ('retained', 'peak', 'freed'):
+            raise ValueError('<class:StageAllocation> unknown site kind {}'.format(kind))
+        sites = {'retained': self.sites, 'peak': self.peak_sites, 'freed': self.freed_sites}[kind]
+        sites = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)
+        return [(filename, lineno, size, count) for (filename, lineno), (size, count) in sites[:limit]]
+
+
+    def stats(self):
+        """
+        返回分配统计
+        """
+        calls = self.calls if self.calls else 1
+        return {'calls': self.calls,
+                'retained_bytes': self.retained_bytes,
+                'retained_blocks': self.retained_blocks,
+                'retained_per_call': float(self.retained_bytes) / calls,
+                'freed_bytes': self.freed_bytes,
+                'freed_blocks': self.freed_blocks,
+                'peak_bytes': self.peak_bytes,
+                'peak_sites_bytes': self.peak_sites_bytes,
+                'peak_sites_blocks': self.peak_sites_blocks,
+                'gc_collections': list(self.gc_collections),
+                'gc_pause': self.gc_pause}
+
+
+class AllocationProfiler(object):
+    """
+    内存分配分析器
+    可以用 measure 包住任意一段代码，也可以 attach 到控制调度器上分析每个阶段
+    只记录在分析的代码中发生的垃圾回收(快照本身也会触发回收)
+
+    stages: 以阶段名称为键的分配统计(StageAllocation)
+    """
+
+    def __init__(self, frames=16, clock=time.perf_counter):
+        """
+        初始化分析器
+
+        参数:
+            frames: tracemalloc 为每个内存块记录的调用栈帧数，要足够跳过标准库的调用找到调用它的代码行
+            clock: 计算垃圾回收停顿时间的时钟函数
+        """
+        self._frames = frames
+        self._clock = clock
+        # 标准库目录(不包括第三方包目录)，分配位置跳过这些目录中的代码行
+        paths = sysconfig.get_paths()
+        self._stdlib = tuple(set(os.path.join(paths[key], '') for key in ('stdlib', 'platstdlib')))
+        self._packages = tuple(set(os.path.join(paths[key], '') for key in ('purelib', 'platlib')))
+        # 冻结在解释器中的标准库模块没有文件，文件名为 <frozen 模块名>
+        self._stdlib += ('<frozen ',)
+        self._site_cache = {}
+        # profile 回调见过的函数入口 (文件名, def 行号)，这些行上的分配是解释器为回调建立的帧对象
+        self._entries = set()
+
+        self.stages = {}
+        self._current = None
+        self._gc_start = None
+        # 执行中的峰值跟踪: 峰值快照、快照自身占用的内存、已知的最大内存和峰值
+        self._peak_snapshot = None
+        self._held = 0
+        self._peak_level = 0
+        self._peak = 0
+        self._started_tracing = False
+        self._running = False
+        # attach 时替换掉的阶段执行函数
+        self._attached = []
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+    def _stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = StageAllocation(name)
+            self.stages[name] = stage
+        return stage
+
+
+    def _gc_callback(self, phase, info):
+        """
+        gc 回调，记录回收的代和停顿时间
+        """
+        if phase == 'start':
+            self._gc_start = self._clock()
+            return
+        if self._gc_start is None or self._current is None:
+            self._gc_start = None
+            return
+        stage = self._stage(self._current)
+        stage.gc_collections[info['generation']] += 1
+        stage.gc_pause += self._clock() - self._gc_start
+        self._gc_start = None
+
+
+    def start(self):
+        """
+        开始分析，tracemalloc 没有开启时开启它
+        """
+        if self._running:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+            self._started_tracing = True
+        gc.callbacks.append(self._gc_callback)
+        self._running = True
+
+
+    def stop(self):
+        """
+        停止分析，关闭由分析器开启的 tracemalloc，统计结果保留
+        """
+        if not self._running:
+            return
+        if self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._running = False
+
+
+    def reset(self):
+        """
+        清空统计
+        """
+        self.stages = {}
+        self._site_cache = {}
+
+
+    def call(self, name, func, *args, **kwargs):
+        """
+        执行一次函数并把它的分配记在阶段 name 中
+
+        参数:
+            name: 阶段名称
+            func: 函数
+            args, kwargs: 函数参数
+        返回:
+            函数的返回值
+        """
+        with self.measure(name):
+            return func(*args, **kwargs)
+
+
+    def measure(self, name):
+        """
+        返回分析一段代码的上下文管理器
+
+        参数:
+            name: 阶段名称
+        """
+        return _Measure(self, name)
+
+
+    def _site(self, traceback):
+        """
+        返回内存块的分配位置: 调用栈中最近的非标准库代码行
+        最近的非标准库代码行在分析器中时是分析器自身的分配(快照、tracemalloc)，返回 None
+        调用栈全部是标准库时无法确定是谁分配的(通常是标准库自身的缓存)，也返回 None
+        """
+        site = self._site_cache.get(traceback)
+        if site is not None or traceback in self._site_cache:
+            return site
+        # 调用栈按从旧到新排列
+        site = None
+        for frame in reversed(traceback):
+            filename = frame.filename
+            if filename.startswith(self._stdlib) and not filename.startswith(self._packages):
+                continue
+            key = (filename, frame.lineno)
+            if filename != __file__ and key not in self._entries:
+                site = key
+            break
+        self._site_cache[traceback] = site
+        return site
+
+
+    def _differences(self, after, before):
+        """
+        按分配位置汇总前后快照的差异
+
+        返回:
+            以 (文件名, 行号) 为键的 [字节数差, 块数差]
+        """
+        sites = {}
+        for difference in after.compare_to(before, 'traceback'):
+            key = self._site(difference.traceback)
+            if key is None:
+                continue
+            site = sites.get(key)
+            if site is None:
+                site = [0, 0]
+                sites[key] = site
+            site[0] += difference.size_diff
+            site[1] += difference.count_diff
+        return sites
+
+
+    def _profile(self, frame, event, arg):
+        """
+        sys.setprofile 回调，在每次函数调用和返回时检查内存，超过已知峰值时重新做峰值快照
+        快照本身也占用被跟踪的内存，比较时减去上一次快照占用的部分
+        """
+        if event == 'call':
+            code = frame.f_code
+            self._entries.add((code.co_filename, code.co_firstlineno))
+        current, peak = tracemalloc.get_traced_memory()
+        if current - self._held <= self._peak_level:
+            return
+        previous, self._current = self._current, None
+        self._peak = max(self._peak, peak - self._held)
+        self._peak_snapshot = None
+        base, _ = tracemalloc.get_traced_memory()
+        self._peak_level = base
+        self._peak_snapshot = tracemalloc.take_snapshot()
+        self._held = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.reset_peak()
+        self._current = previous
+
+
+    def _record(self, stage, before, after, peak, peak_snapshot):
+        """
+        按分配位置比较前后快照，增加的记为留存，减少的记为释放
+        释放的是执行前已有的内存(比如上一个阶段留下的对象)，不能用来抵消本阶段的分配
+        比较峰值快照和执行前快照，增加的记为峰值时刻存活的新分配，包括执行结束前又释放的临时内存
+        """
+        stage.calls += 1
+        if peak > stage.peak_bytes:
+            stage.peak_bytes = peak
+        for key, (size, count) in self._differences(after, before).items():
+            if size > 0 or count > 0:
+                sites = stage.sites
+                size, count = max(size, 0), max(count, 0)
+                stage.retained_bytes += size
+                stage.retained_blocks += count
+            elif size < 0 or count < 0:
+                sites = stage.freed_sites
+                size, count = -size, -count
+                stage.freed_bytes += size
+                stage.freed_blocks += count
+            else:
+                continue
+            site = sites.setdefault(key, [0, 0])
+            site[0] += size
+            site[1] += count
+        if peak_snapshot is None:
+            return
+        for key, (size, count) in self._differences(peak_snapshot, before).items():
+            if size <= 0 and count <= 0:
+                continue
+            size, count = max(size, 0), max(count, 0)
+            stage.peak_sites_bytes += size
+            stage.peak_sites_blocks += count
+            site = stage.peak_sites.setdefault(key, [0, 0])
+            site[0] += size
+            site[1] += count
+
+
+    def attach(self, scheduler):
+        """
+        替换调度器每个阶段的执行函数，分析每次执行
+
+        参数:
+            scheduler: 控制调度器(ControlScheduler)
+        """
+        for stage in scheduler:
+            func = stage.func
+            self._attached.append((stage, func))
+            stage.func = self._wrap(stage.name, func)
+
+
+    def detach(self):
+        """
+        恢复 attach 替换掉的执行函数
+        """
+        for stage, func in self._attached:
+            stage.func = func
+        self._attached = []
+
+
+    def _wrap(self, name, func):
+        def wrapper():
+            if not self._running:
+                return func()
+            return self.call(name, func)
+        return wrapper
+
+
+    def assert_budget(self, name, max_retained=None, max_retained_per_call=None, max_peak=None, max_collections=None):
+        """
+        检查阶段的分配是否在预算内，超出时抛出 AssertionError 并列出留存最多的分配位置
+
+        参数:
+            name: 阶段名称
+            max_retained: 累计留存字节数上限(释放的执行前已有内存不抵消留存)
+            max_retained_per_call: 平均每次执行留存字节数上限
+            max_peak: 单次执行峰值内存字节数上限
+            max_collections: 执行中垃圾回收次数上限(各代合计)
+        """
+        stage = self.stages.get(name)
+        if stage is None:
+            raise AssertionError('<class:AllocationProfiler> stage {} was never measured'.format(name))
+
+        stats = stage.stats()
+        failures = []
+        for key, value, limit in (('retained_bytes', stats['retained_bytes'], max_retained),
+                                  ('retained_per_call', stats['retained_per_call'], max_retained_per_call),
+                                  ('peak_bytes', stats['peak_bytes'], max_peak),
+                                  ('gc_collections', sum(stats['gc_collections']), max_collections)):
+            if limit is not None and value > limit:
+                failures.append('{} {} > {}'.format(key, value, limit))
+        if failures:
+            kind = 'retained' if stats['retained_bytes'] else 'peak'
+            sites = ''.join('\n    {} {}:{} {} B {} blocks'.format(kind, *site) for site in stage.top_sites(5, kind))
+            raise AssertionError('<class:AllocationProfiler> stage {} over allocation budget: {}{}'.format(
+                name, ', '.join(failures), sites))
+
+
+    def stats(self):
+        """
+        返回所有阶段的分配统计
+
+        返回:
+            以阶段名称为键的分配统计字典
+        """
+        return dict((name, stage.stats()) for name, stage in self.stages.items())
+
+
+    def report(self, limit=5):
+        """
+        生成文字报告
+
+        参数:
+            limit: 每个阶段列出的分配位置数
+        返回:
+            报告字符串
+        """
+        lines = []
+        for name, stage in sorted(self.stages.items(), key=lambda item: str(item[0])):
+            stats = stage.stats()
+            lines.append('{}: calls {} retained {} B ({:.1f} B/call, {} blocks) freed {} B ({} blocks) '
+                         'peak {} B (sites {} B, {} blocks) gc {} pause {:.6f} s'.format(
+                name, stats['calls'], stats['retained_bytes'], stats['retained_per_call'], stats['retained_blocks'],
+                stats['freed_bytes'], stats['freed_blocks'], stats['peak_bytes'], stats['peak_sites_bytes'],
+                stats['peak_sites_blocks'], stats['gc_collections'], stats['gc_pause']))
+            for kind in ('peak', 'retained', 'freed'):
+                for filename, lineno, size, count in stage.top_sites(limit, kind):
+                    lines.append('    {} {}:{} {} B {} blocks'.format(kind, filename, lineno, size, count))
+        return '\n'.join(lines)
+
+
+class _Measure(object):
+    """
+    AllocationProfiler.measure 返回的上下文管理器
+    分析器没有开始时在进入时开始、退出时停止，不让 tracemalloc 在进程中一直开着
+    """
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+
+    def __enter__(self):
+        profiler = self._profiler
+        self._started = not profiler._running
+        if self._started:
+            profiler.start()
+        self._stage = profiler._stage(self._name)
+        self._before = tracemalloc.take_snapshot()
+        self._outer = (profiler._peak_snapshot, profiler._held, profiler._peak_level, profiler._peak)
+        self._current, _ = tracemalloc.get_traced_memory()
+        profiler._peak_snapshot = None
+        profiler._held = 0
+        profiler._peak_level = self._current
+        profiler._peak = self._current
+        tracemalloc.reset_peak()
+        self._previous = profiler._current
+        profiler._current = self._name
+        self._profile = sys.getprofile()
+        sys.setprofile(profiler._profile)
+        return self._stage
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        profiler = self._profiler
+        sys.setprofile(self._profile)
+        profiler._current = self._previous
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(profiler._peak, peak - profiler._held)
+        profiler._record(self._stage, self._before, tracemalloc.take_snapshot(), peak - self._current,
+                         profiler._peak_snapshot)
+        # 嵌套分析时外层的峰值包括内层的峰值
+        profiler._peak_snapshot, profiler._held, profiler._peak_level, outer_peak = self._outer
+        profiler._peak = max(outer_peak, peak)
+        tracemalloc.reset_peak()
+        if self._started:
+            profiler.stop()
+        return False
+
+
+if __name__ == '__main__':
+    """
+    保存结果的坐标转换(每次都留存新的列表)和不留存内存的历史缓冲追加(峰值位置中可以看到每次追加临时建立的数组视图)
+    """
+    from ..data_object import GnssData, GnssHistory
+    from .unit import change_system
+
+    X = [float(i) for i in range(100)]
+    Y = [0.0] * 100
+    results = []
+    gnss_history = GnssHistory(capacity=64)
+    gnss_data = GnssData(0.0, 0.0, 0.0, True, 0.0)
+
+    profiler = AllocationProfiler()
+    with profiler:
+        for i in range(50):
+            results.append(profiler.call('change_system', change_system, 0.1, 1.0, 2.0, X, Y))
+            profiler.call('history', gnss_history.append, gnss_data, 0.1 * (i + 1))
+    print(profiler.report())
+    profiler.assert_budget('history', max_retained=0)
+    try:
+        profiler.assert_budget('change_system', max_retained_per_call=100)
+    except AssertionError as error:
+        print(error)
@@ -0,0 +1,293 @@
+# -*- coding:utf-8 -*-
+"""
+固定频率控制调度器
+在单调时钟上按固定频率运行注册的控制阶段(GNSS追踪、车道保持、目标反馈、弯道检测等)
+并记录每个阶段的截止时间超时次数和抖动
+@author: QinYu TianHao
+
+使用方法:
+    scheduler = ControlScheduler()
+    scheduler.add_stage('steering', steering_func, rate=100)
+    scheduler.add_stage('curve', curve_func, rate=10)
+    scheduler.run(duration=60)
+"""
+import time
+
+
+class Stage(object):
+    """
+    调度阶段类
+    保存一个控制阶段的执行函数、周期和运行统计
+
+    name: 阶段名称\n
+    func: 阶段执行函数(不能有阻塞的I/O操作)\n
+    period: 执行周期(秒)\n
+    deadline: 截止时间(秒)，从释放时刻开始计算\n
+    result: 最近一次执行的返回值
+    """
+
+    def __init__(self, name, func, period, deadline=None, phase=0.0):
+        """
+        初始化调度阶段
+
+        参数:
+            name: 阶段名称
+            func: 阶段执行函数
+            period: 执行周期(秒)
+            deadline: 截止时间(秒)，默认等于执行周期
+            phase: 相对调度器起始时刻的相位偏移(秒)，用来错开不同阶段
+        """
+        if period <= 0:
+            raise ValueError('<class:Stage> period must be greater than zero')
+
+        self.name = name
+        self.func = func
+        self.period = period
+        self.deadline = period if deadline is None else deadline
+        self.phase = phase
+        self.result = None
+
+        self._next_release = None
+        self.reset_stats()
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> name:{} period:{} runs:{} misses:{} skipped:{}'.format(
+            self_class.__name__, self.name, self.period, self.runs, self.misses, self.skipped)
+
+
+    def reset_stats(self):
+        """
+        清空运行统计
+        """
+        self.runs = 0
+        self.misses = 0
+        self.skipped = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.exec_sum = 0.0
+        self.exec_max = 0.0
+
+
+    def stats(self):
+        """
+        返回运行统计
+
+        返回:
+            运行统计字典(执行次数、超时次数、跳过的周期数、平均/最大抖动、平均/最大执行时间)
+        """
+        runs = self.runs if self.runs else 1
+        return {'runs': self.runs,
+                'misses': self.misses,
+                'skipped': self.skipped,
+                'jitter_mean': self.jitter_sum / runs,
+                'jitter_max': self.jitter_max,
+                'exec_mean': self.exec_sum / runs,
+                'exec_max': self.exec_max}
+
+
+class ControlScheduler(object):
+    """
+    固定频率控制调度器
+    每个阶段的释放时刻固定为 起始时刻 + 相位 + k * 周期，不会因为执行时间而累积漂移
+    如果某阶段执行超时错过了后面的释放时刻，被错过的周期直接跳过并计数，不会补跑
+
+    clock: 单调时钟函数(默认 time.monotonic)\n
+    sleep: 空闲等待函数(默认 time.sleep)，只在所有阶段都未到释放时刻时调用
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        """
+        初始化调度器
+
+        参数:
+            clock: 单调时钟函数
+            sleep: 空闲等待函数
+        """
+        self._clock = clock
+        self._sleep = sleep
+        self._stages = []
+        self._start_time = None
+        self._running = False
+
+
+    def __len__(self):
+        return len(self._stages)
+
+
+    def __iter__(self):
+        return (stage for stage in self._stages)
+
+
+    def __getitem__(self, name):
+        for stage in self._stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+
+    def add_stage(self, name, func, rate, deadline=None, phase=0.0):
+        """
+        注册一个控制阶段
+        阶段按频率从高到低排序，同一时刻同时到期时高频阶段(一般是方向盘控制)先执行
+
+        参数:
+            name: 阶段名称
+            func: 阶段执行函数，无参数，返回值保存在 stage.result 中
+            rate: 执行频率(Hz)
+            deadline: 截止时间(秒)，默认等于执行周期
+            phase: 相位偏移(秒)
+        返回:
+            stage: 注册的阶段对象
+        """
+        if rate <= 0:
+            raise ValueError('<class:ControlScheduler> rate must be greater than zero')
+        for stage in self._stages:
+            if stage.name == name:
+                raise ValueError('<class:ControlScheduler> stage {} already exists'.format(name))
+
+        stage = Stage(name, func, 1.0 / rate, deadline, phase)
+        if self._start_time is not None:
+            # 调度开始后加入的阶段从当前时刻开始计时，不按已经过去的起始时刻补算抖动和跳过的周期
+            stage._next_release = self._clock() + phase
+        self._stages.append(stage)
+        self._stages.sort(key=lambda istage: istage.period)
+
+        return stage
+
+
+    def start(self, now=None):
+        """
+        设定调度起始时刻并初始化所有阶段的释放时刻
+
+        参数:
+            now: 起始时刻，默认取当前时钟
+        """
+        if now is None:
+            now = self._clock()
+        self._start_time = now
+        for stage in self._stages:
+            stage._next_release = now + stage.phase
+            stage.reset_stats()
+
+
+    def next_release(self):
+        """
+        返回最近一个释放时刻
+        """
+        if not self._stages:
+            return None
+        return min(stage._next_release for stage in self._stages)
+
+
+    def run_once(self, now=None):
+        """
+        执行一次调度，运行所有已到释放时刻的阶段
+
+        参数:
+            now: 当前时刻，默认取当前时钟
+        返回:
+            executed: 本次执行的阶段名称列表
+        """
+        if self._start_time is None:
+            self.start(now)
+        if now is None:
+            now = self._clock()
+
+        executed = []
+        for stage in self._stages:
+            release = stage._next_release
+            if now < release:
+                continue
+
+            start = self._clock()
+            stage.result = stage.func()
+            finish = self._clock()
+
+            # 抖动为实际开始时刻和释放时刻的差，执行时间超过截止时间则记为一次超时
+            jitter = start - release
+            exec_time = finish - start
+            stage.runs += 1
+            stage.jitter_sum += jitter
+            stage.exec_sum += exec_time
+            if jitter > stage.jitter_max:
+                stage.jitter_max = jitter
+            if exec_time > stage.exec_max:
+                stage.exec_max = exec_time
+            if finish - release > stage.deadline:
+                stage.misses += 1
+
+            # 下一个释放时刻按固定周期推进，已经错过的周期跳过不补跑
+            periods = int((finish - release) // stage.period) + 1
+            stage.skipped += periods - 1
+            stage._next_release = release + periods * stage.period
+
+            executed.append(stage.name)
+            now = finish
+
+        return executed
+
+
+    def run(self, duration=None, ticks=None):
+        """
+        循环调度直到达到运行时长或调度次数，或者调用了 stop
+
+        参数:
+            duration: 运行时长(秒)，None 表示不限
+            ticks: 有阶段执行的调度次数，None 表示不限
+        """
+        if not self._stages:
+            return
+        if self._start_time is None:
+            self.start()
+        end_time = None if duration is None else self._clock() + duration
+
+        self._running = True
+        count = 0
+        while self._running:
+            now = self._clock()
+            if end_time is not None and now >= end_time:
+                break
+
+            wait = self.next_release() - now
+            if wait > 0:
+                if end_time is not None:
+                    wait = min(wait, end_time - now)
+                self._sleep(wait)
+                continue
+
+            if self.run_once(now):
+                count += 1
+                if ticks is not None and count >= ticks:
+                    break
+        self._running = False
+
+
+    def stop(self):
+        """
+        停止循环调度(可在阶段函数中调用)
+        """
+        self._running = False
+
+
+    def stats(self):
+        """
+        返回所有阶段的运行统计
+
+        返回:
+            以阶段名称为键的运行统计字典
+        """
+        return dict((stage.name, stage.stats()) for stage in self._stages)
+
+
+if __name__ == '__main__':
+    """
+    函数功能测试
+    """
+    scheduler = ControlScheduler()
+    scheduler.add_stage('steering', lambda: None, rate=100)
+    scheduler.add_stage('curve', lambda: time.sleep(0.002), rate=10)
+    scheduler.run(duration=1)
+    for name, stage_stats in scheduler.stats().items():
+        print(name, stage_stats)
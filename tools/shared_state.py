@@ -0,0 +1,411 @@
+# -*- coding:utf-8 -*-
+"""
+共享内存中的路径和控制状态
+控制器把路径数组一次性发布到共享内存，每个控制周期把位姿、导航点、方向盘转角、警戒区和曲率写入一个顺序锁保护的状态块
+同一台机器上的可视化、记录和规划进程直接映射这两块内存，不需要各自读取地图文件，也不需要序列化
+顺序锁: 写入前后各把序号加一，序号为奇数表示正在写入；读取前后序号相同且为偶数时读到的是一致的快照，否则重读
+写入方不等待读取方，读取方再多再慢也不会阻塞控制周期
+@author: QinYu TianHao
+
+使用方法:
+    # 控制进程
+    shared_route = SharedRoute.publish(route, 'strelitzia_route')
+    control_state = SharedControlState.create('strelitzia_state')
+    control_state.update(x=x, y=y, yaw=yaw, navi_index=navi_index, wheel_degree=wheel_degree)
+
+    # 其他进程
+    shared_route = SharedRoute.attach('strelitzia_route')
+    navi_X, navi_Y = shared_route.get(0)
+    control_state = SharedControlState.attach('strelitzia_state')
+    state = control_state.snapshot()
+"""
+import collections
+import numpy as np
+from multiprocessing import shared_memory
+
+
+# 路径块的标识
+_ROUTE_MAGIC = 0x53524f55
+# 路径块头部的整数个数(标识、车道数、是否闭环、当前车道)，其后是每条车道的点数
+_ROUTE_HEADER = 4
+
+# 控制状态块的字段，全部按 float64 存放，序号在字段之前
+STATE_FIELDS = ('tick', 'stamp', 'x', 'y', 'yaw', 'gnss_usable', 'near_index', 'navi_index', 'driveway',
+                'delta', 'wheel_degree', 'left_barrier', 'mid_barrier', 'right_barrier', 'curvature')
+
+ControlState = collections.namedtuple('ControlState', ('seq',) + STATE_FIELDS)
+
+# 本进程建立的共享内存名称
+_created_names = set()
+
+
+def _create_memory(name, size):
+    memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+    _created_names.add(memory.name)
+    return memory
+
+
+def _attach_memory(name):
+    """
+    映射已经存在的共享内存
+    只映射的进程不登记到资源跟踪器，否则进程退出时资源跟踪器会删除发布方的共享内存
+    Python 3.13 以前没有 track 参数，映射后取消登记(本进程建立的共享内存除外)
+    由发布进程启动的子进程和发布进程共用资源跟踪器，退出时跟踪器可能打印一条无害的 KeyError
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=name)
+        if memory.name not in _created_names:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
+
+
+class SharedRoute(object):
+    """
+    共享内存中的路径
+    每条车道依次存放 X、Y 和里程三个 float64 数组，读取时返回共享内存上的数组视图(只读)
+    发布后路径不再改变，路径改变时重新发布一块新的共享内存
+
+    name: 共享内存名称\n
+    closed: 是否为闭环路径\n
+    driveway: 发布时的当前车道号
+    """
+
+    def __init__(self, memory, owner=False):
+        """
+        由共享内存建立路径视图，一般通过 publish 或 attach 得到对象
+
+        参数:
+            memory: SharedMemory 对象
+            owner: 是否为发布方(发布方负责删除共享内存)
+        """
+        self._memory = memory
+        self._owner = owner
+        self.name = memory.name
+
+        header = np.ndarray((_ROUTE_HEADER,), dtype=np.int64, buffer=memory.buf)
+        if int(header[0]) != _ROUTE_MAGIC:
+            raise ValueError('<class:SharedRoute> {} is not a shared route'.format(memory.name))
+        lane_count = int(header[1])
+        self.closed = bool(header[2])
+        self.driveway = int(header[3])
+        self._counts = np.ndarray((lane_count,), dtype=np.int64, buffer=memory.buf,
+                                  offset=_ROUTE_HEADER * 8).tolist()
+
+        # 每条车道的 (X, Y, 里程) 视图
+        self._lanes = []
+        offset = (_ROUTE_HEADER + lane_count) * 8
+        for count in self._counts:
+            arrays = []
+            for _ in range(3):
+                array = np.ndarray((count,), dtype=np.float64, buffer=memory.buf, offset=offset)
+                if not owner:
+                    array.flags.writeable = False
+                arrays.append(array)
+                offset += count * 8
+            self._lanes.append(tuple(arrays))
+
+
+    @classmethod
+    def publish(cls, route, name=None):
+        """
+        把路径发布到新的共享内存
+
+        参数:
+            route: 路径对象(Route)
+            name: 共享内存名称，None 时自动生成(通过 name 属性获取)
+        返回:
+            发布方的共享路径对象
+        """
+        lanes = [projected_coordinate.as_array() + (projected_coordinate.stations(),)
+                 for projected_coordinate in route.projected_coordinate_tuple]
+        size = (_ROUTE_HEADER + len(lanes)) * 8 + sum(3 * len(X) * 8 for X, _, _ in lanes)
+        memory = _create_memory(name, max(size, 1))
+
+        header = np.ndarray((_ROUTE_HEADER + len(lanes),), dtype=np.int64, buffer=memory.buf)
+        header[1] = len(lanes)
+        header[2] = 1 if route.closed else 0
+        header[3] = route.driveway
+        header[_ROUTE_HEADER:] = [len(X) for X, _, _ in lanes]
+        offset = len(header) * 8
+        for arrays in lanes:
+            for array in arrays:
+                np.ndarray((len(array),), dtype=np.float64, buffer=memory.buf, offset=offset)[:] = array
+                offset += len(array) * 8
+        # 最后写入标识，读取方看到标识时数据已经完整
+        header[0] = _ROUTE_MAGIC
+        del header
+
+        return cls(memory, owner=True)
+
+
+    @classmethod
+    def attach(cls, name):
+        """
+        映射其他进程发布的路径
+
+        参数:
+            name: 共享内存名称
+        返回:
+            读取方的共享路径对象
+        """
+        return cls(_attach_memory(name))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> name:{} lanes:{} closed:{}'.format(self_class.__name__, self.name, self._counts, self.closed)
+
+
+    @property
+    def num_of_driveway(self):
+        """
+        返回车道数量
+        """
+        return len(self._lanes)
+
+
+    def get(self, driveway=None):
+        """
+        获取车道的坐标数组视图
+
+        参数:
+            driveway: 车道号，默认为发布时的当前车道
+        返回:
+            X, Y: 坐标数组(共享内存上的只读视图)
+        """
+        if driveway is None:
+            driveway = self.driveway
+        X, Y, _ = self._lanes[driveway]
+        return X, Y
+
+
+    def get_all(self):
+        """
+        获取所有车道的坐标数组视图
+        """
+        return tuple((X, Y) for X, Y, _ in self._lanes)
+
+
+    def stations(self, driveway=None):
+        """
+        获取车道每个点的里程数组视图
+
+        参数:
+            driveway: 车道号，默认为发布时的当前车道
+        """
+        if driveway is None:
+            driveway = self.driveway
+        return self._lanes[driveway][2]
+
+
+    def to_route(self):
+        """
+        复制为普通的路径对象(Route)
+        """
+        # 导航地图包导入时会导入工具包，这里在使用时才导入
+        from ..navigation_map import ProjectedCoordinate, Route
+        projected_coordinate_tuple = tuple(ProjectedCoordinate(X.tolist(), Y.tolist()) for X, Y, _ in self._lanes)
+        return Route(projected_coordinate_tuple, self.driveway, self.closed)
+
+
+    def close(self):
+        """
+        解除映射，发布方同时删除共享内存
+        解除映射前必须不再使用 get 等返回的数组视图
+        """
+        if self._memory is None:
+            return
+        self._lanes = []
+        memory = self._memory
+        self._memory = None
+        memory.close()
+        if self._owner:
+            memory.unlink()
+            _created_names.discard(memory.name)
+
+
+class SharedControlState(object):
+    """
+    共享内存中的控制状态块(顺序锁)
+    只能有一个写入方；写入方不等待，读取方在写入过程中读到不一致的数据时重读
+    序号和字段都是按顺序执行的普通写入，依赖处理器保持写入顺序(x86)，弱内存序的处理器上读取方可能极少数情况下读到不一致的快照
+
+    name: 共享内存名称\n
+    retries: 读取方累计的重读次数\n
+    failures: 读取方重读次数用完仍然没有读到一致快照的次数
+    """
+
+    def __init__(self, memory, owner=False):
+        """
+        由共享内存建立状态块视图，一般通过 create 或 attach 得到对象
+
+        参数:
+            memory: SharedMemory 对象
+            owner: 是否为写入方(写入方负责删除共享内存)
+        """
+        self._memory = memory
+        self._owner = owner
+        self.name = memory.name
+        self._seq = np.ndarray((1,), dtype=np.int64, buffer=memory.buf)
+        self._fields = np.ndarray((len(STATE_FIELDS),), dtype=np.float64, buffer=memory.buf, offset=8)
+        self._index = dict((field, i) for i, field in enumerate(STATE_FIELDS))
+        # 读取方的快照缓冲，重复读取时不重新分配
+        self._buffer = np.zeros(len(STATE_FIELDS))
+
+        self.retries = 0
+        self.failures = 0
+
+
+    @classmethod
+    def create(cls, name=None):
+        """
+        建立新的控制状态块
+
+        参数:
+            name: 共享内存名称，None 时自动生成(通过 name 属性获取)
+        返回:
+            写入方的状态块对象
+        """
+        memory = _create_memory(name, 8 * (1 + len(STATE_FIELDS)))
+        memory.buf[:] = bytes(memory.size)
+        return cls(memory, owner=True)
+
+
+    @classmethod
+    def attach(cls, name):
+        """
+        映射其他进程建立的控制状态块
+
+        参数:
+            name: 共享内存名称
+        返回:
+            读取方的状态块对象
+        """
+        return cls(_attach_memory(name))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def __str__(self):
+        self_class = type(self)
+        return '<object:{}> name:{} seq:{}'.format(self_class.__name__, self.name, int(self._seq[0]))
+
+
+    @property
+    def seq(self):
+        """
+        当前序号(每次更新加二)
+        """
+        return int(self._seq[0])
+
+
+    def update(self, **values):
+        """
+        写入一个控制周期的状态(只有写入方调用)，没有给出的字段保持上次的值，tick 自动加一
+        布尔值写为 1.0/0.0，None 写为 NaN
+
+        参数:
+            values: 以 STATE_FIELDS 中字段名为键的值
+        """
+        # 先检查字段名并转换数值，序号变为奇数之后不能再出错，否则读取方永远读不到一致的快照
+        index = self._index
+        updates = []
+        for field, value in values.items():
+            if field not in index:
+                raise KeyError('<class:SharedControlState> unknown field {}'.format(field))
+            updates.append((index[field], np.nan if value is None else float(value)))
+
+        fields = self._fields
+        seq = self._seq
+        seq[0] += 1
+        for i, value in updates:
+            fields[i] = value
+        if 'tick' not in values:
+            fields[0] += 1
+        seq[0] += 1
+
+
+    def read_into(self, buffer, max_retries=1000):
+        """
+        把一致的快照读入预先分配的数组，不分配内存
+
+        参数:
+            buffer: 长度为 len(STATE_FIELDS) 的 float64 数组
+            max_retries: 最多重读次数
+        返回:
+            快照的序号，重读次数用完时返回 None
+        """
+        seq = self._seq
+        fields = self._fields
+        for _ in range(max_retries + 1):
+            before = int(seq[0])
+            if not before & 1:
+                buffer[:] = fields
+                if int(seq[0]) == before:
+                    return before
+            self.retries += 1
+        self.failures += 1
+        return None
+
+
+    def snapshot(self, max_retries=1000):
+        """
+        读取一致的快照
+
+        参数:
+            max_retries: 最多重读次数
+        返回:
+            ControlState 命名元组，重读次数用完时返回 None
+        """
+        seq = self.read_into(self._buffer, max_retries)
+        if seq is None:
+            return None
+        return ControlState(seq, *self._buffer.tolist())
+
+
+    def close(self):
+        """
+        解除映射，写入方同时删除共享内存
+        """
+        if self._memory is None:
+            return
+        self._seq = self._fields = None
+        memory = self._memory
+        self._memory = None
+        memory.close()
+        if self._owner:
+            memory.unlink()
+            _created_names.discard(memory.name)
+
+
+if __name__ == '__main__':
+    """
+    写入方和读取方在同一个进程中映射同一块共享内存
+    """
+    control_state = SharedControlState.create()
+    reader = SharedControlState.attach(control_state.name)
+    for i in range(3):
+        control_state.update(x=float(i), y=2.0 * i, yaw=0.1, navi_index=10 + i, wheel_degree=-5.0,
+                             mid_barrier=i == 2, stamp=0.1 * i)
+    print(reader.snapshot())
+    reader.close()
+    control_state.close()
@@ -7,6 +7,8 @@ import math
 import numpy
 import time
 
+from . import kernels
+
 
 def change_system(theta, a, b, x, y):
     """
@@ -37,17 +39,8 @@ def change_system(theta, a, b, x, y):
 
         return x1, y1
     else:
-        # 如果是序列 分别求出每个点在新坐标系下的新坐标
-        x1 = []
-        y1 = []
-        for ix, iy in zip(x, y):
-            ix = ix - a     # 先平移
-            iy = iy - b
-
-            x1.append(ix * math.cos(theta) + iy * math.sin(theta))  # 再旋转
-            y1.append(iy * math.cos(theta) - ix * math.sin(theta))
-        
-        return x1, y1
+        # 如果是序列 分别求出每个点在新坐标系下的新坐标(按当前选择的计算核实现)
+        return kernels.change_system(theta, a, b, x, y)
 
 
 def trans_wheel_degree_format(wheel_degree_input, model='target', wheel_degree_offset=-13):